@@ -0,0 +1,136 @@
+"""
+/waflow throughput and /webhook tail latency with the Flow crypto running
+inline on the event loop versus offloaded to a thread or process pool.
+
+Each mode runs in its own interpreter against the real app in-process:
+FLOW_CLIENTS loops hammer /waflow with encrypted ping requests while a probe
+sends a webhook text message every few milliseconds and records its latency.
+Graph API sends are replaced by a short sleep.
+
+    python -m benchmarks.flow_offload --duration 5 --flow-clients 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from base64 import b64encode
+
+MODES = ("inline", "thread", "process")
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def _encrypt_flow_request(public_key, payload: dict) -> bytes:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric.padding import MGF1, OAEP
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    aes_key = os.urandom(16)
+    iv = os.urandom(16)
+    encrypted_key = public_key.encrypt(aes_key, OAEP(mgf=MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None))
+    encrypted_data = AESGCM(aes_key).encrypt(iv, json.dumps(payload).encode(), None)
+    return json.dumps({
+        "encrypted_flow_data": b64encode(encrypted_data).decode(),
+        "encrypted_aes_key": b64encode(encrypted_key).decode(),
+        "initial_vector": b64encode(iv).decode(),
+    }).encode()
+
+async def run_mode(duration: float, flow_clients: int, probe_interval: float) -> dict:
+    import logging
+    import httpx
+
+    logging.getLogger("whatsapp_service").setLevel(logging.WARNING)
+    from webhooks import app
+    from controllers import webhook_controller
+
+    async def fake_post(endpoint, payload):
+        await asyncio.sleep(0.005)
+    webhook_controller.whatsapp_service._post = fake_post
+
+    public_key = webhook_controller.crypto_service.private_key.public_key()
+    flow_body = _encrypt_flow_request(public_key, {"version": "3", "action": "ping"})
+    webhook_latencies, flow_count = [], 0
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            deadline = time.monotonic() + duration
+
+            async def flow_client():
+                nonlocal flow_count
+                while time.monotonic() < deadline:
+                    response = await client.post("/waflow", content=flow_body)
+                    assert response.status_code == 200, response.text
+                    flow_count += 1
+
+            async def webhook_probe():
+                i = 0
+                while time.monotonic() < deadline:
+                    i += 1
+                    body = {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {
+                        "metadata": {"phone_number_id": os.environ["PHONE_NUMBER_ID"]},
+                        "messages": [{"from": f"62800{i}", "id": f"probe-{i}", "type": "text", "text": {"body": "halo"}}],
+                    }}]}]}
+                    started = time.perf_counter()
+                    await client.post("/webhook", json=body)
+                    webhook_latencies.append((time.perf_counter() - started) * 1000)
+                    await asyncio.sleep(probe_interval)
+
+            await asyncio.gather(webhook_probe(), *(flow_client() for _ in range(flow_clients)))
+
+    return {
+        "waflow_rps": round(flow_count / duration, 1),
+        "webhook_p50_ms": round(statistics.median(webhook_latencies), 2),
+        "webhook_p95_ms": round(_percentile(webhook_latencies, 95), 2),
+        "webhook_p99_ms": round(_percentile(webhook_latencies, 99), 2),
+        "webhook_samples": len(webhook_latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--flow-clients", type=int, default=16)
+    parser.add_argument("--probe-interval", type=float, default=0.005)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = asyncio.run(run_mode(args.duration, args.flow_clients, args.probe_interval))
+        print(json.dumps(result))
+        return
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    env = dict(
+        os.environ,
+        PRIVATE_KEY=pem.decode(),
+        PHONE_NUMBER_ID="bench",
+        WEBHOOK_DEDUPE="false",
+        FLOW_CRYPTO_WORKERS=str(args.workers),
+    )
+
+    print(f"{'mode':<8} {'waflow req/s':>12} {'webhook p50':>12} {'p95':>8} {'p99':>8}")
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.flow_offload", "--mode", mode,
+             "--duration", str(args.duration), "--flow-clients", str(args.flow_clients),
+             "--probe-interval", str(args.probe_interval)],
+            env=dict(env, FLOW_CRYPTO_EXECUTOR=mode), capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<8} {result['waflow_rps']:>12} {result['webhook_p50_ms']:>10}ms "
+              f"{result['webhook_p95_ms']:>6}ms {result['webhook_p99_ms']:>6}ms")
+
+if __name__ == "__main__":
+    main()
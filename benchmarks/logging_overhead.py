@@ -0,0 +1,104 @@
+"""
+Logging cost paid on the event loop for one "Member" webhook (the lines logged
+while validating a member), with output going to /dev/null:
+
+  sync-fstring   the previous setup: eager f-strings, StreamHandler on the loop
+  sync-lazy      %-style arguments, still written synchronously and redacted
+  queue          %-style, message resolved on the loop; redacted, formatted and
+                 written by the listener thread
+                 (which competes with the loop for the GIL while it catches up)
+  queue-handoff  as queue with the listener paused: the cost on the loop alone
+  queue-sampled  as queue, with LOG_SAMPLE_RATES keeping 10% of INFO logs
+
+    python -m benchmarks.logging_overhead --number 20000
+"""
+import argparse
+import logging
+import os
+import queue
+import time
+import timeit
+from logging.handlers import QueueListener
+import core.logger as log
+
+TOKEN = "b8f3c1d2e4a5968778695a4b3c2d1e0f"
+CHECKSUM = "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+PHONE = "6281234567890"
+PAYLOAD = {"mode": "mobile", "id": "081234567890", "action": "all", "token": TOKEN, "checksum": CHECKSUM}
+RESPONSE = {"response_code": "00", "card_number": "9990812345678", "flag": "T", "q": "q-1", "link": "https://example.com/tnc"}
+
+def webhook_fstring(logger: logging.Logger):
+    logger.info(f"Profile Name: {'Budi'}")
+    logger.info(f"Phone Number: {PHONE}")
+    logger.info(f"Incoming message from profile: {'Budi'} | {PHONE}")
+    logger.info(f"VALIDATE MEMBER | Response: {RESPONSE}")
+    logger.info(f"TNC Info Checksum {'mobile' + PHONE + 'all' + TOKEN}")
+    logger.info(f"TNC Payload : {PAYLOAD}")
+    logger.info(f"TNC Info Response : {RESPONSE}")
+
+def webhook_lazy(logger: logging.Logger):
+    with log.message_log_context("interactive:list_reply", PHONE):
+        logger.info("Profile Name: %s", "Budi")
+        logger.info("Phone Number: %s", PHONE)
+        logger.info("Incoming message from profile: %s | %s", "Budi", PHONE)
+        logger.info("VALIDATE MEMBER | Response: %s", RESPONSE)
+        logger.debug("TNC Info Checksum %s", "mobile" + PHONE + "all" + TOKEN)
+        logger.info("TNC Payload : %s", PAYLOAD)
+        logger.info("TNC Info Response : %s", RESPONSE)
+
+def _logger(name: str, handler: logging.Handler) -> logging.Logger:
+    # A SampledLogger: importing core.logger made it the logger class
+    logger = logging.getLogger(f"benchmark.{name}")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+def _stream(redact: bool) -> logging.Handler:
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s"))
+    if redact:
+        handler.addFilter(log.RedactingFilter())
+    return handler
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20_000)
+    args = parser.parse_args()
+
+    log.register_secret(TOKEN)
+    records = queue.Queue(maxsize=args.number * 10)
+    queued = log.NonBlockingQueueHandler(records)
+    queued.addFilter(log.ContextFilter())
+    listener = QueueListener(records, _stream(redact=True))
+    listener.start()
+
+    sync_lazy = _stream(redact=True)
+    sync_lazy.addFilter(log.ContextFilter())
+
+    cases = [
+        ("sync-fstring", webhook_fstring, _logger("fstring", _stream(redact=False)), {}, False),
+        ("sync-lazy", webhook_lazy, _logger("lazy", sync_lazy), {}, False),
+        ("queue", webhook_lazy, _logger("queue", queued), {}, False),
+        ("queue-handoff", webhook_lazy, _logger("handoff", queued), {}, True),
+        ("queue-sampled", webhook_lazy, _logger("sampled", queued), {"interactive:list_reply": 0.1}, False),
+    ]
+    try:
+        for name, webhook, logger, rates, paused in cases:
+            log.LOG_SAMPLE_RATES.clear()
+            log.LOG_SAMPLE_RATES.update(rates)
+            # Start from an idle listener so one case does not pay for the previous backlog
+            while not records.empty():
+                time.sleep(0.05)
+            if paused:
+                listener.stop()
+            seconds = timeit.timeit(lambda: webhook(logger), number=args.number)
+            if paused:
+                listener.start()
+            print(f"{name:<14} {seconds / args.number * 1e6:8.2f} us per webhook on the event loop")
+    finally:
+        listener.stop()
+    print(f"dropped by the queue handler: {log.logging_stats()['dropped']}")
+
+if __name__ == "__main__":
+    main()
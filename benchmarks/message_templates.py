@@ -0,0 +1,86 @@
+"""
+Cost of building a menu message body: the previous path (nested dict built per
+call, then encoded the way httpx encodes json=) against rendering the
+precompiled template from WhatsAppService.
+
+    python -m benchmarks.message_templates --number 200000
+"""
+import argparse
+import json
+import timeit
+from globals.constants import Menu
+from services.whatsapp_service import WhatsAppService
+
+def _httpx_encode(payload: dict) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+def dict_member_services_menu(to: str, message: str) -> bytes:
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "interactive",
+        "interactive": {
+            "type": "list",
+            "body": {"text": message},
+            "action": {
+                "sections": [{
+                    "title": "Layanan Member",
+                    "rows": [
+                        {"id": Menu.MEMBER_CEK_POIN, "title": "Cek Poin"},
+                        {"id": Menu.MEMBER_RIWAYAT_TRANSAKSI_POIN, "title": "Riwayat Transaksi Poin"},
+                        {"id": Menu.MAIN_MENU, "title": "Kembali ke Menu Utama"}
+                    ]
+                }],
+                "button": "Pilih Layanan"
+            }
+        }
+    }
+    return _httpx_encode(payload)
+
+def dict_greetings(to: str, username: str) -> bytes:
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "interactive",
+        "interactive": {
+            "type": "list",
+            "body": {"text": f"Halo *_{username}_*! 👋🏻 🤗. Selamat datang di layanan Member *Alfamidi*. Silahkan pilih layanan yang anda butuhkan."},
+            "action": {
+                "sections": [{
+                    "title": "Pilih Menu",
+                    "rows": [
+                        {"id": Menu.MEMBER, "title": "Member"},
+                        {"id": Menu.MENU_2, "title": "MENU ON DEV 2"}
+                    ]
+                }],
+                "button": "Pilih Menu"
+            }
+        }
+    }
+    return _httpx_encode(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+
+    templates = WhatsAppService().templates
+    to, message, username = "6281234567890", "Anda berada di dalam layanan member.\n\nSilahkan pilih layanan.", "Budi"
+
+    assert dict_member_services_menu(to, message) == templates.render("member_services_menu", to=to, message=message)
+    assert dict_greetings(to, username) == templates.render("greetings", to=to, username=username)
+
+    cases = [
+        ("member_services_menu", lambda: dict_member_services_menu(to, message),
+         lambda: templates.render("member_services_menu", to=to, message=message)),
+        ("greetings", lambda: dict_greetings(to, username),
+         lambda: templates.render("greetings", to=to, username=username)),
+    ]
+    print(f"{'message':<22} {'dict+dumps':>12} {'template':>12} {'speedup':>8}")
+    for name, old, new in cases:
+        old_us = min(timeit.repeat(old, number=args.number, repeat=3)) / args.number * 1e6
+        new_us = min(timeit.repeat(new, number=args.number, repeat=3)) / args.number * 1e6
+        print(f"{name:<22} {old_us:>10.2f}us {new_us:>10.2f}us {old_us / new_us:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
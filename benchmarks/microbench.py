@@ -0,0 +1,373 @@
+"""
+Microbenchmarks for the request hot path, runnable offline: Graph API and PLMS
+requests are answered in-process (WhatsAppService._send and PLMSService._send
+are replaced), so what gets timed is our own work: webhook parsing and
+dispatch, handler routing, payload and checksum building, Flow crypto and
+message rendering. Logging runs at WARNING.
+
+    python -m benchmarks.microbench                 # compare with benchmarks/baseline.json
+    python -m benchmarks.microbench --save          # record a new baseline
+    python -m benchmarks.microbench --filter plms. --threshold 0.1
+
+A case is timed as the best of --repeat runs of about --min-time seconds.
+The run exits with 1 when a case is slower than its baseline by more than
+--threshold (a fraction). Baselines only compare on the machine and Python
+that recorded them; re-record after changing either.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import re
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+PHONE = "6281234567890"
+TOKEN = "b8f3c1d2e4a5968778695a4b3c2d1e0f"
+PHONE_NUMBER_ID = "bench"
+
+GRAPH_RESPONSE = {
+    "messaging_product": "whatsapp",
+    "contacts": [{"input": PHONE, "wa_id": PHONE}],
+    "messages": [{"id": "wamid.HBgNNjI4MTIzNDU2Nzg5MBUCABEYEjQ1"}],
+}
+
+HISTORY = [
+    {
+        "transaction_date": f"2026-10-{18 - day:02d} 10:{day:02d}:00",
+        "transaction_place": f"Alfamidi Cabang {day % 7 + 1}",
+        "point": -(5 + day) if day % 4 == 3 else 10 + day,
+        "status": "redeem" if day % 4 == 3 else "award",
+    }
+    for day in range(14)
+]
+
+PLMS_RESPONSES = {
+    "/validatemember": {"response_code": "00", "card_number": "9990812345678"},
+    "/inquiry": {
+        "response_code": "00",
+        "card_number": "9990812345678",
+        "redeemable_pool_units": 12500,
+        "eeb_pool_units": [100, 250, 75],
+        "eeb_date": ["20261031", "20261130", "20261231"],
+    },
+    "/tnc/info": {"response_code": "00", "flag": "T", "q": "q-1", "link": "https://plms.local/tnc/q-1"},
+    "/tnc/inquiry": {"response_code": "00", "member_id": "M081234567890"},
+    "/tnc/commit": {"response_code": "00"},
+    "/transactionhistory": {"response_code": "00", "history": HISTORY, "total_data": len(HISTORY), "total_page": 1},
+    "/memberactivation": {"response_code": "00"},
+}
+
+REGISTER_DATA = {
+    "phone_number": PHONE,
+    "name": "Budi Santoso",
+    "birth_date": "1990-05-17",
+    "email": "budi@example.com",
+    "card_number": "",
+    "gender": "M",
+    "marital": "S",
+    "address": "Jl. Merdeka No. 10, RT 01/RW 02 - Jakarta",
+}
+
+class Case(NamedTuple):
+    name: str
+    run: Callable
+    is_async: bool
+
+def _configure_env():
+    """Settings the app modules read at import time"""
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["PHONE_NUMBER_ID"] = PHONE_NUMBER_ID
+    os.environ["WEBHOOK_DEDUPE"] = "false"
+    os.environ["OUTBOX_MODE"] = "off"
+    os.environ["FLOW_CRYPTO_EXECUTOR"] = "inline"
+    if not os.getenv("PRIVATE_KEY"):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        os.environ["PRIVATE_KEY"] = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+
+def answer_offline(whatsapp_service, plms_service):
+    """Answer every upstream request in-process, after the request payload has been built"""
+    import httpx
+    from services.plms_service import PLMSCallContext
+
+    graph_body = json.dumps(GRAPH_RESPONSE).encode()
+    plms_bodies = {path: json.dumps(data).encode() for path, data in PLMS_RESPONSES.items()}
+    headers = {"Content-Type": "application/json"}
+
+    graph_request = httpx.Request("POST", f"{whatsapp_service.base_url}/{PHONE_NUMBER_ID}/messages")
+
+    async def graph_send(endpoint: str, content: bytes, to: str) -> httpx.Response:
+        return httpx.Response(200, content=graph_body, headers=headers, request=graph_request)
+
+    async def plms_send(path: str, build, phone_number: str = "", **kwargs) -> httpx.Response:
+        ctx = PLMSCallContext(token=TOKEN, phone_number=plms_service.normalize_phone(phone_number), **kwargs)
+        request = httpx.Request("POST", f"{plms_service.endpoint}{path}", json=build(ctx))
+        return httpx.Response(200, content=plms_bodies[path], headers=headers, request=request)
+
+    whatsapp_service._send = graph_send
+    plms_service._send = plms_send
+
+def _webhook_body(message: dict) -> bytes:
+    return json.dumps({
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "0", "changes": [{"field": "messages", "value": {
+            "messaging_product": "whatsapp",
+            "metadata": {"display_phone_number": "6200000000", "phone_number_id": PHONE_NUMBER_ID},
+            "contacts": [{"profile": {"name": "Budi"}, "wa_id": PHONE}],
+            "messages": [{"id": "wamid.bench", "from": PHONE, "timestamp": "1760000000", **message}],
+        }}]}],
+    }).encode()
+
+def _request(path: str, body: bytes):
+    from starlette.requests import Request
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"",
+             "headers": [(b"content-type", b"application/json")]}
+    return Request(scope, receive)
+
+def webhook_cases() -> List[Case]:
+    from controllers import webhook_controller
+    from globals.constants import Menu
+
+    answer_offline(webhook_controller.whatsapp_service, webhook_controller.plms_service)
+    text = _webhook_body({"type": "text", "text": {"body": "Halo"}})
+    member = _webhook_body({"type": "interactive", "interactive": {
+        "type": "list_reply", "list_reply": {"id": Menu.MEMBER.value, "title": "Member"}}})
+
+    return [
+        Case("webhook.text", lambda: webhook_controller.webhook_handler(_request("/webhook", text)), True),
+        Case("webhook.member_menu", lambda: webhook_controller.webhook_handler(_request("/webhook", member)), True),
+        Case("webhook.extract_events", lambda: webhook_controller.extract_message_events(json.loads(member)), False),
+    ]
+
+def routing_cases(whatsapp_service, plms_service) -> List[Case]:
+    from globals.constants import Menu, WAFlow
+    from handlers.message_handler import MessageHandler
+
+    handler = MessageHandler(whatsapp_service, plms_service)
+    activation = {"response_json": json.dumps({**REGISTER_DATA, "flow_token": WAFlow.WAFLOW_TOKEN_ACTIVATE.value})}
+
+    def list_reply(menu: Menu) -> Callable:
+        return lambda: handler.handle_list_reply(PHONE, {"id": menu.value, "title": menu.name})
+
+    return [
+        Case("route.text_greeting", lambda: handler.handle_text_message(PHONE, "Halo", "Budi"), True),
+        Case("route.text_konfirmasi", lambda: handler.handle_text_message(PHONE, "konfirmasi", "Budi"), True),
+        Case("route.list_member", list_reply(Menu.MEMBER), True),
+        Case("route.list_main_menu", list_reply(Menu.MAIN_MENU), True),
+        Case("route.list_cek_poin", list_reply(Menu.MEMBER_CEK_POIN), True),
+        Case("route.list_riwayat", list_reply(Menu.MEMBER_RIWAYAT_TRANSAKSI_POIN), True),
+        Case("route.button_member_menu", lambda: handler.handle_button_reply(PHONE, {"id": "go-back-member-menu"}), True),
+        Case("route.nfm_activation", lambda: handler.handle_nfm_reply(PHONE, activation), True),
+    ]
+
+def send_cases(whatsapp_service) -> List[Case]:
+    wa = whatsapp_service
+    message = "Anda berada di dalam layanan member.\n\nSilahkan pilih layanan member yang tersedia."
+    buttons = [{"id": "go-back-main-menu", "title": "Kembali"}, {"id": "validate-tnc", "title": "Terms & Condition"}]
+
+    return [
+        Case("send.message", lambda: wa.send_message(PHONE, message), True),
+        Case("send.greetings", lambda: wa.send_greetings(PHONE, "Budi"), True),
+        Case("send.cta_url_message", lambda: wa.send_cta_url_message(
+            PHONE, "https://plms.local/tnc/q-1", "Terms & Condition", "Syarat & Ketentuan", message), True),
+        Case("send.main_menu", lambda: wa.send_main_menu(PHONE, message), True),
+        Case("send.member_services_menu", lambda: wa.send_member_services_menu(PHONE, message), True),
+        Case("send.activation_menu", lambda: wa.send_activation_menu(PHONE), True),
+        Case("send.form_register", lambda: wa.send_form_register(PHONE), True),
+        Case("send.message_with_button", lambda: wa.send_message_with_button(PHONE, message, buttons), True),
+    ]
+
+def plms_cases(plms_service) -> List[Case]:
+    plms = plms_service
+    # The uncached loaders, so every call builds its payload and checksum
+    return [
+        Case("plms.validate_member", lambda: plms._validate_member(PHONE), True),
+        Case("plms.inquiry", lambda: plms._inquiry(PHONE), True),
+        Case("plms.tnc_info", lambda: plms._tnc_info(PHONE), True),
+        Case("plms.tnc_inquiry", lambda: plms.tnc_inquiry("q-1"), True),
+        Case("plms.tnc_commit", lambda: plms.tnc_commit("q-1", "M081234567890", PHONE), True),
+        Case("plms.transaction_history", lambda: plms.transaction_history_page(PHONE, "20261004", "20261018"), True),
+        Case("plms.member_activation", lambda: plms.member_activation(PHONE, REGISTER_DATA), True),
+    ]
+
+def crypto_cases() -> List[Case]:
+    from benchmarks.flow_offload import _encrypt_flow_request
+    from core.encoder import EncryptionService
+    from services.flow_service import FlowCryptoService
+
+    crypto = FlowCryptoService(os.environ["PRIVATE_KEY"], None, executor_mode="inline")
+    body = _encrypt_flow_request(crypto.private_key.public_key(), {
+        "version": "3", "action": "data_exchange", "screen": "REGISTER", "flow_token": "bench",
+        "data": {"phone_number": PHONE, "name": "Budi Santoso"}})
+    _, aes_key, iv = crypto.decrypt_request(body)
+    screen = {"version": "3", "screen": "SUCCESS", "action": "data_exchange", "data": {"extension_message_response": {
+        "params": {"flow_token": "bench", "phone_number": PHONE}}}}
+    encryption = EncryptionService()
+
+    return [
+        Case("crypto.flow_decrypt_request", lambda: crypto.decrypt_request(body), False),
+        Case("crypto.flow_encrypt_response", lambda: crypto.encrypt_response(screen, aes_key, iv), False),
+        Case("crypto.encrypt_pin", lambda: encryption.encrypt_pin("123456"), False),
+    ]
+
+def render_cases(whatsapp_service, plms_service) -> List[Case]:
+    from handlers.plms_handler import PLMSHandler
+
+    handler = PLMSHandler(whatsapp_service, plms_service)
+    return [
+        Case("render.check_point_member", lambda: handler.check_point_member(PHONE), True),
+        Case("render.transaction_history_summary", lambda: handler.transaction_history_summary(PHONE), True),
+    ]
+
+async def _run(case: Case, number: int) -> float:
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        if case.is_async:
+            for _ in range(number):
+                await case.run()
+        else:
+            for _ in range(number):
+                case.run()
+        return time.perf_counter() - started
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+async def calibrate(case: Case, min_time: float) -> int:
+    """Calls per timed run so that a run lasts about `min_time`"""
+    number = 1
+    while await _run(case, number) < min_time / 10:
+        number *= 10
+    return max(1, int(number * min_time / max(await _run(case, number), 1e-9)))
+
+async def measure(cases: List[Case], min_time: float, repeat: int) -> Dict[str, float]:
+    """
+    Microseconds per call for each case: the best of `repeat` runs. The runs go
+    round-robin over the cases, so a burst of noise from the machine costs one
+    run of a few cases rather than every run of one case.
+    """
+    numbers = {}
+    for case in cases:
+        numbers[case.name] = await calibrate(case, min_time)
+    best = {case.name: float("inf") for case in cases}
+    for round_number in range(repeat):
+        gc.collect()
+        for case in cases:
+            best[case.name] = min(best[case.name], await _run(case, numbers[case.name]) / numbers[case.name])
+        print(f"  round {round_number + 1}/{repeat} done", file=sys.stderr)
+    return {name: round(seconds * 1e6, 3) for name, seconds in best.items()}
+
+def machine() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def load_baseline(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def compare(results: Dict[str, float], baseline: dict, threshold: float) -> List[str]:
+    """Print the comparison table and return the names of the regressed cases"""
+    recorded = baseline.get("results", {})
+    regressions = []
+    print(f"{'case':<36} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, current in results.items():
+        before = recorded.get(name)
+        if before is None:
+            print(f"{name:<36} {'-':>11} {current:>9.2f}us {'new':>8}")
+            continue
+        change = current / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSED"
+        print(f"{name:<36} {before:>9.2f}us {current:>9.2f}us {change:>+7.1%}{flag}")
+    return regressions
+
+async def run_suite(args) -> Dict[str, float]:
+    from services.plms_service import PLMSService
+    from services.whatsapp_service import WhatsAppService
+
+    whatsapp_service = WhatsAppService()
+    plms_service = PLMSService()
+    answer_offline(whatsapp_service, plms_service)
+    await whatsapp_service.start()
+
+    cases = (
+        webhook_cases()
+        + routing_cases(whatsapp_service, plms_service)
+        + send_cases(whatsapp_service)
+        + plms_cases(plms_service)
+        + crypto_cases()
+        + render_cases(whatsapp_service, plms_service)
+    )
+    pattern = re.compile(args.filter) if args.filter else None
+
+    if pattern:
+        cases = [case for case in cases if pattern.search(case.name)]
+
+    try:
+        results = await measure(cases, args.min_time, args.repeat)
+    finally:
+        await whatsapp_service.aclose()
+        await plms_service.aclose()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Record the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing, e.g. 0.25 = 25%%")
+    parser.add_argument("--filter", help="Only run cases whose name matches this regex")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Seconds per timed run")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    _configure_env()
+    results = asyncio.run(run_suite(args))
+
+    if args.save:
+        baseline = load_baseline(args.baseline) if args.filter else {}
+        baseline["machine"] = machine()
+        baseline["results"] = {**baseline.get("results", {}), **results}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline with {len(baseline['results'])} cases written to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"No baseline at {args.baseline}; record one with --save")
+    elif baseline.get("machine") != machine():
+        print(f"Warning: the baseline was recorded on {baseline.get('machine')}, this is {machine()}")
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import hmac
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException
+from controllers.webhook_controller import whatsapp_service, loop_monitor
+from core.logger import get_logger
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = get_logger()
+
+# Admin endpoints stay disabled until ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: str = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+def _outbox():
+    if whatsapp_service.outbox is None or not whatsapp_service.outbox.running:
+        raise HTTPException(status_code=404, detail="Outbox is disabled")
+    return whatsapp_service.outbox
+
+@router.get("/debug/loop")
+async def event_loop_report():
+    """Lag figures and the stack captured each time a callback blocked the loop"""
+    return {"stats": loop_monitor.stats(), "blocked_calls": loop_monitor.recent_reports()}
+
+@router.get("/outbox/dead-letters")
+async def list_dead_letters(limit: int = 50):
+    return {"dead_letters": await _outbox().list_dead_letters(limit)}
+
+@router.post("/outbox/dead-letters/{dead_id}/replay")
+async def replay_dead_letter(dead_id: int):
+    record = await _outbox().replay(dead_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Dead letter not found")
+    logger.info("Dead letter %s to %s queued for replay", dead_id, record['recipient'])
+    return {"replayed": record}
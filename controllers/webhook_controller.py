@@ -6,9 +6,19 @@ from handlers.contact_handler import ContactHandler
 from handlers.flow_handler import FlowHandler
 from handlers.plms_handler import PLMSHandler
 from services.flow_service import FlowCryptoService
-from core.logger import get_logger
+from services.dedupe_service import MessageDeduplicator
+from services.conversation_state import ConversationStateStore
+from core.dispatcher import LaneDispatcher, QueueFullError
+from core.http_client import pool_stats
+from core.metrics import REGISTRY, CONTENT_TYPE, MESSAGE_DURATION
+from core.loop_monitor import LoopLagMonitor
+from core.prefetch import PrefetchEngine
+from core.redis_client import close_all as close_redis
+from core.logger import get_logger, logging_stats, message_log_context
 from dotenv import load_dotenv
+import asyncio
 import os
+import time
 
 router = APIRouter()
 logger = get_logger()
@@ -19,19 +29,32 @@ PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 PRIVATE_KEY = os.environ.get("PRIVATE_KEY")
 PASSPHRASE_ENV = os.environ.get("PASSPHRASE_ENV")  # if needed
 
+# Ack-first mode: validate, enqueue and return 200 before the handlers run
+WEBHOOK_ACK_FIRST = os.getenv("WEBHOOK_ACK_FIRST", "false").lower() == "true"
+# Messages are sharded by sender onto lanes: in order per sender, parallel across lanes
+WEBHOOK_LANES = int(os.getenv("WEBHOOK_LANES", 16))
+WEBHOOK_LANE_BACKLOG = int(os.getenv("WEBHOOK_LANE_BACKLOG", 100))
+WEBHOOK_USER_IDLE_TTL = float(os.getenv("WEBHOOK_USER_IDLE_TTL", 300))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 30))
+# Watchdog reporting callbacks that block the event loop (see /admin/debug/loop)
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "false").lower() == "true"
+
 crypto_service = FlowCryptoService(PRIVATE_KEY, PASSPHRASE_ENV)
 
 whatsapp_service = WhatsAppService()
 plms_service = PLMSService()
 flow_handler = FlowHandler(whatsapp_service)
-message_handler = MessageHandler(whatsapp_service, plms_service)
+conversation_state = ConversationStateStore()
+prefetcher = PrefetchEngine()
+message_handler = MessageHandler(whatsapp_service, plms_service, conversation_state, prefetcher)
 contact_handler = ContactHandler(whatsapp_service)
+deduplicator = MessageDeduplicator()
+loop_monitor = LoopLagMonitor()
 
 @router.get("/login")
 async def plms_login():
     try:
-        plms_service = PLMSService()
-        plms_service.login()
+        await plms_service.login()
         return{"message": "Login successful", "token": plms_service.token}
     except Exception as e:
         return Response(content=f"Login failed: {str(e)}", status_code=500)
@@ -53,68 +76,197 @@ async def verify_webhook(request: Request):
 def safe_validate_phone_number_id(value: dict) -> bool:
     received_phone_number_id = value.get("metadata", {}).get("phone_number_id")
     if received_phone_number_id != PHONE_NUMBER_ID:
-        logger.warning(f"Phone number ID mismatch: received={received_phone_number_id}, expected={PHONE_NUMBER_ID}")
+        logger.warning("Phone number ID mismatch: received=%s, expected=%s", received_phone_number_id, PHONE_NUMBER_ID)
         return False
     return True
 
+def extract_message_events(body: dict) -> list:
+    """Flatten every entry, change and message of a webhook body into message events"""
+    events = []
+    for entry in body.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+
+            # Validate phone number ID
+            safe_validate_phone_number_id(value)
+
+            contacts = {contact.get("wa_id"): contact for contact in value.get("contacts", [])}
+            for message in value.get("messages", []):
+                events.append({"message": message, "contact": contacts.get(message.get("from"))})
+    return events
+
+def message_type(message: dict) -> str:
+    """text, or interactive:<list_reply|button_reply|nfm_reply>, for metrics labels"""
+    if message.get("type") == "interactive":
+        return f"interactive:{message['interactive'].get('type')}"
+    return message.get("type", "unknown")
+
+async def process_message_event(event: dict):
+    kind = message_type(event["message"])
+    started = time.perf_counter()
+    try:
+        with message_log_context(kind, event["message"].get("from")):
+            await handle_message_event(event)
+    finally:
+        MESSAGE_DURATION.labels(kind).observe(time.perf_counter() - started)
+
+async def handle_message_event(event: dict):
+    """Run the handler chain for a single incoming message"""
+    message = event["message"]
+    contact = event.get("contact")
+    phone_number = message.get("from")
+    username = "Pelanggan"
+
+    # Handle contacts
+    if contact:
+        username = await contact_handler.get_profile_name(contact)
+        logger.info("Incoming message from profile: %s | %s", username, await contact_handler.get_phone_number(contact))
+
+    if message["type"] == "text":
+        await message_handler.handle_text_message(phone_number, message["text"]["body"], username)
+        
+    if message["type"] == "interactive":
+        interactive_type = message["interactive"].get("type")
+        
+        if interactive_type == "list_reply":
+            await message_handler.handle_list_reply(phone_number, message["interactive"]["list_reply"])
+        elif interactive_type == "nfm_reply":
+            await message_handler.handle_nfm_reply(phone_number, message["interactive"]["nfm_reply"])
+        elif interactive_type == "button_reply":
+            await message_handler.handle_button_reply(phone_number, message["interactive"]["button_reply"])
+
+dispatcher = LaneDispatcher(
+    process_message_event,
+    key=lambda event: event["message"].get("from"),
+    lanes=WEBHOOK_LANES,
+    max_backlog=WEBHOOK_LANE_BACKLOG,
+    user_idle_ttl=WEBHOOK_USER_IDLE_TTL,
+)
+
+DISPATCHER_QUEUE_DEPTH = REGISTRY.gauge("wa_dispatcher_lane_depth", "Messages queued per dispatcher lane", ("lane",))
+DISPATCHER_BUSY_LANES = REGISTRY.gauge("wa_dispatcher_busy_lanes", "Dispatcher lanes currently handling a message")
+POOL_CONNECTIONS = REGISTRY.gauge("wa_upstream_pool_connections", "Upstream connection pool usage", ("upstream", "state"))
+# Totals kept by the components for /stats, copied over on every scrape
+DEDUPE_MESSAGES = REGISTRY.counter("wa_dedupe_messages", "Webhook messages checked for redelivery, by result", ("result",))
+GRAPH_SCHEDULER_EVENTS = REGISTRY.counter(
+    "wa_graph_scheduler_events", "Outbound Graph API sends by outcome (sent, throttled, retried, gave_up)", ("event",))
+PLMS_CALLS_SAVED = REGISTRY.counter("wa_plms_calls_saved", "PLMS calls avoided by reusing conversation state")
+CACHE_EVENTS = REGISTRY.counter(
+    "wa_cache_events", "Cache lookups and removals (hit, miss, coalesced, eviction, expiration, invalidation)", ("cache", "event"))
+CACHE_ENTRIES = REGISTRY.gauge("wa_cache_entries", "Entries held per cache", ("cache",))
+CACHE_BYTES = REGISTRY.gauge("wa_cache_bytes", "Estimated size of the entries held per cache", ("cache",))
+
+def collect_runtime_metrics():
+    for lane in dispatcher.lanes:
+        DISPATCHER_QUEUE_DEPTH.labels(lane.index).set(lane.queue.qsize())
+    DISPATCHER_BUSY_LANES.set(sum(1 for lane in dispatcher.lanes if lane.busy))
+    for upstream, stats in (("graph", whatsapp_service.pool_stats()), ("plms", pool_stats(plms_service.client))):
+        for state in ("in_use", "idle", "waiting"):
+            POOL_CONNECTIONS.labels(upstream, state).set(stats.get(state, 0))
+
+    dedupe = deduplicator.stats()
+    DEDUPE_MESSAGES.labels("checked").set(dedupe["checked"])
+    DEDUPE_MESSAGES.labels("duplicate").set(dedupe["duplicates"])
+    DEDUPE_MESSAGES.labels("error").set(dedupe["errors"])
+    scheduler = whatsapp_service.scheduler.stats()
+    for event, field in (("sent", "sent"), ("throttled", "throttle_events"), ("retried", "retries"), ("gave_up", "gave_up")):
+        GRAPH_SCHEDULER_EVENTS.labels(event).set(scheduler[field])
+    PLMS_CALLS_SAVED.labels().set(conversation_state.plms_calls_saved)
+
+    caches = [*plms_service.caches.values(), plms_service.history_cache.cache, conversation_state.near_cache]
+    for cache in caches:
+        stats = cache.stats()
+        for event, field in (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"), ("eviction", "evictions"),
+                             ("expiration", "expirations"), ("invalidation", "invalidations")):
+            CACHE_EVENTS.labels(cache.name, event).set(stats[field])
+        CACHE_ENTRIES.labels(cache.name).set(stats["entries"])
+        CACHE_BYTES.labels(cache.name).set(stats["bytes"])
+
+REGISTRY.add_collector(collect_runtime_metrics)
+
+async def on_startup():
+    if LOOP_MONITOR:
+        loop_monitor.start()
+    crypto_service.start()
+    await whatsapp_service.start()
+    await plms_service.start()
+    await dispatcher.start()
+
+async def on_shutdown():
+    await dispatcher.stop(timeout=WEBHOOK_DRAIN_TIMEOUT)
+    await prefetcher.stop()
+    await plms_service.aclose()
+    await whatsapp_service.aclose()
+    await close_redis()
+    crypto_service.shutdown()
+    await loop_monitor.stop()
+
+@router.get("/stats")
+async def service_stats():
+    return {
+        "ack_first": WEBHOOK_ACK_FIRST,
+        "event_loop": loop_monitor.stats(),
+        "logging": logging_stats(),
+        "dispatcher": dispatcher.stats(),
+        "dedupe": deduplicator.stats(),
+        "conversation_state": conversation_state.stats(),
+        "prefetch": prefetcher.stats(),
+        "graph_pool": whatsapp_service.pool_stats(),
+        "graph_scheduler": whatsapp_service.scheduler.stats(),
+        "outbox": await whatsapp_service.outbox.stats() if whatsapp_service.outbox else None,
+        "plms_pool": pool_stats(plms_service.client),
+        "plms_token": plms_service.token_manager.stats(),
+        "plms_cache": plms_service.cache_stats(),
+        "plms_history": plms_service.history_cache.stats(),
+        "plms_breakers": plms_service.breaker_stats(),
+        "plms_hedging": plms_service.hedge_stats(),
+    }
+
+@router.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @router.post("/webhook")
 async def webhook_handler(request: Request):
     try:
         body = await request.json()
         # Know The Body Of The Messages
-        # logger.info(f"Received webhook body: {body}") 
+        # logger.info("Received webhook body: %s", body) 
 
         if not body.get("object"):
             return Response(content="Invalid object", status_code=200)
 
-        entry = body.get("entry", [])[0]
-        changes = entry.get("changes", [])[0]
-        value = changes.get("value", {})
+        # Meta redelivers when we are slow; drop retries before any handler runs
+        events = await deduplicator.filter(extract_message_events(body))
+        if not events:
+            return Response(content="Event received", status_code=200)
 
-        # Validate phone number ID
-        safe_validate_phone_number_id(value)
-
-        # Get the value of messages and contacts
-        messages = value.get("messages", [])
-        contacts = value.get("contacts", [])
-        
-        # Handle contacts
-        if contacts:
-            for contact in contacts:
-                username = await contact_handler.get_profile_name(contact)
-                phone_number = await contact_handler.get_phone_number(contact)
-                logger.info(f"Incoming message from profile: {username} | {phone_number}")
-
-        # Handle messages
-        if messages:
-            message = messages[0]
-            phone_number = message.get("from")
-
-            if message["type"] == "text":
-                await message_handler.handle_text_message(phone_number, message["text"]["body"], username)
-                
-            if message["type"] == "interactive":
-                interactive_type = message["interactive"].get("type")
-                
-                if interactive_type == "list_reply":
-                    await message_handler.handle_list_reply(phone_number, message["interactive"]["list_reply"])
-                elif interactive_type == "nfm_reply":
-                    await message_handler.handle_nfm_reply(phone_number, message["interactive"]["nfm_reply"])
-                elif interactive_type == "button_reply":
-                    await message_handler.handle_button_reply(phone_number, message["interactive"]["button_reply"])
-                
+        if dispatcher.running:
+            # Every message goes through its sender's lane, even across concurrent webhooks
+            try:
+                batch = dispatcher.submit_batch(events)
+            except QueueFullError as e:
+                # Let Meta redeliver once the backlog has drained
+                logger.warning("Webhook rejected: %s", e)
+                await deduplicator.release(events)
+                return Response(content="Busy", status_code=503)
+            if not WEBHOOK_ACK_FIRST:
+                await asyncio.shield(batch)
+        else:
+            for event in events:
+                await process_message_event(event)
 
         return Response(content="Event received", status_code=200)
 
     except Exception as e:
-        logger.error(f"Error in webhook_handler: {str(e)}", exc_info=True)
+        logger.error("Error in webhook_handler: %s", str(e), exc_info=True)
         return Response(content="Internal server error", status_code=200)
     
 @router.post("/waflow")
 async def waflow_handler(request: Request):
     try:
         encrypted_body = await request.body()
-        decrypted_body, aes_key, iv = crypto_service.decrypt_request(encrypted_body)
+        decrypted_body, aes_key, iv = await crypto_service.decrypt_request_async(encrypted_body)
 
         screen = decrypted_body.get("screen")
         data = decrypted_body.get("data")
@@ -128,11 +280,11 @@ async def waflow_handler(request: Request):
         screen_data = await flow_handler.handle_flow(screen, version, data, flow_token, action)
 
         if screen_data and all(k in screen_data for k in ["version", "screen", "action", "data"]):
-            encrypted_response = crypto_service.encrypt_response(screen_data, aes_key, iv)
+            encrypted_response = await crypto_service.encrypt_response_async(screen_data, aes_key, iv)
             return Response(content=encrypted_response, media_type="text/plain")
         else:
             return Response(content="Invalid screenData", status_code=500)
 
     except Exception as e:
-        logger.error(f"Error waflow handler: {str(e)}", exc_info=True)
+        logger.error("Error waflow handler: %s", str(e), exc_info=True)
         return Response(content="Internal Server Error", status_code=500)
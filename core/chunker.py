@@ -0,0 +1,42 @@
+from typing import List, Optional
+
+class MessageChunker:
+    """
+    Builds a long message line by line into chunks of at most `limit`
+    characters, split between lines. add() hands back a chunk as soon as it is
+    full, so it can be sent while the rest is still being built; finish()
+    splits what is left so that the final chunk fits `last_limit` (the body of
+    an interactive message is shorter than a text message).
+    """
+
+    def __init__(self, limit: int, header: str = ""):
+        self.limit = limit
+        self._lines: List[str] = []
+        self._size = 0
+        if header:
+            self.add(header)
+
+    def add(self, line: str) -> Optional[str]:
+        line = line[:self.limit]
+        chunk = None
+        if self._lines and self._size + len(line) > self.limit:
+            chunk = "".join(self._lines).rstrip()
+            self._lines, self._size = [], 0
+        self._lines.append(line)
+        self._size += len(line)
+        return chunk
+
+    def finish(self, last_limit: int = None) -> List[str]:
+        """The remaining chunks; the last one is at most `last_limit` characters"""
+        last_limit = last_limit or self.limit
+        tail, size = [], 0
+        while self._lines and size + len(self._lines[-1]) <= last_limit:
+            size += len(self._lines[-1])
+            tail.insert(0, self._lines.pop())
+        if not tail and self._lines:
+            tail = [self._lines.pop()[:last_limit]]
+
+        chunks = ["".join(self._lines).rstrip()] if self._lines else []
+        chunks.append("".join(tail))
+        self._lines, self._size = [], 0
+        return [chunk for chunk in chunks if chunk]
@@ -0,0 +1,183 @@
+import os
+import time
+from collections import deque
+from typing import Dict
+from core.logger import get_logger
+from core.metrics import REGISTRY
+
+logger = get_logger()
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = REGISTRY.gauge(
+    "wa_circuit_state", "Circuit breaker state per upstream endpoint (0 closed, 1 half-open, 2 open)", ("upstream", "endpoint"))
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    "wa_circuit_transitions", "Circuit breaker state changes, by the state entered", ("upstream", "endpoint", "state"))
+CIRCUIT_REJECTED = REGISTRY.counter(
+    "wa_circuit_rejected", "Upstream calls failed fast because the circuit was open", ("upstream", "endpoint"))
+UPSTREAM_TIMEOUT = REGISTRY.gauge(
+    "wa_upstream_timeout_seconds", "Current latency-adaptive timeout per upstream endpoint", ("upstream", "endpoint"))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream endpoint whose circuit is open"""
+
+    def __init__(self, upstream: str, endpoint: str, retry_in: float):
+        super().__init__(f"{upstream} {endpoint} circuit is open, retry in {retry_in:.1f}s")
+        self.upstream = upstream
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """
+    Breaker for one upstream endpoint. `failure_threshold` consecutive failures
+    (transport errors, timeouts, 5xx) open it; calls then fail fast with
+    CircuitOpenError. After `recovery_time` it lets `half_open_calls` probes
+    through: a success closes it, a failure opens it again.
+
+    The timeout follows the endpoint's recent latency: `p99_factor` times the
+    p99 of the last `window` successful calls, kept within
+    [min_timeout, max_timeout]. Until `min_samples` calls have succeeded it is
+    max_timeout.
+    """
+
+    def __init__(self, upstream: str, endpoint: str, failure_threshold: int, recovery_time: float,
+                 half_open_calls: int, min_timeout: float, max_timeout: float, p99_factor: float,
+                 min_samples: int, window: int):
+        self.upstream = upstream
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.half_open_calls = half_open_calls
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.p99_factor = p99_factor
+        self.min_samples = min_samples
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.probes = 0
+        self.latencies = deque(maxlen=window)
+        self._timeout = max_timeout
+        # Recompute the p99 every few samples rather than sorting the window per call
+        self._until_recompute = 0
+
+        self._state_gauge = CIRCUIT_STATE.labels(upstream, endpoint)
+        self._timeout_gauge = UPSTREAM_TIMEOUT.labels(upstream, endpoint)
+        self._timeout_gauge.set(self._timeout)
+
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        previous, self.state = self.state, state
+        self._state_gauge.set(_STATE_VALUES[state])
+        CIRCUIT_TRANSITIONS.labels(self.upstream, self.endpoint, state).inc()
+        if state == OPEN:
+            self.opened += 1
+            self.opened_at = time.monotonic()
+            logger.warning("%s %s circuit opened after %s consecutive failures (was %s)",
+                           self.upstream, self.endpoint, self.consecutive_failures, previous)
+        else:
+            logger.info("%s %s circuit %s", self.upstream, self.endpoint, state.replace("_", "-"))
+
+    def allow(self):
+        """Admit a call or raise CircuitOpenError; every admitted call must be settled"""
+        if self.state == OPEN:
+            retry_in = self.opened_at + self.recovery_time - time.monotonic()
+            if retry_in > 0:
+                self._reject(retry_in)
+            self._transition(HALF_OPEN)
+            self.probes = 0
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_calls:
+                self._reject(self.recovery_time)
+            self.probes += 1
+        self.calls += 1
+
+    def _reject(self, retry_in: float):
+        self.rejected += 1
+        CIRCUIT_REJECTED.labels(self.upstream, self.endpoint).inc()
+        raise CircuitOpenError(self.upstream, self.endpoint, retry_in)
+
+    def timeout(self) -> float:
+        return self._timeout
+
+    def on_success(self, latency: float):
+        self.latencies.append(latency)
+        self._until_recompute -= 1
+        if self._until_recompute <= 0 and len(self.latencies) >= self.min_samples:
+            self._until_recompute = max(1, len(self.latencies) // 20)
+            ordered = sorted(self.latencies)
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            self._timeout = min(self.max_timeout, max(self.min_timeout, p99 * self.p99_factor))
+            self._timeout_gauge.set(self._timeout)
+
+        self.consecutive_failures = 0
+        if self.state == HALF_OPEN:
+            self.probes = max(0, self.probes - 1)
+            self._transition(CLOSED)
+
+    def on_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self.probes = max(0, self.probes - 1)
+            self._transition(OPEN)
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._transition(OPEN)
+
+    def on_abandon(self):
+        """The call ended without a verdict (cancelled, or failed on our side)"""
+        if self.state == HALF_OPEN:
+            self.probes = max(0, self.probes - 1)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "timeout_seconds": round(self._timeout, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
+
+class CircuitBreakers:
+    """
+    One CircuitBreaker per endpoint of an upstream, created on first use. Settings
+    can be overridden with <PREFIX>_BREAKER_FAILURES, <PREFIX>_BREAKER_RECOVERY,
+    <PREFIX>_BREAKER_HALF_OPEN_CALLS, <PREFIX>_TIMEOUT_MIN, <PREFIX>_TIMEOUT_MAX,
+    <PREFIX>_TIMEOUT_P99_FACTOR, <PREFIX>_TIMEOUT_MIN_SAMPLES and
+    <PREFIX>_TIMEOUT_WINDOW.
+    """
+
+    def __init__(self, upstream: str, prefix: str, failure_threshold: int = 5, recovery_time: float = 30.0,
+                 half_open_calls: int = 1, min_timeout: float = 1.0, max_timeout: float = 15.0,
+                 p99_factor: float = 3.0, min_samples: int = 20, window: int = 200):
+        self.upstream = upstream
+        self.settings = dict(
+            failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", failure_threshold)),
+            recovery_time=float(os.getenv(f"{prefix}_BREAKER_RECOVERY", recovery_time)),
+            half_open_calls=int(os.getenv(f"{prefix}_BREAKER_HALF_OPEN_CALLS", half_open_calls)),
+            min_timeout=float(os.getenv(f"{prefix}_TIMEOUT_MIN", min_timeout)),
+            max_timeout=float(os.getenv(f"{prefix}_TIMEOUT_MAX", max_timeout)),
+            p99_factor=float(os.getenv(f"{prefix}_TIMEOUT_P99_FACTOR", p99_factor)),
+            min_samples=int(os.getenv(f"{prefix}_TIMEOUT_MIN_SAMPLES", min_samples)),
+            window=int(os.getenv(f"{prefix}_TIMEOUT_WINDOW", window)),
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(self.upstream, endpoint, **self.settings)
+        return breaker
+
+    def stats(self) -> dict:
+        return {endpoint: breaker.stats() for endpoint, breaker in self.breakers.items()}
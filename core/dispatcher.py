@@ -0,0 +1,205 @@
+import asyncio
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from core.logger import get_logger
+from core.metrics import REGISTRY
+
+logger = get_logger()
+
+BATCH_SIZE = REGISTRY.histogram(
+    "wa_webhook_batch_size", "Messages fanned out from one webhook batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 250))
+BATCH_DURATION = REGISTRY.histogram(
+    "wa_webhook_batch_duration_seconds", "Time from queueing a webhook batch until all of its messages are processed")
+
+class QueueFullError(Exception):
+    """Raised when a lane cannot accept another event"""
+
+class _Lane:
+    def __init__(self, index: int, max_backlog: int):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_backlog)
+        self.task: Optional[asyncio.Task] = None
+        self.busy = False
+        self.busy_seconds = 0.0
+        self.processed = 0
+
+class _UserState:
+    __slots__ = ("pending", "last_seen")
+
+    def __init__(self):
+        self.pending = 0
+        self.last_seen = time.monotonic()
+
+class LaneDispatcher:
+    """
+    Routes events onto a fixed number of lanes by hashing their key (the sender's
+    wa_id). Each lane is a bounded queue served by one worker, so one sender's
+    messages run strictly in order while different lanes run in parallel.
+    Per-sender bookkeeping is dropped once a sender has been idle for
+    `user_idle_ttl` seconds.
+    """
+
+    def __init__(self, process: Callable[[Any], Awaitable[None]], key: Callable[[Any], str],
+                 lanes: int = 8, max_backlog: int = 100, user_idle_ttl: float = 300.0):
+        self.process = process
+        self.key = key
+        self.max_backlog = max_backlog
+        self.user_idle_ttl = user_idle_ttl
+        self.lanes = [_Lane(i, max_backlog) for i in range(max(1, lanes))]
+        self.users: Dict[str, _UserState] = {}
+        self._janitor: Optional[asyncio.Task] = None
+        self.started_at: Optional[float] = None
+
+        self.failed = 0
+        self.rejected = 0
+        self.evicted_users = 0
+        self.batches = 0
+        self.batch_messages = 0
+        self.max_batch_size = 0
+        self.batch_seconds = 0.0
+        self.max_batch_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._janitor is not None
+
+    async def start(self):
+        if self.running:
+            return
+        self.started_at = time.monotonic()
+        for lane in self.lanes:
+            lane.task = asyncio.create_task(self._run_lane(lane), name=f"webhook-lane-{lane.index}")
+        self._janitor = asyncio.create_task(self._evict_idle_users(), name="webhook-lane-janitor")
+        logger.info("Webhook dispatcher started with %s lanes (backlog %s per lane)", len(self.lanes), self.max_backlog)
+
+    async def stop(self, timeout: float = 30.0):
+        """Drain every lane, then cancel the workers"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(lane.queue.join() for lane in self.lanes)), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Webhook dispatcher drain timed out, dropping %s queued events", sum(lane.queue.qsize() for lane in self.lanes))
+
+        tasks = [lane.task for lane in self.lanes] + [self._janitor]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for lane in self.lanes:
+            lane.task = None
+        self._janitor = None
+        logger.info("Webhook dispatcher stopped")
+
+    def lane_for(self, key: str) -> _Lane:
+        # crc32 rather than hash(): stable across processes and restarts
+        return self.lanes[zlib.crc32((key or "").encode()) % len(self.lanes)]
+
+    def submit_batch(self, events: List[Any]) -> asyncio.Future:
+        """
+        Queue a webhook batch, all or nothing. The returned future resolves once
+        every event has been processed; raises QueueFullError if a lane lacks room.
+        """
+        routed = [(event, self.key(event)) for event in events]
+        needed: Dict[int, int] = {}
+        for _, key in routed:
+            index = self.lane_for(key).index
+            needed[index] = needed.get(index, 0) + 1
+        for index, count in needed.items():
+            lane = self.lanes[index]
+            if lane.queue.maxsize - lane.queue.qsize() < count:
+                self.rejected += len(events)
+                raise QueueFullError(f"Lane {index} is full ({lane.queue.qsize()}/{lane.queue.maxsize} events)")
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        futures = []
+        for event, key in routed:
+            future = loop.create_future()
+            user = self.users.get(key)
+            if user is None:
+                user = self.users[key] = _UserState()
+            user.pending += 1
+            user.last_seen = time.monotonic()
+            self.lane_for(key).queue.put_nowait((event, key, future))
+            futures.append(future)
+
+        batch = asyncio.gather(*futures)
+        batch.add_done_callback(lambda _: self._record_batch(len(events), time.monotonic() - started))
+        return batch
+
+    def _record_batch(self, size: int, seconds: float):
+        BATCH_SIZE.observe(size)
+        BATCH_DURATION.observe(seconds)
+        self.batches += 1
+        self.batch_messages += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.batch_seconds += seconds
+        self.max_batch_seconds = max(self.max_batch_seconds, seconds)
+
+    async def _run_lane(self, lane: _Lane):
+        while True:
+            event, key, future = await lane.queue.get()
+            lane.busy = True
+            started = time.monotonic()
+            try:
+                await self.process(event)
+                if not future.done():
+                    future.set_result(True)
+            except asyncio.CancelledError:
+                self.failed += 1
+                if not future.done():
+                    future.set_result(False)
+                # Only the lane itself being cancelled ends it; a cancel raised out of one event does not
+                if asyncio.current_task().cancelling():
+                    raise
+                logger.warning("Webhook lane %s: processing an event was cancelled", lane.index)
+            except Exception as e:
+                # Failures are logged here; waiters only learn that the event did not succeed
+                self.failed += 1
+                if not future.done():
+                    future.set_result(False)
+                logger.error("Webhook lane %s failed to process event: %s", lane.index, e, exc_info=True)
+            finally:
+                lane.busy = False
+                lane.busy_seconds += time.monotonic() - started
+                lane.processed += 1
+                user = self.users.get(key)
+                if user is not None:
+                    user.pending -= 1
+                    user.last_seen = time.monotonic()
+                lane.queue.task_done()
+
+    async def _evict_idle_users(self):
+        while True:
+            await asyncio.sleep(max(self.user_idle_ttl / 2, 1.0))
+            cutoff = time.monotonic() - self.user_idle_ttl
+            idle = [key for key, user in self.users.items() if user.pending <= 0 and user.last_seen < cutoff]
+            for key in idle:
+                del self.users[key]
+            self.evicted_users += len(idle)
+
+    def stats(self) -> dict:
+        uptime = time.monotonic() - self.started_at if self.started_at else 0.0
+        depths = [lane.queue.qsize() for lane in self.lanes]
+        return {
+            "running": self.running,
+            "lanes": len(self.lanes),
+            "lane_backlog_max": self.max_backlog,
+            "lane_depths": depths,
+            "queue_depth": sum(depths),
+            "busy_lanes": sum(1 for lane in self.lanes if lane.busy),
+            "utilisation": round(sum(lane.busy_seconds for lane in self.lanes) / (uptime * len(self.lanes)), 4) if uptime else 0.0,
+            "processed": sum(lane.processed for lane in self.lanes),
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "tracked_users": len(self.users),
+            "users_with_backlog": sum(1 for user in self.users.values() if user.pending > 0),
+            "evicted_users": self.evicted_users,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batch_messages / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_latency_ms": round(self.batch_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            "max_batch_latency_ms": round(self.max_batch_seconds * 1000, 2),
+        }
@@ -21,8 +21,8 @@ class EncryptionService:
             padded_text = pad(text.encode(), AES.block_size)
             ciphertext = cipher.encrypt(padded_text)
             iv_ciphertext = iv + ciphertext
-            logger.info(f"base64.b64encode(iv_ciphertext).decode()")
+            logger.info("base64.b64encode(iv_ciphertext).decode()")
             return base64.b64encode(iv_ciphertext).decode()
         except Exception as e:
-            logger.error(f"Encryption error: {e}")
+            logger.error("Encryption error: %s", e)
             raise
\ No newline at end of file
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from core.metrics import REGISTRY
+
+T = TypeVar("T")
+
+HEDGE_REQUESTS = REGISTRY.counter(
+    "wa_hedge_requests", "Calls to hedged upstream endpoints", ("upstream", "endpoint"))
+HEDGES_SENT = REGISTRY.counter(
+    "wa_hedges_sent", "Second attempts sent because the first was slower than the hedge delay", ("upstream", "endpoint"))
+HEDGE_WINS = REGISTRY.counter(
+    "wa_hedge_wins", "Hedged calls answered by the second attempt", ("upstream", "endpoint"))
+HEDGE_BUDGET_DENIED = REGISTRY.counter(
+    "wa_hedge_budget_denied", "Hedges skipped because the extra-load budget was spent", ("upstream", "endpoint"))
+
+class _EndpointLatency:
+    """Recent successful attempt latencies of one endpoint and the hedge delay derived from them"""
+
+    def __init__(self, upstream: str, endpoint: str, percentile: float, min_delay: float, min_samples: int, window: int):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.delay: Optional[float] = None
+        self._until_recompute = 0
+
+        self.requests_counter = HEDGE_REQUESTS.labels(upstream, endpoint)
+        self.hedges_counter = HEDGES_SENT.labels(upstream, endpoint)
+        self.wins_counter = HEDGE_WINS.labels(upstream, endpoint)
+        self.denied_counter = HEDGE_BUDGET_DENIED.labels(upstream, endpoint)
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+        self.denied = 0
+
+    def record(self, latency: float):
+        self.latencies.append(latency)
+        self._until_recompute -= 1
+        if self._until_recompute <= 0 and len(self.latencies) >= self.min_samples:
+            self._until_recompute = max(1, len(self.latencies) // 20)
+            ordered = sorted(self.latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+            self.delay = max(self.min_delay, ordered[index])
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "budget_denied": self.denied,
+            "hedge_rate": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            "win_rate": round(self.wins / self.hedges, 4) if self.hedges else 0.0,
+            "delay_ms": round(self.delay * 1000, 1) if self.delay is not None else None,
+        }
+
+class Hedger:
+    """
+    Request hedging for idempotent upstream calls. When an attempt has not
+    answered within the endpoint's `percentile` latency, an identical second
+    attempt is started; the first success wins and the other is cancelled.
+
+    Hedges are paid for from a budget: every call earns `budget` of a hedge
+    (up to `burst` saved up), so hedging adds at most that fraction of extra
+    load. No hedging happens before `min_samples` latencies are known.
+    Settings can be overridden with <PREFIX>_HEDGE_PERCENTILE,
+    <PREFIX>_HEDGE_BUDGET, <PREFIX>_HEDGE_MIN_DELAY, <PREFIX>_HEDGE_MIN_SAMPLES
+    and <PREFIX>_HEDGE_WINDOW.
+    """
+
+    def __init__(self, upstream: str, prefix: str, percentile: float = 95.0, budget: float = 0.05,
+                 min_delay: float = 0.02, min_samples: int = 20, window: int = 500, burst: float = 10.0):
+        self.upstream = upstream
+        self.percentile = float(os.getenv(f"{prefix}_HEDGE_PERCENTILE", percentile))
+        self.budget = float(os.getenv(f"{prefix}_HEDGE_BUDGET", budget))
+        self.min_delay = float(os.getenv(f"{prefix}_HEDGE_MIN_DELAY", min_delay))
+        self.min_samples = int(os.getenv(f"{prefix}_HEDGE_MIN_SAMPLES", min_samples))
+        self.window = int(os.getenv(f"{prefix}_HEDGE_WINDOW", window))
+        self.burst = burst
+        self.tokens = 0.0
+        self.endpoints: Dict[str, _EndpointLatency] = {}
+
+    def _endpoint(self, endpoint: str) -> _EndpointLatency:
+        tracker = self.endpoints.get(endpoint)
+        if tracker is None:
+            tracker = self.endpoints[endpoint] = _EndpointLatency(
+                self.upstream, endpoint, self.percentile, self.min_delay, self.min_samples, self.window)
+        return tracker
+
+    def _spend(self, tracker: _EndpointLatency) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        tracker.denied += 1
+        tracker.denied_counter.inc()
+        return False
+
+    async def run(self, endpoint: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        tracker = self._endpoint(endpoint)
+        tracker.requests += 1
+        tracker.requests_counter.inc()
+        self.tokens = min(self.burst, self.tokens + self.budget)
+
+        primary = asyncio.ensure_future(attempt())
+        started = {primary: time.perf_counter()}
+        try:
+            if tracker.delay is not None:
+                done, _ = await asyncio.wait((primary,), timeout=tracker.delay)
+                if not done and self._spend(tracker):
+                    hedge = asyncio.ensure_future(attempt())
+                    started[hedge] = time.perf_counter()
+                    tracker.hedges += 1
+                    tracker.hedges_counter.inc()
+
+            pending, error = set(started), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    tracker.record(time.perf_counter() - started[task])
+                    if task is not primary:
+                        tracker.wins += 1
+                        tracker.wins_counter.inc()
+                    return task.result()
+            raise error
+        finally:
+            for task in started:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {endpoint: tracker.stats() for endpoint, tracker in self.endpoints.items()}
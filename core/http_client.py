@@ -0,0 +1,44 @@
+import os
+import httpx
+
+def build_async_client(prefix: str, max_connections: int = 20, max_keepalive: int = 10,
+                       keepalive_expiry: float = 30.0, timeout: float = 10.0, connect_timeout: float = 5.0,
+                       **kwargs) -> httpx.AsyncClient:
+    """
+    Build a long-lived pooled AsyncClient. Every default can be overridden with
+    <PREFIX>_MAX_CONNECTIONS, <PREFIX>_MAX_KEEPALIVE, <PREFIX>_KEEPALIVE_EXPIRY,
+    <PREFIX>_TIMEOUT and <PREFIX>_CONNECT_TIMEOUT.
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv(f"{prefix}_MAX_CONNECTIONS", max_connections)),
+        max_keepalive_connections=int(os.getenv(f"{prefix}_MAX_KEEPALIVE", max_keepalive)),
+        keepalive_expiry=float(os.getenv(f"{prefix}_KEEPALIVE_EXPIRY", keepalive_expiry)),
+    )
+    timeouts = httpx.Timeout(
+        float(os.getenv(f"{prefix}_TIMEOUT", timeout)),
+        connect=float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", connect_timeout)),
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeouts, **kwargs)
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def pool_stats(client: httpx.AsyncClient) -> dict:
+    """Connection pool occupancy of a client (in use, idle, waiting)"""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    if pool is None:
+        return {"connections": 0, "in_use": 0, "idle": 0, "waiting": 0}
+
+    connections = list(pool.connections)
+    idle = sum(1 for connection in connections if connection.is_idle())
+    waiting = sum(1 for request in list(pool._requests) if request.is_queued())
+    return {
+        "connections": len(connections),
+        "in_use": len(connections) - idle,
+        "idle": idle,
+        "waiting": waiting,
+    }
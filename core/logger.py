@@ -1,11 +1,221 @@
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import random
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# LOG_FORMAT=text|json, LOG_ASYNC moves redaction, line formatting and I/O to a background thread,
+# LOG_SAMPLE_RATES keeps a fraction of INFO logs per message type, e.g. "text=0.1,*=1"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10_000))
+LOG_REDACT = os.getenv("LOG_REDACT", "true").lower() == "true"
+
+def _parse_sample_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        message_type, _, rate = item.partition("=")
+        rates[message_type.strip()] = float(rate)
+    return rates
+
+LOG_SAMPLE_RATES = _parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+# The message being handled by the current task: {"message_type", "wa_id", "sampled"}
+_log_context: ContextVar[Optional[dict]] = ContextVar("log_context", default=None)
+
+@contextmanager
+def message_log_context(message_type: str, wa_id: str = None):
+    """
+    Tag every log record of the block with the message type and sender, and
+    decide once whether its INFO logs are kept (LOG_SAMPLE_RATES).
+    """
+    rate = LOG_SAMPLE_RATES.get(message_type, LOG_SAMPLE_RATES.get("*", 1.0))
+    token = _log_context.set({
+        "message_type": message_type,
+        "wa_id": wa_id,
+        "sampled": rate >= 1.0 or random.random() < rate,
+    })
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+class _Stats:
+    sampled_out = 0
+    dropped = 0
+
+class SampledLogger(logging.Logger):
+    """Answers "disabled" for INFO/DEBUG of unsampled messages, before any record is built"""
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level < logging.WARNING:
+            context = _log_context.get()
+            if context is not None and not context["sampled"]:
+                _Stats.sampled_out += 1
+                return False
+        return super().isEnabledFor(level)
+
+# Set before any logger of this service is created, so get_logger() hands out SampledLoggers
+logging.setLoggerClass(SampledLogger)
+
+class ContextFilter(logging.Filter):
+    """Runs on the calling thread: copies the message context onto the record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        if context is not None:
+            record.message_type = context["message_type"]
+            record.wa_id = context["wa_id"]
+        return True
+
+# Values never worth logging, and personal data that is masked down to a hint
+SECRET_FIELDS = ("token", "access_token", "checksum", "password", "pin", "secret", "secret_key")
+PII_FIELDS = ("phone_number", "card_number", "name", "email", "birth_date", "address", "wa_id")
+
+_secrets: Dict[str, None] = {}
+_MAX_SECRETS = 64
+
+def register_secret(value: str):
+    """Scrub this literal value (a token, a key) from every log line from now on"""
+    if not value or len(value) < 6:
+        return
+    _secrets.pop(value, None)
+    _secrets[value] = None
+    while len(_secrets) > _MAX_SECRETS:
+        del _secrets[next(iter(_secrets))]
+
+def _mask(value: str) -> str:
+    digits = value.strip()
+    if digits.isdigit() and len(digits) > 6:
+        return "*" * (len(digits) - 4) + digits[-4:]
+    return "[PII]" if digits else digits
+
+_FIELD_RE = r"(?P<key>\b(?:{})['\"]?\s*[:=]\s*)(?P<quote>['\"])(?P<value>[^'\"]*)(?P=quote)"
+_SECRET_FIELD_RE = re.compile(_FIELD_RE.format("|".join(SECRET_FIELDS)))
+_PII_FIELD_RE = re.compile(_FIELD_RE.format("|".join(PII_FIELDS)))
+_QUERY_SECRET_RE = re.compile(r"\b((?:access_token|token)=)[^&\s'\"]+")
+_PHONE_RE = re.compile(r"\b(?:62|0)8\d{6,12}\b")
+
+def redact(text: str) -> str:
+    # Substring checks first: most lines carry none of these and skip the regex passes
+    for secret in list(_secrets):
+        if secret in text:
+            text = text.replace(secret, "[REDACTED]")
+    if any(field in text for field in SECRET_FIELDS):
+        text = _SECRET_FIELD_RE.sub(lambda m: f"{m['key']}{m['quote']}[REDACTED]{m['quote']}", text)
+        if "token=" in text:
+            text = _QUERY_SECRET_RE.sub(r"\1[REDACTED]", text)
+    if any(field in text for field in PII_FIELDS):
+        text = _PII_FIELD_RE.sub(lambda m: f"{m['key']}{m['quote']}{_mask(m['value'])}{m['quote']}", text)
+    return _PHONE_RE.sub(lambda m: _mask(m.group(0)), text)
+
+class RedactingFilter(logging.Filter):
+    """Runs where records are written: formats the message once and redacts it"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        record.msg = redact(message)
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = redact(logging.Formatter().formatException(record.exc_info))
+        if getattr(record, "wa_id", None):
+            record.wa_id = _mask(record.wa_id)
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("message_type", "wa_id"):
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread; a full queue drops instead of blocking the loop"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message here, while its args still hold what was logged;
+        # the listener thread only redacts, formats the line and writes it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _Stats.dropped += 1
+
+_handler: Optional[logging.Handler] = None
+_listener: Optional[QueueListener] = None
+_queue: Optional[queue.Queue] = None
+
+def _output_handler() -> logging.Handler:
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s"))
+    if LOG_REDACT:
+        handler.addFilter(RedactingFilter())
+    return handler
+
+def _pipeline_handler() -> logging.Handler:
+    """The handler shared by every logger: queue-backed when LOG_ASYNC, else direct"""
+    global _handler, _listener, _queue
+    if _handler is not None:
+        return _handler
+
+    output = _output_handler()
+    if LOG_ASYNC:
+        _queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _handler = NonBlockingQueueHandler(_queue)
+        _listener = QueueListener(_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        _handler = output
+    _handler.addFilter(ContextFilter())
+    return _handler
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def logging_stats() -> dict:
+    return {
+        "async": LOG_ASYNC,
+        "format": LOG_FORMAT,
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "dropped": _Stats.dropped,
+        "sampled_out": _Stats.sampled_out,
+    }
 
 def get_logger(name: str = "whatsapp_service") -> logging.Logger:
     logger = logging.getLogger(name)
     if not logger.hasHandlers():
-        logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        logger.setLevel(LOG_LEVEL)
+        logger.addHandler(_pipeline_handler())
     return logger
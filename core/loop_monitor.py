@@ -0,0 +1,129 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import List, Optional
+from core.logger import get_logger
+from core.metrics import REGISTRY
+
+logger = get_logger()
+
+LOOP_LAG = REGISTRY.histogram(
+    "wa_event_loop_lag_seconds", "How late the event loop ran a timer scheduled by the lag monitor",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+LOOP_BLOCKED = REGISTRY.counter(
+    "wa_event_loop_blocked", "Times a callback held the event loop longer than the blocking threshold")
+
+class LoopLagMonitor:
+    """
+    A heartbeat task measures how late the loop wakes it up (the lag); a watchdog
+    thread notices when the heartbeat stops for longer than `threshold` and grabs
+    the loop thread's stack, which shows the call that is blocking it.
+    """
+
+    def __init__(self, interval: float = None, threshold: float = None, max_reports: int = None):
+        self.interval = float(interval if interval is not None else os.getenv("LOOP_MONITOR_INTERVAL", 0.1))
+        self.threshold = float(threshold if threshold is not None else os.getenv("LOOP_MONITOR_THRESHOLD", 0.25))
+        self.reports = deque(maxlen=int(max_reports if max_reports is not None else os.getenv("LOOP_MONITOR_MAX_REPORTS", 20)))
+        # The watchdog thread appends while the loop reads
+        self._reports_lock = threading.Lock()
+
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        # Report of the stall in progress, completed by the heartbeat once the loop is back
+        self._open_report: Optional[dict] = None
+
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.blocked = 0
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping.clear()
+        self._heartbeat = asyncio.create_task(self._beat(), name="loop-lag-heartbeat")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info("Event loop monitor started (interval %ss, blocking threshold %ss)", self.interval, self.threshold)
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._stopping.set()
+        self._heartbeat.cancel()
+        await asyncio.gather(self._heartbeat, return_exceptions=True)
+        self._heartbeat = None
+        await asyncio.to_thread(self._watchdog.join, 1.0)
+        self._watchdog = None
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            lag = max(0.0, now - expected)
+            self.samples += 1
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG.observe(lag)
+
+            report = self._open_report
+            if report is not None:
+                self._open_report = None
+                report["blocked_ms"] = round(lag * 1000, 1)
+                logger.warning("Event loop was blocked for %sms; stack at detection:\n%s", report['blocked_ms'], ''.join(report['stack']))
+
+    def _watch(self):
+        poll = max(self.threshold / 4, 0.01)
+        stalled_since = None
+        while not self._stopping.wait(poll):
+            behind = time.monotonic() - self._last_beat - self.interval
+            if behind < self.threshold:
+                stalled_since = None
+                continue
+            if stalled_since == self._last_beat:
+                continue  # Already sampled this stall
+            stalled_since = self._last_beat
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            report = {
+                "detected_at": time.time(),
+                "blocked_ms": None,
+                "blocked_ms_at_detection": round(behind * 1000, 1),
+                "stack": stack,
+            }
+            self.blocked += 1
+            LOOP_BLOCKED.inc()
+            with self._reports_lock:
+                self.reports.append(report)
+            self._open_report = report
+
+    def recent_reports(self) -> List[dict]:
+        with self._reports_lock:
+            return [dict(report) for report in self.reports]
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "threshold_seconds": self.threshold,
+            "samples": self.samples,
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "blocked": self.blocked,
+        }
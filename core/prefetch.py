@@ -0,0 +1,190 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from core.logger import get_logger
+from core.metrics import REGISTRY
+
+logger = get_logger()
+
+PREFETCH_EVENTS = REGISTRY.counter(
+    "wa_prefetch", "Speculative prefetches by outcome (scheduled, skipped, hit, wasted, failed)", ("kind", "outcome"))
+
+class PrefetchedStream:
+    """
+    The items of an async iterator that is read in the background. read()
+    yields what has arrived so far and then waits for the rest, so a consumer
+    can start before the source is exhausted.
+    """
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._more = asyncio.Event()
+
+    async def fill(self, source: AsyncIterator[Any]):
+        try:
+            async with aclosing(source):
+                async for item in source:
+                    self.items.append(item)
+                    self._more.set()
+        except BaseException as e:
+            self.error = e
+            raise
+        finally:
+            self.done = True
+            self._more.set()
+
+    async def read(self) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            while index < len(self.items):
+                yield self.items[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._more.clear()
+            await self._more.wait()
+
+class PrefetchEngine:
+    """
+    Warms data a user is likely to ask for next. schedule() starts the loads in
+    the background and keeps their results for `ttl` seconds; take() hands a
+    result over once (waiting for it if the load is still running), or returns
+    None so the caller loads it the normal way. A stream is handed over as a
+    PrefetchedStream without waiting, so its first items can be used while
+    the rest is still loading.
+
+    At most `max_outstanding` loads run at a time; further schedules are
+    skipped. A prefetched result that expires or is evicted unused counts as
+    wasted, one that is taken as a hit.
+    """
+
+    def __init__(self, ttl: float = None, max_outstanding: int = None, max_entries: int = None, enabled: bool = None):
+        self.enabled = enabled if enabled is not None else os.getenv("PREFETCH", "true").lower() == "true"
+        self.ttl = float(ttl if ttl is not None else os.getenv("PREFETCH_TTL", 60))
+        self.max_outstanding = int(max_outstanding if max_outstanding is not None else os.getenv("PREFETCH_MAX_OUTSTANDING", 100))
+        self.max_entries = int(max_entries if max_entries is not None else os.getenv("PREFETCH_MAX_ENTRIES", 10_000))
+
+        # (kind, key) -> (expires_at, future, stream or None), oldest first; every entry shares the same TTL
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, asyncio.Future, Optional[PrefetchedStream]]]" = OrderedDict()
+        self._tasks = set()
+
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, outcome: str):
+        kind_counts = self.counts.setdefault(kind, {"scheduled": 0, "skipped": 0, "hit": 0, "wasted": 0, "failed": 0})
+        kind_counts[outcome] += 1
+        PREFETCH_EVENTS.labels(kind, outcome).inc()
+
+    @property
+    def outstanding(self) -> int:
+        return len(self._tasks)
+
+    def _sweep(self):
+        now = time.monotonic()
+        while self._entries:
+            (kind, key), (expires_at, future, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[(kind, key)]
+            self._retire(kind, future)
+
+    def _retire(self, kind: str, future: asyncio.Future):
+        """Drop an entry nobody took"""
+        if not future.done():
+            future.cancel()
+        elif not future.cancelled() and future.exception() is None:
+            self._count(kind, "wasted")
+
+    def schedule(self, key: Hashable, loaders: Dict[str, Callable[[], Awaitable[Any]]] = None,
+                 streams: Dict[str, Callable[[], AsyncIterator[Any]]] = None):
+        """Start loading each kind for `key` in the background, unless already prefetched"""
+        if not self.enabled:
+            return
+        self._sweep()
+        for kind, load in (loaders or {}).items():
+            self._start(kind, key, load, None)
+        for kind, open_stream in (streams or {}).items():
+            stream = PrefetchedStream()
+            self._start(kind, key, lambda open_stream=open_stream, stream=stream: stream.fill(open_stream()), stream)
+
+    def _start(self, kind: str, key: Hashable, load: Callable[[], Awaitable[Any]], stream: Optional[PrefetchedStream]):
+        if (kind, key) in self._entries:
+            return
+        if self.outstanding >= self.max_outstanding:
+            self._count(kind, "skipped")
+            return
+        task = asyncio.ensure_future(load())
+        self._tasks.add(task)
+        task.add_done_callback(lambda done, kind=kind: self._finished(kind, done))
+        self._entries[(kind, key)] = (time.monotonic() + self.ttl, task, stream)
+        self._count(kind, "scheduled")
+
+    def _finished(self, kind: str, task: asyncio.Future):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self._count(kind, "failed")
+            logger.debug("Prefetch of %s failed: %s", kind, task.exception())
+
+    async def take(self, kind: str, key: Hashable) -> Optional[Any]:
+        """The prefetched result for `key`, at most once; None when there is none to use"""
+        entry = self._entries.pop((kind, key), None)
+        if entry is None:
+            return None
+        expires_at, future, stream = entry
+        if expires_at <= time.monotonic():
+            self._retire(kind, future)
+            return None
+        if stream is not None:
+            # Failed before it produced anything: let the caller load it instead
+            if stream.done and stream.error is not None and not stream.items:
+                return None
+            self._count(kind, "hit")
+            return stream
+        try:
+            # A load still in flight is joined rather than repeated
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return None
+        self._count(kind, "hit")
+        return result
+
+    def invalidate(self, key: Hashable):
+        """Forget what was prefetched for `key`, e.g. after a write that changes it"""
+        for kind in self.counts:
+            entry = self._entries.pop((kind, key), None)
+            if entry is not None and not entry[1].done():
+                entry[1].cancel()
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        totals = {"scheduled": 0, "skipped": 0, "hit": 0, "wasted": 0, "failed": 0}
+        for kind_counts in self.counts.values():
+            for outcome, count in kind_counts.items():
+                totals[outcome] += count
+        used = totals["hit"] + totals["wasted"]
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl,
+            "outstanding": self.outstanding,
+            "max_outstanding": self.max_outstanding,
+            "entries": len(self._entries),
+            **totals,
+            "hit_rate": round(totals["hit"] / used, 4) if used else 0.0,
+            "by_kind": {kind: dict(kind_counts) for kind, kind_counts in self.counts.items()},
+        }
@@ -0,0 +1,17 @@
+from typing import Dict
+import redis.asyncio as redis
+
+_clients: Dict[str, redis.Redis] = {}
+
+def get_redis(url: str) -> redis.Redis:
+    """Return one shared asyncio Redis client per URL"""
+    client = _clients.get(url)
+    if client is None:
+        client = redis.Redis.from_url(url, decode_responses=True)
+        _clients[url] = client
+    return client
+
+async def close_all():
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
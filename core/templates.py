@@ -0,0 +1,54 @@
+import json
+import re
+from typing import Dict, List, Tuple
+
+def encode_json(value) -> bytes:
+    # Same encoding httpx uses for json=, so the bytes on the wire do not change
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+def slot(name: str) -> str:
+    """Placeholder for a value spliced in at render time; may sit anywhere inside a string"""
+    return f"\x00{name}\x00"
+
+_SLOT_RE = re.compile(rb"\\u0000(\w+)\\u0000")
+
+class CompiledTemplate:
+    """
+    A JSON payload encoded once into byte segments with splice points. Rendering
+    JSON-escapes each value and joins it between the fixed segments.
+    """
+
+    def __init__(self, payload: dict):
+        encoded = encode_json(payload)
+        self.segments: List[bytes] = []
+        self.slots: List[str] = []
+
+        position = 0
+        for match in _SLOT_RE.finditer(encoded):
+            self.segments.append(encoded[position:match.start()])
+            self.slots.append(match.group(1).decode())
+            position = match.end()
+        self.segments.append(encoded[position:])
+
+    def render(self, **values: str) -> bytes:
+        parts = [self.segments[0]]
+        for name, segment in zip(self.slots, self.segments[1:]):
+            # Strip the quotes: the slot already lives inside a JSON string
+            parts.append(encode_json(str(values[name]))[1:-1])
+            parts.append(segment)
+        return b"".join(parts)
+
+class TemplateRegistry:
+    def __init__(self):
+        self._templates: Dict[str, CompiledTemplate] = {}
+
+    def register(self, name: str, payload: dict) -> CompiledTemplate:
+        template = CompiledTemplate(payload)
+        self._templates[name] = template
+        return template
+
+    def render(self, name: str, **values: str) -> bytes:
+        return self._templates[name].render(**values)
+
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self._templates)
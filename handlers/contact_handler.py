@@ -11,18 +11,18 @@ class ContactHandler:
         """Extract profile name from contact object"""
         try:
             profile_name = contact.get("profile", {}).get("name")
-            logger.info(f"Profile Name: {profile_name}")
+            logger.info("Profile Name: %s", profile_name)
             return profile_name
         except Exception as e:
-            logger.error(f"Error extracting profile name: {e}")
+            logger.error("Error extracting profile name: %s", e)
             return "Unknown"
         
     async def get_phone_number(self, contact: dict) -> str:
         """Extract phone number from contact object"""
         try:
             phone_number = contact.get("wa_id")
-            logger.info(f"Phone Number: {phone_number}")
+            logger.info("Phone Number: %s", phone_number)
             return phone_number
         except Exception as e:
-            logger.error(f"Error extracting phone number: {e}")
+            logger.error("Error extracting phone number: %s", e)
             return "Unknown"
\ No newline at end of file
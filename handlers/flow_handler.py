@@ -69,5 +69,5 @@ class FlowHandler:
                 }
             }
         
-        logger.info(f"CONFIRMATION DATA FROM FLOW | {response}")
+        logger.info("CONFIRMATION DATA FROM FLOW | %s", response)
         return response
@@ -2,29 +2,37 @@ import json
 from services.whatsapp_service import WhatsAppService
 from services.plms_service import PLMSService
 from handlers.contact_handler import ContactHandler
+from services.conversation_state import ConversationStateStore
 from globals.constants import Menu
 from globals.constants import WAFlow
 from core.logger import get_logger
+from core.prefetch import PrefetchEngine
+from core.metrics import HANDLER_DURATION, timed
 
 logger = get_logger()
 
 class MessageHandler:
-    def __init__(self, whatsapp_service: WhatsAppService, plms_service: PLMSService):
+    def __init__(self, whatsapp_service: WhatsAppService, plms_service: PLMSService, state_store: ConversationStateStore = None,
+                 prefetch: PrefetchEngine = None):
         from handlers.plms_handler import PLMSHandler
         
         self.flow_token_activation = WAFlow.WAFLOW_TOKEN_ACTIVATE
         self.whatsapp_service = whatsapp_service
+        self.state_store = state_store or ConversationStateStore()
         self.contact_handler = ContactHandler(whatsapp_service)
-        self.plms_handler = PLMSHandler(whatsapp_service, plms_service)
+        self.plms_handler = PLMSHandler(whatsapp_service, plms_service, self.state_store, prefetch)
 
+    @timed(HANDLER_DURATION, handler="MessageHandler.handle_text_message")
     async def handle_text_message(self, phone_number: str, text: str, username: str):
         if text.lower() == "konfirmasi":
             await self.plms_handler.tnc_inquiry_commit(phone_number)   
         else:
             await self.whatsapp_service.send_greetings(phone_number, username)
 
+    @timed(HANDLER_DURATION, handler="MessageHandler.handle_list_reply")
     async def handle_list_reply(self, phone_number: str, interactive_data: dict):
         reply_id = interactive_data.get("id")
+        await self.state_store.update(phone_number, menu=reply_id)
         
         if reply_id == Menu.MEMBER:
             await self.plms_handler.validate_member(phone_number)
@@ -56,10 +64,11 @@ class MessageHandler:
         else:
             await self.whatsapp_service.send_message(phone_number, "Menu tidak dikenali.")
     
+    @timed(HANDLER_DURATION, handler="MessageHandler.handle_nfm_reply")
     async def handle_nfm_reply(self, phone_number: str, interactive_data: dict):    
         try:
             flowData = interactive_data.get("response_json")
-            logger.info(f"RESPONSE FROM FLOW {flowData}")
+            logger.info("RESPONSE FROM FLOW %s", flowData)
             responseJSON = json.loads(flowData)
             
             # Handle Member Activation Response
@@ -71,11 +80,13 @@ class MessageHandler:
                 logger.error("Validation Error. Activation Token Not Found")
             
         except Exception as e:
-            logger.error(f"Error in handle_nfm_reply: {str(e)}", exc_info=True) 
+            logger.error("Error in handle_nfm_reply: %s", str(e), exc_info=True) 
             
     
+    @timed(HANDLER_DURATION, handler="MessageHandler.handle_button_reply")
     async def handle_button_reply(self, phone_number: str, interactive_data: dict):
         button_id =  interactive_data.get("id")
+        await self.state_store.update(phone_number, menu=button_id)
         
         if button_id == "go-back-main-menu" :
             await self.whatsapp_service.send_main_menu(phone_number, "Silahkan pilih layanan yang tersedia.")
@@ -1,55 +1,104 @@
 from services.whatsapp_service import WhatsAppService
 from services.plms_service import PLMSService
+from services.tnc_flow import TncFlow
+from services.conversation_state import ConversationStateStore
+from core.chunker import MessageChunker
+from core.circuit_breaker import CircuitOpenError
 from core.logger import get_logger
+from core.prefetch import PrefetchEngine
+from core.metrics import HANDLER_DURATION, timed
+from contextlib import aclosing
 from datetime import datetime, time, timedelta
+from typing import AsyncIterator, Tuple
+import asyncio
+import httpx
 
 logger = get_logger()
 
+# PLMS is down, unreachable or too slow: the user gets a "try again later" reply instead of
+# silence. HTTPStatusError is narrowed to 5xx answers in plms_unavailable().
+PLMS_UNAVAILABLE = (CircuitOpenError, httpx.TransportError, httpx.HTTPStatusError)
+
 class PLMSHandler:
-    def __init__(self, whatsapp_service: WhatsAppService, plms_service: PLMSService):
+    def __init__(self, whatsapp_service: WhatsAppService, plms_service: PLMSService, state_store: ConversationStateStore = None,
+                 prefetch: PrefetchEngine = None):
         self.plms_service = plms_service
         self.whatsapp_service = whatsapp_service
+        self.state_store = state_store or ConversationStateStore()
+        self.prefetch = prefetch or PrefetchEngine()
+        self.tnc_flow = TncFlow(plms_service)
         
+    @timed(HANDLER_DURATION, handler="PLMSHandler.member_activation_status")
     async def member_activation_status(self, phone_number: str, register_data: dict):
         try :
-            result = self.plms_service.member_activation(phone_number, register_data)
+            result = await self.plms_service.member_activation(phone_number, register_data)
             code = result.get("response_code")
             
+            # The outcome of an activation must reach the user: send it through the outbox
             if code == "00":
-                await self.validate_tnc(phone_number)
+                await self.state_store.clear(phone_number)
+                self.prefetch.invalidate(phone_number)
+                await self.validate_tnc(phone_number, durable=True)
             elif code == "E050":
-                await self.whatsapp_service.send_message(phone_number, f"Pendaftaran gagal.\n\nNomor anda {phone_number} telah terdaftar sebagai member.")
+                await self.state_store.update(phone_number, is_member=True)
+                await self.whatsapp_service.send_message(phone_number, f"Pendaftaran gagal.\n\nNomor anda {phone_number} telah terdaftar sebagai member.", durable=True)
             else : 
-                await self.whatsapp_service.send_message(phone_number, "Terjadi gangguan. Mohon tunggu")
+                await self.whatsapp_service.send_message(phone_number, "Terjadi gangguan. Mohon tunggu", durable=True)
+            
+        except PLMS_UNAVAILABLE as e:
+            await self.plms_unavailable(phone_number, "member activation", e, durable=True)
             
         except Exception as e:
-            logger.error(f"Error during member activation: {e}", exc_info=True)
+            logger.error("Error during member activation: %s", e, exc_info=True)
             
+    @timed(HANDLER_DURATION, handler="PLMSHandler.validate_member")
     async def validate_member(self, phone_number: str):
 
         try :
-            result = self.plms_service.validate_member(phone_number)
+            state = await self.state_store.get(phone_number)
+            if state is not None and state.verified_member:
+                # validatemember and tnc/info would only confirm what we already know
+                self.state_store.record_saved_calls(2)
+                await self.send_member_menu(phone_number, state.card_number)
+                return
+
+            result = await self.plms_service.validate_member(phone_number)
             code = result.get("response_code")
                 
             if code == "00":
-                await self.validate_tnc(phone_number)   
+                await self.state_store.update(phone_number, is_member=True, card_number=result.get("card_number", ""))
+                await self.validate_tnc(phone_number, result.get("card_number", ""))   
             elif code == "E073":
                 # Not a member: show registration option
+                await self.state_store.update(phone_number, is_member=False, card_number=None)
                 await self.whatsapp_service.send_activation_menu(phone_number)
             else:
                 await self.whatsapp_service.send_message(phone_number, "Terjadi gangguan. Mohon tunggu")
                 
+        except PLMS_UNAVAILABLE as e:
+            await self.plms_unavailable(phone_number, "member validation", e)
+            
         except Exception as e:
-            logger.error(f"Error during auto member validation: {e}", exc_info=True)
+            logger.error("Error during auto member validation: %s", e, exc_info=True)
             
-    async def validate_tnc(self, phone_number: str):
+    @timed(HANDLER_DURATION, handler="PLMSHandler.validate_tnc")
+    async def validate_tnc(self, phone_number: str, card_number: str = None, durable: bool = False):
         try:
-            result = self.plms_service.validate_member(phone_number)
-            card_number = result.get("card_number", "")
-            
-            tnc_info = self.plms_service.tnc_info(phone_number)
+            if card_number is None:
+                result, tnc_info = await asyncio.gather(
+                    self.plms_service.validate_member(phone_number),
+                    self.plms_service.tnc_info(phone_number),
+                )
+                card_number = result.get("card_number", "")
+                if result.get("response_code") == "00":
+                    await self.state_store.update(phone_number, is_member=True, card_number=card_number)
+            else:
+                tnc_info = await self.plms_service.tnc_info(phone_number)
+                
             tnc_flag = tnc_info.get("flag")
             tnc_url = tnc_info.get("link")
+            if tnc_flag:
+                await self.state_store.update(phone_number, tnc_accepted=tnc_flag != "F")
             
             if tnc_flag == "F":
                 await self.whatsapp_service.send_cta_url_message(
@@ -58,41 +107,77 @@ class PLMSHandler:
                     "Terms & Condition",
                     "Syarat & Ketentuan",
                     "Anda belum mensetujui syarat dan ketentuan member Alfamidi.\n\n"
-                    "_Klik tombol di bawah ini untuk ke halaman syarat dan ketentuan._"
+                    "_Klik tombol di bawah ini untuk ke halaman syarat dan ketentuan._",
+                    durable=durable
                     )  
                   
                 await self.whatsapp_service.send_message(phone_number, 'Silahkan ketik kata "*KONFIRMASI*" '
-                                                         'dan kirimkan jika anda sudah melakukan konfirmasi syarat dan ketentuan.')           
+                                                         'dan kirimkan jika anda sudah melakukan konfirmasi syarat dan ketentuan.',
+                                                         durable=durable)           
             else:
-                await self.whatsapp_service.send_member_services_menu(phone_number, f"Anda berada di dalam layanan member.\n\n"
-                                                                        f"- Nomor kartu Anda: *{card_number}*\n\n"
-                                                                        "Silahkan pilih layanan member yang tersedia.")            
+                await self.send_member_menu(phone_number, card_number, durable=durable)
                 
+        except PLMS_UNAVAILABLE as e:
+            await self.plms_unavailable(phone_number, "TNC validation", e, durable=durable)
+            
+        except Exception as e:
+            logger.error("Error during TNC validation: %s", e, exc_info=True)
+
+    async def send_member_menu(self, phone_number: str, card_number: str, durable: bool = False):
+        await self.whatsapp_service.send_member_services_menu(phone_number, f"Anda berada di dalam layanan member.\n\n"
+                                                                f"- Nomor kartu Anda: *{card_number}*\n\n"
+                                                                "Silahkan pilih layanan member yang tersedia.",
+                                                                durable=durable)
+        self.prefetch_member_data(phone_number)
+        
+    def prefetch_member_data(self, phone_number: str):
+        """The member menu is open: Cek Poin or Riwayat Transaksi is most likely the next tap"""
+        self.prefetch.schedule(
+            phone_number,
+            loaders={"inquiry": lambda: self.plms_service.inquiry(phone_number)},
+            # Streamed, so the first rows can be sent while later pages are still loading
+            streams={"history": lambda: self.transaction_history_rows(phone_number)},
+        )
+            
+    async def plms_unavailable(self, phone_number: str, during: str, error: Exception, durable: bool = False):
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code < 500:
+            # PLMS rejected the request; retrying later will not help
+            logger.error("Error during %s: %s", during, error, exc_info=error)
+            return
+        logger.warning("PLMS unavailable during %s: %s", during, error)
+        await self.send_unavailable(phone_number, durable)
+
+    async def send_unavailable(self, phone_number: str, durable: bool = False):
+        try:
+            await self.whatsapp_service.send_message(phone_number, "Terjadi gangguan. Mohon tunggu beberapa saat dan coba lagi.", durable=durable)
         except Exception as e:
-            logger.error(f"Error during TNC validation: {e}", exc_info=True)
+            logger.error("Failed to tell %s that PLMS is unavailable: %s", phone_number, e)
             
+    @timed(HANDLER_DURATION, handler="PLMSHandler.tnc_inquiry_commit")
     async def tnc_inquiry_commit(self, phone_number: str):
         try:
-            result = self.plms_service.validate_member(phone_number)
-            card_number = result.get("card_number", "")
-            tnc_inquiry = self.plms_service.tnc_inquiry(phone_number)
-            response_inquiry = tnc_inquiry.get("response_code")
+            flow = await self.tnc_flow.run(phone_number)
+            card_number = flow.card_number
+            response_inquiry = flow.inquiry_code
             
             if response_inquiry == "00":
-                tnc_commit = self.plms_service.tnc_commit(phone_number)
-                response_commit = tnc_commit.get("response_code")
+                response_commit = flow.commit_code
 
                 if response_commit == "00":
+                                    await self.state_store.update(phone_number, is_member=True, card_number=card_number, tnc_accepted=True)
                                     await self.whatsapp_service.send_member_services_menu(phone_number, f"Yeay 🎉! Selamat anda telah terdaftar ke dalam member.\n\n"
                                                                     f"- Nomor kartu Anda: *{card_number}*\n\n"
-                                                                    "_Silahkan pilih layanan member yang tersedia._")       
+                                                                    "_Silahkan pilih layanan member yang tersedia._",
+                                                                    durable=True)       
+                                    self.prefetch_member_data(phone_number)
                 else :
                     logger.error("Invalid Token")
                     await self.whatsapp_service.send_message_with_button(phone_number, "Gagal memproses.\n\nIngin kembali ke halaman utama atau mengulangi T&C?",
                                                                     [
                                                                         {"id": "go-back-main-menu", "title": "Kembali"},
                                                                         {"id": "validate-tnc", "title": "Terms & Condition"}
-                                                                    ])
+                                                                    ],
+                                                                    durable=True)
                     
             elif response_inquiry == "E110":
                 await self.whatsapp_service.send_message_with_button(phone_number, "Anda belum mensetujui syarat dan ketentuan.\n\nIngin kembali ke halaman utama atau mengulangi T&C?",
@@ -112,13 +197,17 @@ class PLMSHandler:
                 logger.error("Invalid Session Error")
                 
             
+        except PLMS_UNAVAILABLE as e:
+            await self.plms_unavailable(phone_number, "TNC inquiry and commit", e)
+            
         except Exception as e:   
-            logger.error(f"Error during TNC Inquiry and Commit: {e}", exc_info=True)  
+            logger.error("Error during TNC Inquiry and Commit: %s", e, exc_info=True)  
     
     
+    @timed(HANDLER_DURATION, handler="PLMSHandler.check_point_member")
     async def check_point_member(self, phone_number: str):
         try:
-            result = self.plms_service.inquiry(phone_number)
+            result = await self.prefetch.take("inquiry", phone_number) or await self.plms_service.inquiry(phone_number)
             card_number = result.get("card_number", "")
             total_points = result.get("redeemable_pool_units", 0)
             
@@ -152,60 +241,88 @@ class PLMSHandler:
                                                                 {"id": "go-back-member-menu", "title": "Kembali"}
                                                             ])
             
+        except PLMS_UNAVAILABLE as e:
+            await self.plms_unavailable(phone_number, "Cek Poin", e)
+            
         except Exception as e:
-            logger.error(f"Error during Cek Poin Member: {e}", exc_info=True)
+            logger.error("Error during Cek Poin Member: %s", e, exc_info=True)
             
 
+    @staticmethod
+    def history_window() -> Tuple[str, str]:
+        # The last 2 weeks, up to and including today
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=14)
+        return start_date.strftime("%Y%m%d"), end_date.strftime("%Y%m%d")
+
+    def transaction_history_rows(self, phone_number: str) -> AsyncIterator[dict]:
+        start_date_str, end_date_str = self.history_window()
+        return self.plms_service.transaction_history_rows(
+            phone_number=phone_number,
+            startDate=start_date_str,
+            endDate=end_date_str
+        )
+
+    @staticmethod
+    def format_transaction(trx: dict) -> str:
+        trx_date_raw = trx.get("transaction_date", "").split(" ")[0]
+        formatted_date = datetime.strptime(trx_date_raw, "%Y-%m-%d").strftime("%d/%m/%Y")
+        place = trx.get("transaction_place", "Toko")
+        point = trx.get("point", 0)
+        status = trx.get("status", "").lower()
+
+        if status == "award":
+            return f"Tgl {formatted_date} di {place} mendapatkan {point} poin\n"
+        elif status == "redeem":
+            return f"Tgl {formatted_date} di {place} transaksi dengan {abs(point)} poin\n"
+        # fallback for unknown status
+        return f"Tgl {formatted_date} di {place} dengan status {status} sejumlah {point} poin\n"
+
+    @timed(HANDLER_DURATION, handler="PLMSHandler.transaction_history_summary")
     async def transaction_history_summary(self, phone_number: str):
+        """
+        Stream the history rows into messages: a full text message goes out as
+        soon as it is complete, while the following page is still loading. The
+        last part carries the "Kembali" button, whose body is shorter. A
+        prefetched history is read the same way, while it is still loading.
+        """
         try:
-            # Calculate date range
-            start_date = datetime.now()
-            end_date = start_date + timedelta(days=14)
-            start_date_str = start_date.strftime("%Y%m%d")
-            end_date_str = end_date.strftime("%Y%m%d")
-
-            # Call PLMS transaction history service
-            result = self.plms_service.transaction_history(
-                phone_number=phone_number,
-                startDate=start_date_str,
-                endDate=end_date_str
-            )
+            prefetched = await self.prefetch.take("history", phone_number)
+            history = prefetched.read() if prefetched is not None else self.transaction_history_rows(phone_number)
+
+            chunker = MessageChunker(WhatsAppService.TEXT_BODY_LIMIT, "Riwayat transaksi poin.\n\n")
+            rows = 0
+            async with aclosing(history):
+                async for trx in history:
+                    rows += 1
+                    chunk = chunker.add(self.format_transaction(trx))
+                    if chunk:
+                        await self.whatsapp_service.send_message(phone_number, chunk)
 
-            history = result.get("history", [])
-            if not history:
+            if not rows:
                 await self.whatsapp_service.send_message(
                     phone_number, 
                     "Belum ada transaksi poin dalam 2 minggu terakhir."
                 )
                 return
 
-            # Format the message
-            message = "Riwayat transaksi poin.\n\n"
-            for trx in history:
-                trx_date_raw = trx.get("transaction_date", "").split(" ")[0]
-                formatted_date = datetime.strptime(trx_date_raw, "%Y-%m-%d").strftime("%d/%m/%Y")
-                place = trx.get("transaction_place", "Toko")
-                point = trx.get("point", 0)
-                status = trx.get("status", "").lower()
-
-                if status == "award":
-                    message += f"Tgl {formatted_date} di {place} mendapatkan {point} poin\n"
-                elif status == "redeem":
-                    message += f"Tgl {formatted_date} di {place} transaksi dengan {abs(point)} poin\n"
-                else:
-                    # fallback for unknown status
-                    message += f"Tgl {formatted_date} di {place} dengan status {status} sejumlah {point} poin\n"
-
-            message += (
+            # The footer can fill up the pending chunk, which then goes out on its own
+            full = chunker.add(
                 "\nGunakan terus kartu member *Alfamidi* setiap melakukan transaksi\n"
                 "_Download aplikasi_ *_MIDIKRIING_* _untuk penukaran poin dan dapatkan promo2 Spesial Redeem lainnya._"
             )
+            *texts, message = chunker.finish(WhatsAppService.INTERACTIVE_BODY_LIMIT)
+            for text in ([full] if full else []) + texts:
+                await self.whatsapp_service.send_message(phone_number, text)
 
             await self.whatsapp_service.send_message_with_button(phone_number, message,
                                                             [
                                                                 {"id": "go-back-member-menu", "title": "Kembali"}
                                                             ])
 
+        except PLMS_UNAVAILABLE as e:
+            await self.plms_unavailable(phone_number, "transaction history", e)
+            
         except Exception as e:
-            logger.error(f"Error during transaction history summary: {e}", exc_info=True)
+            logger.error("Error during transaction history summary: %s", e, exc_info=True)
            
\ No newline at end of file
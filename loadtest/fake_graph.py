@@ -0,0 +1,78 @@
+"""
+In-process stand-in for the WhatsApp Cloud API messages endpoint. It accepts
+POST /{version}/{phone_number_id}/messages, records what each recipient was
+sent and lets waiters know when a reply arrives. `error_rate` answers HTTP 500
+and `throttle_rate` answers 429 with error code 130429 and a Retry-After.
+"""
+import asyncio
+import random
+import uuid
+from typing import Dict, List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+class FakeGraph:
+    def __init__(self, latency: tuple = (0.0, 0.0), error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 1.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.messages: Dict[str, List[dict]] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self.requests = 0
+        self.injected_errors = 0
+        self.injected_throttles = 0
+
+    def wait_for_reply(self, recipient: str) -> asyncio.Future:
+        """Future resolved with the next message delivered to `recipient`"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(recipient, []).append(future)
+        return future
+
+    def _deliver(self, recipient: str, payload: dict):
+        self.messages.setdefault(recipient, []).append(payload)
+        for future in self._waiters.pop(recipient, []):
+            if not future.done():
+                future.set_result(payload)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "delivered": sum(len(messages) for messages in self.messages.values()),
+            "recipients": len(self.messages),
+            "injected_errors": self.injected_errors,
+            "injected_throttles": self.injected_throttles,
+        }
+
+    def create_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/{version}/{phone_number_id}/messages")
+        async def messages(version: str, phone_number_id: str, request: Request):
+            payload = await request.json()
+            self.requests += 1
+            low, high = self.latency
+            if high > 0:
+                await asyncio.sleep(random.uniform(low, high))
+
+            if self.throttle_rate and random.random() < self.throttle_rate:
+                self.injected_throttles += 1
+                return JSONResponse(
+                    {"error": {"message": "Too many messages", "code": 130429}},
+                    status_code=429,
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            if self.error_rate and random.random() < self.error_rate:
+                self.injected_errors += 1
+                return JSONResponse({"error": {"message": "Injected Graph API error", "code": 1}}, status_code=500)
+
+            recipient = payload.get("to", "")
+            self._deliver(recipient, payload)
+            return {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": recipient, "wa_id": recipient}],
+                "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+            }
+
+        return app
@@ -0,0 +1,189 @@
+"""
+In-process stand-in for the PLMS partner API. It keeps just enough state to
+notice a request built from another user's data: checksums are verified
+against the token in the payload, and a tnc/commit only succeeds with the
+member_id that belongs to the owner of its q session.
+
+Faults can be injected: `error_rate` answers HTTP 500 and `expire_rate`
+revokes the caller's token and answers E004, as PLMS does when it expires.
+"""
+import asyncio
+import hashlib
+import random
+import uuid
+from datetime import date, timedelta
+from fastapi import FastAPI, HTTPException, Request
+from globals.constants import PLMSSecretKey, PLMSUser
+
+def _checksum(*parts) -> str:
+    return hashlib.sha256(("".join(str(p) for p in parts) + PLMSSecretKey.SECRET_KEY.value).encode()).hexdigest()
+
+class FakePLMS:
+    def __init__(self, latency: tuple = (0.0, 0.0), error_rate: float = 0.0, expire_rate: float = 0.0,
+                 history_days: int = 30):
+        self.latency = latency
+        self.history_days = history_days
+        self.error_rate = error_rate
+        self.expire_rate = expire_rate
+        self.tokens = set()
+        self.sessions = {}
+        # Members who committed the T&C; tnc/info answers flag T for them
+        self.accepted = set()
+        self.crossovers = []
+        self.requests = 0
+        self.requests_by_path = {}
+        self.injected_errors = 0
+        self.injected_expiries = 0
+
+    def expire_tokens(self):
+        """Make every issued token answer E004 from now on"""
+        self.tokens.clear()
+
+    async def _delay(self):
+        self.requests += 1
+        low, high = self.latency
+        if high > 0:
+            await asyncio.sleep(random.uniform(low, high))
+
+    async def _receive(self, request: Request) -> dict:
+        """Count and delay the request, then return its body or raise an injected fault"""
+        body = await request.json()
+        path = request.url.path
+        self.requests_by_path[path] = self.requests_by_path.get(path, 0) + 1
+        await self._delay()
+        if self.error_rate and random.random() < self.error_rate:
+            self.injected_errors += 1
+            raise HTTPException(status_code=500, detail="Injected PLMS error")
+        if self.expire_rate and path != "/login" and random.random() < self.expire_rate:
+            self.injected_expiries += 1
+            self.tokens.discard(body.get("token"))
+        return body
+
+    def _history(self, start_date: str, end_date: str) -> list:
+        """`history_days` days of transactions, one a day, newest first, within the window"""
+        rows = []
+        today = date.today()
+        for days_ago in range(self.history_days):
+            day = today - timedelta(days=days_ago)
+            if not start_date <= day.strftime("%Y%m%d") <= end_date:
+                continue
+            redeem = days_ago % 4 == 3
+            rows.append({
+                "transaction_date": f"{day.isoformat()} 10:{days_ago % 60:02d}:00",
+                "transaction_place": f"Alfamidi {days_ago % 7 + 1}",
+                "point": -(5 + days_ago) if redeem else 10 + days_ago,
+                "status": "redeem" if redeem else "award",
+            })
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "by_path": dict(self.requests_by_path),
+            "injected_errors": self.injected_errors,
+            "injected_expiries": self.injected_expiries,
+            "crossovers": len(self.crossovers),
+        }
+
+    def _invalid(self, body: dict, *parts) -> dict:
+        if body.get("token") not in self.tokens:
+            return {"response_code": "E004", "response_message": "Token expired"}
+        if body.get("checksum") != _checksum(*parts, body.get("token")):
+            return {"response_code": "E002", "response_message": "Invalid checksum"}
+        return None
+
+    def create_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/login")
+        async def login(request: Request):
+            body = await self._receive(request)
+            if body.get("checksum") != _checksum(PLMSUser.USERNAME.value, PLMSUser.PASSWORD.value):
+                return {"response_code": "E002"}
+            token = uuid.uuid4().hex
+            self.tokens.add(token)
+            return {"response_code": "00", "token": token}
+
+        @app.post("/validatemember")
+        async def validate_member(request: Request):
+            body = await self._receive(request)
+            error = self._invalid(body, body.get("mode"), body.get("id"))
+            if error:
+                return error
+            return {"response_code": "00", "card_number": f"C{body['id']}"}
+
+        @app.post("/inquiry")
+        async def inquiry(request: Request):
+            body = await self._receive(request)
+            error = self._invalid(body, body.get("mode"), body.get("id"), body.get("with_balance"))
+            if error:
+                return error
+            return {
+                "response_code": "00",
+                "card_number": f"C{body['id']}",
+                "redeemable_pool_units": 1250,
+                "eeb_pool_units": [100],
+                "eeb_date": ["20261231"],
+            }
+
+        @app.post("/tnc/info")
+        async def tnc_info(request: Request):
+            body = await self._receive(request)
+            error = self._invalid(body, body.get("mode"), body.get("id"), body.get("action"))
+            if error:
+                return error
+            q = uuid.uuid4().hex
+            self.sessions[q] = body["id"]
+            flag = "T" if body["id"] in self.accepted else "F"
+            return {"response_code": "00", "flag": flag, "q": q, "link": f"https://plms.local/tnc/{q}"}
+
+        @app.post("/tnc/inquiry")
+        async def tnc_inquiry(request: Request):
+            body = await self._receive(request)
+            error = self._invalid(body, body.get("q"))
+            if error:
+                return error
+            owner = self.sessions.get(body.get("q"))
+            if owner is None:
+                return {"response_code": "E111", "response_message": "Invalid session"}
+            return {"response_code": "00", "member_id": f"M{owner}"}
+
+        @app.post("/tnc/commit")
+        async def tnc_commit(request: Request):
+            body = await self._receive(request)
+            error = self._invalid(body, body.get("q"), body.get("member_id"))
+            if error:
+                return error
+            owner = self.sessions.pop(body.get("q"), None)
+            if owner is None:
+                return {"response_code": "E111", "response_message": "Invalid session"}
+            if body.get("member_id") != f"M{owner}":
+                self.crossovers.append((owner, body.get("member_id")))
+                return {"response_code": "E112", "response_message": "Session does not belong to member"}
+            self.accepted.add(owner)
+            return {"response_code": "00"}
+
+        @app.post("/transactionhistory")
+        async def transaction_history(request: Request):
+            body = await self._receive(request)
+            error = self._invalid(body, body.get("mode"), body.get("id"), body.get("start_date"), body.get("end_date"),
+                                  body.get("page"), body.get("list_item"))
+            if error:
+                return error
+            rows = self._history(body["start_date"], body["end_date"])
+            page, size = int(body.get("page", 1)), int(body.get("list_item", 20))
+            return {
+                "response_code": "00",
+                "history": rows[(page - 1) * size:page * size],
+                "total_data": len(rows),
+                "total_page": max(1, -(-len(rows) // size)),
+            }
+
+        @app.post("/memberactivation")
+        async def member_activation(request: Request):
+            body = await self._receive(request)
+            if body.get("token") not in self.tokens:
+                return {"response_code": "E004"}
+            return {"response_code": "00"}
+
+        return app
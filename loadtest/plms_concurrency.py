@@ -0,0 +1,64 @@
+"""
+Concurrency stress check for PLMSService: drives many users through the T&C
+pipeline and the member lookups at once against the in-process PLMS stand-in,
+and fails if any request carried another user's session, member id or card.
+
+    python -m loadtest.plms_concurrency --users 500 --max-latency 0.05
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import httpx
+from loadtest.fake_plms import FakePLMS
+from services.plms_service import PLMSService
+from services.tnc_flow import TncFlow
+
+async def run_user(plms_service: PLMSService, tnc_flow: TncFlow, phone_number: str) -> list:
+    local = PLMSService.normalize_phone(phone_number)
+    errors = []
+
+    flow, member, inquiry = await asyncio.gather(
+        tnc_flow.run(phone_number),
+        plms_service.validate_member(phone_number),
+        plms_service.inquiry(phone_number),
+    )
+    if flow.card_number != f"C{local}":
+        errors.append(f"{phone_number}: flow card {flow.card_number}")
+    if flow.member_id != f"M{local}":
+        errors.append(f"{phone_number}: flow member_id {flow.member_id}")
+    if flow.commit_code != "00":
+        errors.append(f"{phone_number}: commit {flow.commit}")
+    if member.get("card_number") != f"C{local}":
+        errors.append(f"{phone_number}: validate_member {member}")
+    if inquiry.get("card_number") != f"C{local}":
+        errors.append(f"{phone_number}: inquiry {inquiry}")
+    return errors
+
+async def main(users: int, min_latency: float, max_latency: float) -> int:
+    logging.getLogger("whatsapp_service").setLevel(logging.WARNING)
+
+    fake = FakePLMS(latency=(min_latency, max_latency))
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.create_app()))
+    plms_service = PLMSService(client=client, endpoint="http://plms.local")
+    tnc_flow = TncFlow(plms_service)
+
+    phones = [f"62812{i:07d}" for i in range(users)]
+    try:
+        results = await asyncio.gather(*(run_user(plms_service, tnc_flow, phone) for phone in phones))
+    finally:
+        await plms_service.aclose()
+
+    errors = [error for user_errors in results for error in user_errors]
+    for error in errors[:20]:
+        print(f"LEAK {error}")
+    print(f"users={users} upstream_requests={fake.requests} errors={len(errors)} crossovers={len(fake.crossovers)}")
+    return 1 if errors or fake.crossovers else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--min-latency", type=float, default=0.0)
+    parser.add_argument("--max-latency", type=float, default=0.02)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.users, args.min_latency, args.max_latency)))
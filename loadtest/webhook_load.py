@@ -0,0 +1,211 @@
+"""
+Load generator: replays WhatsApp conversations (greeting, member menu, T&C
+confirmation, points, history, back to the menus) against the webhook and
+reports throughput and p50/p95/p99 latency.
+
+The fake Graph API and PLMS servers always run inside this process; a turn's
+reply latency is the time from posting the webhook until the fake Graph API
+receives the bot's answer. By default webhooks.py runs in this process as
+well. For figures not shared with the load generator's own CPU, start it
+separately with WHATSAPP_BASE_URL / PLMS_ENDPOINT pointing at the fakes and
+pass --target:
+
+    python -m loadtest.webhook_load --conversations 500 --concurrency 100
+    WHATSAPP_BASE_URL=http://127.0.0.1:9001/v20.0 PLMS_ENDPOINT=http://127.0.0.1:9002 python webhooks.py
+    python -m loadtest.webhook_load --target http://127.0.0.1:3006 --graph-port 9001 --plms-port 9002
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+import httpx
+import uvicorn
+from globals.constants import Menu
+from loadtest.fake_graph import FakeGraph
+from loadtest.fake_plms import FakePLMS
+
+PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID") or "100000000000000"
+
+def text_turn(body: str) -> dict:
+    return {"type": "text", "text": {"body": body}}
+
+def list_turn(reply_id: str) -> dict:
+    return {"type": "interactive", "interactive": {"type": "list_reply", "list_reply": {"id": reply_id, "title": reply_id}}}
+
+def button_turn(button_id: str) -> dict:
+    return {"type": "interactive", "interactive": {"type": "button_reply", "button_reply": {"id": button_id, "title": button_id}}}
+
+def conversation() -> List[dict]:
+    """A member session: the T&C confirmation only happens on a first visit"""
+    return [
+        text_turn("Halo"),
+        list_turn(Menu.MEMBER.value),
+        text_turn("konfirmasi"),
+        list_turn(Menu.MEMBER_CEK_POIN.value),
+        list_turn(Menu.MEMBER_RIWAYAT_TRANSAKSI_POIN.value),
+        button_turn("go-back-member-menu"),
+        list_turn(Menu.MAIN_MENU.value),
+    ]
+
+def webhook_body(wa_id: str, message: dict) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "0",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "6200000000", "phone_number_id": PHONE_NUMBER_ID},
+                    "contacts": [{"profile": {"name": f"Load {wa_id[-4:]}"}, "wa_id": wa_id}],
+                    "messages": [{"id": f"wamid.{uuid.uuid4().hex}", "from": wa_id, "timestamp": str(int(time.time())), **message}],
+                },
+            }],
+        }],
+    }
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+class Results:
+    def __init__(self):
+        self.http_latency: List[float] = []
+        self.reply_latency: List[float] = []
+        self.statuses: Dict[int, int] = {}
+        self.no_reply = 0
+        self.request_errors = 0
+
+    def summary(self, label: str, values: List[float]) -> str:
+        ms = [value * 1000 for value in values]
+        return (f"{label:<14} n={len(ms):<6} p50={percentile(ms, 50):8.1f}ms "
+                f"p95={percentile(ms, 95):8.1f}ms p99={percentile(ms, 99):8.1f}ms max={max(ms, default=0):8.1f}ms")
+
+async def run_conversation(client: httpx.AsyncClient, graph: FakeGraph, wa_id: str, results: Results,
+                           reply_timeout: float, think_time: float):
+    for message in conversation():
+        reply = graph.wait_for_reply(wa_id)
+        started = time.perf_counter()
+        try:
+            response = await client.post("/webhook", json=webhook_body(wa_id, message))
+        except httpx.HTTPError:
+            results.request_errors += 1
+            reply.cancel()
+            continue
+        results.http_latency.append(time.perf_counter() - started)
+        results.statuses[response.status_code] = results.statuses.get(response.status_code, 0) + 1
+
+        try:
+            await asyncio.wait_for(reply, timeout=reply_timeout)
+            results.reply_latency.append(time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            results.no_reply += 1
+        # Let the rest of the turn's replies go out before the user answers
+        await asyncio.sleep(random.uniform(0, think_time) if think_time else 0.01)
+
+async def serve(app, port: int):
+    """Run `app` with uvicorn on this loop; returns the server, its port and its task"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    bound = server.servers[0].sockets[0].getsockname()[1]
+    return server, bound, task
+
+def _prepare_in_process_app(graph_port: int, plms_port: int, rate_limit: Optional[float]):
+    """Point webhooks.py at the fakes before it is imported"""
+    os.environ["WHATSAPP_BASE_URL"] = f"http://127.0.0.1:{graph_port}/v20.0"
+    os.environ["PLMS_ENDPOINT"] = f"http://127.0.0.1:{plms_port}"
+    os.environ["PHONE_NUMBER_ID"] = PHONE_NUMBER_ID
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("OUTBOX_SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "outbox.db"))
+    if rate_limit is not None:
+        os.environ["WHATSAPP_RATE_LIMIT"] = str(rate_limit)
+    if not os.getenv("PRIVATE_KEY"):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        os.environ["PRIVATE_KEY"] = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+
+async def main(args) -> int:
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+    latency = (args.min_latency, args.max_latency)
+    graph = FakeGraph(latency=latency, error_rate=args.graph_error_rate, throttle_rate=args.throttle_rate)
+    plms = FakePLMS(latency=latency, error_rate=args.plms_error_rate, expire_rate=args.expire_rate)
+
+    servers = []
+    graph_server, graph_port, task = await serve(graph.create_app(), args.graph_port)
+    servers.append((graph_server, task))
+    plms_server, plms_port, task = await serve(plms.create_app(), args.plms_port)
+    servers.append((plms_server, task))
+    print(f"fake Graph API on :{graph_port}, fake PLMS on :{plms_port}")
+
+    target = args.target
+    if target is None:
+        _prepare_in_process_app(graph_port, plms_port, args.rate_limit)
+        from webhooks import app
+        app_server, app_port, task = await serve(app, 0)
+        servers.append((app_server, task))
+        target = f"http://127.0.0.1:{app_port}"
+
+    results = Results()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            await run_conversation(client, graph, f"62899{index:08d}", results, args.reply_timeout, args.think_time)
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=target, limits=limits, timeout=30.0) as client:
+        await asyncio.gather(*(one(i) for i in range(args.conversations)))
+        elapsed = time.perf_counter() - started
+        stats = (await client.get("/stats")).json() if args.target is None else None
+
+    for server, task in reversed(servers):
+        server.should_exit = True
+        await task
+
+    turns = len(results.http_latency)
+    print(f"conversations={args.conversations} concurrency={args.concurrency} turns={turns} "
+          f"duration={elapsed:.2f}s throughput={turns / elapsed:.1f} webhooks/s")
+    print(results.summary("webhook http", results.http_latency))
+    print(results.summary("first reply", results.reply_latency))
+    print(f"statuses={results.statuses} no_reply={results.no_reply} request_errors={results.request_errors}")
+    print(f"graph={graph.stats()}")
+    print(f"plms={plms.stats()}")
+    if stats is not None:
+        print(f"dispatcher={stats['dispatcher']}")
+        print(f"prefetch={stats['prefetch']}")
+        print(f"plms_history={stats['plms_history']}")
+    return 1 if results.request_errors or plms.crossovers else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--target", help="Base URL of an already running webhooks.py")
+    parser.add_argument("--graph-port", type=int, default=0)
+    parser.add_argument("--plms-port", type=int, default=0)
+    parser.add_argument("--min-latency", type=float, default=0.01, help="Fake upstream latency, seconds")
+    parser.add_argument("--max-latency", type=float, default=0.05)
+    parser.add_argument("--plms-error-rate", type=float, default=0.0)
+    parser.add_argument("--expire-rate", type=float, default=0.0, help="Share of PLMS calls answered with E004")
+    parser.add_argument("--graph-error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of Graph API calls answered with 429")
+    parser.add_argument("--rate-limit", type=float, help="WHATSAPP_RATE_LIMIT for the in-process app")
+    parser.add_argument("--reply-timeout", type=float, default=10.0)
+    parser.add_argument("--think-time", type=float, default=0.0, help="Upper bound of the random pause between turns")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
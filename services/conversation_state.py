@@ -0,0 +1,144 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Optional
+from core.cache import TTLCache
+from core.redis_client import get_redis
+from core.logger import get_logger
+
+logger = get_logger()
+
+_MISSING = object()
+
+@dataclass(frozen=True)
+class ConversationState:
+    """What we already know about a wa_id; None means "not known yet"."""
+    wa_id: str
+    is_member: Optional[bool] = None
+    card_number: Optional[str] = None
+    tnc_accepted: Optional[bool] = None
+    menu: Optional[str] = None
+    updated_at: float = 0.0
+
+    @property
+    def verified_member(self) -> bool:
+        """Membership and T&C are both confirmed, so the member menu can be shown without PLMS"""
+        return bool(self.is_member and self.tnc_accepted and self.card_number)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "ConversationState":
+        data = json.loads(raw)
+        known = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), separators=(",", ":"))
+
+class ConversationStateStore:
+    """
+    Per-wa_id conversation state with a TTL. With CONVERSATION_STATE_REDIS_URL
+    the state lives in Redis and is shared by every worker, behind a short-lived
+    in-process near-cache that is refreshed on every local write; without it the
+    near-cache is the store.
+    """
+
+    KEY_PREFIX = "conv:"
+
+    def __init__(self, redis_url: str = None):
+        self.enabled = os.getenv("CONVERSATION_STATE", "true").lower() == "true"
+        self.redis_url = redis_url if redis_url is not None else os.getenv("CONVERSATION_STATE_REDIS_URL")
+        self.ttl = float(os.getenv("CONVERSATION_STATE_TTL", 900))
+        # Bounds how long another worker's write can go unnoticed here
+        near_ttl = float(os.getenv("CONVERSATION_STATE_NEAR_TTL", 5)) if self.redis_url else self.ttl
+        self.near_cache = TTLCache(
+            "conversation_state",
+            ttl=near_ttl,
+            max_entries=int(os.getenv("CONVERSATION_STATE_NEAR_MAX_ENTRIES", 10_000)),
+        )
+
+        self.remote_hits = 0
+        self.remote_misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.plms_calls_saved = 0
+
+    @property
+    def redis(self):
+        return get_redis(self.redis_url) if self.redis_url else None
+
+    def _key(self, wa_id: str) -> str:
+        return f"{self.KEY_PREFIX}{wa_id}"
+
+    async def get(self, wa_id: str) -> Optional[ConversationState]:
+        if not self.enabled or not wa_id:
+            return None
+
+        state = self.near_cache.get(wa_id, _MISSING)
+        if state is not _MISSING or self.redis is None:
+            return None if state is _MISSING else state
+
+        try:
+            raw = await self.redis.get(self._key(wa_id))
+        except Exception as e:
+            # Fail open: without state the handlers simply ask PLMS
+            self.errors += 1
+            logger.warning("Conversation state unavailable for %s: %s", wa_id, e)
+            return None
+
+        if raw is None:
+            self.remote_misses += 1
+            state = None
+        else:
+            self.remote_hits += 1
+            state = ConversationState.from_json(raw)
+        # Negative entries too, so unknown users do not cost a Redis round trip per message
+        self.near_cache.set(wa_id, state)
+        return state
+
+    async def update(self, wa_id: str, **changes) -> Optional[ConversationState]:
+        """Merge `changes` into the stored state and restart its TTL"""
+        if not self.enabled or not wa_id:
+            return None
+
+        current = await self.get(wa_id) or ConversationState(wa_id)
+        state = replace(current, **changes, updated_at=time.time())
+        self.writes += 1
+
+        self.near_cache.invalidate(wa_id)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self._key(wa_id), state.to_json(), ex=max(int(self.ttl), 1))
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Could not store conversation state for %s: %s", wa_id, e)
+                return state
+        self.near_cache.set(wa_id, state)
+        return state
+
+    async def clear(self, wa_id: str):
+        if not self.enabled or not wa_id:
+            return
+        self.near_cache.invalidate(wa_id)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self._key(wa_id))
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Could not clear conversation state for %s: %s", wa_id, e)
+
+    def record_saved_calls(self, calls: int):
+        self.plms_calls_saved += calls
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": "redis" if self.redis_url else "local",
+            "ttl_seconds": self.ttl,
+            "near_cache": self.near_cache.stats(),
+            "remote_hits": self.remote_hits,
+            "remote_misses": self.remote_misses,
+            "writes": self.writes,
+            "errors": self.errors,
+            "plms_calls_saved": self.plms_calls_saved,
+        }
@@ -0,0 +1,111 @@
+import os
+import time
+from collections import OrderedDict
+from typing import List
+from core.redis_client import get_redis
+from core.logger import get_logger
+
+logger = get_logger()
+
+class LocalDedupeStore:
+    """Exact in-memory LRU of seen message ids, for single-worker deployments"""
+
+    def __init__(self, ttl: float, max_entries: int = 100_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    async def claim(self, message_ids: List[str]) -> List[bool]:
+        now = time.monotonic()
+        claimed = []
+        for message_id in message_ids:
+            expires_at = self._seen.get(message_id)
+            if expires_at is not None and expires_at > now:
+                claimed.append(False)
+                continue
+            self._seen[message_id] = now + self.ttl
+            self._seen.move_to_end(message_id)
+            claimed.append(True)
+
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return claimed
+
+    async def release(self, message_ids: List[str]):
+        for message_id in message_ids:
+            self._seen.pop(message_id, None)
+
+class RedisDedupeStore:
+    """Message ids claimed with SET NX, shared by every worker process"""
+
+    def __init__(self, redis_url: str, ttl: float, prefix: str = "wa:msg:"):
+        self.redis_url = redis_url
+        self.ttl = max(int(ttl), 1)
+        self.prefix = prefix
+
+    async def claim(self, message_ids: List[str]) -> List[bool]:
+        pipe = get_redis(self.redis_url).pipeline(transaction=False)
+        for message_id in message_ids:
+            pipe.set(f"{self.prefix}{message_id}", 1, nx=True, ex=self.ttl)
+        return [bool(result) for result in await pipe.execute()]
+
+    async def release(self, message_ids: List[str]):
+        await get_redis(self.redis_url).delete(*(f"{self.prefix}{message_id}" for message_id in message_ids))
+
+class MessageDeduplicator:
+    """Drops webhook messages whose id has already been accepted within the retention window"""
+
+    def __init__(self):
+        self.enabled = os.getenv("WEBHOOK_DEDUPE", "true").lower() == "true"
+        ttl = float(os.getenv("WEBHOOK_DEDUPE_TTL", 24 * 3600))
+        redis_url = os.getenv("WEBHOOK_DEDUPE_REDIS_URL")
+        if redis_url:
+            self.store = RedisDedupeStore(redis_url, ttl)
+        else:
+            self.store = LocalDedupeStore(ttl, int(os.getenv("WEBHOOK_DEDUPE_MAX_ENTRIES", 100_000)))
+
+        self.checked = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    async def filter(self, events: List[dict]) -> List[dict]:
+        if not self.enabled or not events:
+            return events
+
+        ids = [event["message"].get("id") for event in events]
+        keyed = [i for i, message_id in enumerate(ids) if message_id]
+        try:
+            claimed = await self.store.claim([ids[i] for i in keyed])
+        except Exception as e:
+            # Fail open: a duplicate reply is better than a lost message
+            self.errors += 1
+            logger.warning("Deduplication store unavailable, processing batch as new: %s", e)
+            return events
+
+        duplicates = {i for i, fresh in zip(keyed, claimed) if not fresh}
+        self.checked += len(keyed)
+        self.duplicates += len(duplicates)
+        for i in duplicates:
+            logger.info("Duplicate webhook message skipped: %s", ids[i])
+        return [event for i, event in enumerate(events) if i not in duplicates]
+
+    async def release(self, events: List[dict]):
+        """Forget the ids of events that were claimed but not accepted, so Meta's redelivery gets through"""
+        ids = [event["message"].get("id") for event in events if event["message"].get("id")]
+        if not self.enabled or not ids:
+            return
+        try:
+            await self.store.release(ids)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Could not release %s message ids after rejecting a webhook: %s", len(ids), e)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.store).__name__,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "hit_rate": round(self.duplicates / self.checked, 4) if self.checked else 0.0,
+            "errors": self.errors,
+        }
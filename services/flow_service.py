@@ -1,69 +1,143 @@
+import asyncio
 import json
+import multiprocessing
+import os
 from base64 import b64decode, b64encode
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from cryptography.hazmat.primitives.asymmetric.padding import OAEP, MGF1
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.ciphers import algorithms, Cipher, modes
 from cryptography.hazmat.backends import default_backend
+from core.logger import get_logger
 
-class FlowCryptoService:
-    def __init__(self, private_key_pem: str, passphrase: str):
-        self.private_key = serialization.load_pem_private_key(
-            private_key_pem.encode("utf-8"),
-            password=passphrase.encode("utf-8") if passphrase else None,
-            backend=default_backend()
-        )
+logger = get_logger()
 
-    def decrypt_request(self, encrypted_body: bytes):
-        """
-        Parse JSON body and decrypt using RSA + AES-GCM
-        """
-        body = json.loads(encrypted_body)
-
-        encrypted_flow_data_b64 = body["encrypted_flow_data"]
-        encrypted_aes_key_b64 = body["encrypted_aes_key"]
-        initial_vector_b64 = body["initial_vector"]
-
-        flow_data = b64decode(encrypted_flow_data_b64)
-        iv = b64decode(initial_vector_b64)
-        encrypted_aes_key = b64decode(encrypted_aes_key_b64)
-
-        aes_key = self.private_key.decrypt(
-            encrypted_aes_key,
-            OAEP(
-                mgf=MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
+def load_private_key(private_key_pem: str, passphrase: str):
+    return serialization.load_pem_private_key(
+        private_key_pem.encode("utf-8"),
+        password=passphrase.encode("utf-8") if passphrase else None,
+        backend=default_backend()
+    )
+
+def decrypt_flow_request(private_key, encrypted_body: bytes):
+    """
+    Parse JSON body and decrypt using RSA + AES-GCM
+    """
+    body = json.loads(encrypted_body)
+
+    encrypted_flow_data_b64 = body["encrypted_flow_data"]
+    encrypted_aes_key_b64 = body["encrypted_aes_key"]
+    initial_vector_b64 = body["initial_vector"]
+
+    flow_data = b64decode(encrypted_flow_data_b64)
+    iv = b64decode(initial_vector_b64)
+    encrypted_aes_key = b64decode(encrypted_aes_key_b64)
+
+    aes_key = private_key.decrypt(
+        encrypted_aes_key,
+        OAEP(
+            mgf=MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None
         )
+    )
 
-        # Split tag (last 16 bytes) from cipher
-        encrypted_flow_data_body = flow_data[:-16]
-        encrypted_flow_data_tag = flow_data[-16:]
+    # Split tag (last 16 bytes) from cipher
+    encrypted_flow_data_body = flow_data[:-16]
+    encrypted_flow_data_tag = flow_data[-16:]
 
-        decryptor = Cipher(
-            algorithms.AES(aes_key),
-            modes.GCM(iv, encrypted_flow_data_tag),
-            backend=default_backend()
-        ).decryptor()
+    decryptor = Cipher(
+        algorithms.AES(aes_key),
+        modes.GCM(iv, encrypted_flow_data_tag),
+        backend=default_backend()
+    ).decryptor()
 
-        decrypted_data_bytes = decryptor.update(encrypted_flow_data_body) + decryptor.finalize()
-        decrypted_data = json.loads(decrypted_data_bytes.decode("utf-8"))
+    decrypted_data_bytes = decryptor.update(encrypted_flow_data_body) + decryptor.finalize()
+    decrypted_data = json.loads(decrypted_data_bytes.decode("utf-8"))
 
-        return decrypted_data, aes_key, iv
+    return decrypted_data, aes_key, iv
 
-    def encrypt_response(self, response_data: dict, aes_key: bytes, iv: bytes) -> str:
-        """
-        Encrypt JSON response using AES-GCM with flipped IV
-        """
-        flipped_iv = bytes([b ^ 0xFF for b in iv])
+def encrypt_flow_response(response_data: dict, aes_key: bytes, iv: bytes) -> str:
+    """
+    Encrypt JSON response using AES-GCM with flipped IV
+    """
+    flipped_iv = bytes([b ^ 0xFF for b in iv])
+
+    encryptor = Cipher(
+        algorithms.AES(aes_key),
+        modes.GCM(flipped_iv),
+        backend=default_backend()
+    ).encryptor()
+
+    encrypted_bytes = encryptor.update(json.dumps(response_data).encode("utf-8")) + encryptor.finalize()
+    tag = encryptor.tag
+
+    return b64encode(encrypted_bytes + tag).decode("utf-8")
+
+# Private key of a process-pool worker, loaded once by the pool initializer
+_worker_private_key = None
 
-        encryptor = Cipher(
-            algorithms.AES(aes_key),
-            modes.GCM(flipped_iv),
-            backend=default_backend()
-        ).encryptor()
+def _init_worker(private_key_pem: str, passphrase: str):
+    global _worker_private_key
+    _worker_private_key = load_private_key(private_key_pem, passphrase)
 
-        encrypted_bytes = encryptor.update(json.dumps(response_data).encode("utf-8")) + encryptor.finalize()
-        tag = encryptor.tag
+def _decrypt_in_worker(encrypted_body: bytes):
+    return decrypt_flow_request(_worker_private_key, encrypted_body)
 
-        return b64encode(encrypted_bytes + tag).decode("utf-8")
+class FlowCryptoService:
+    """
+    RSA + AES-GCM for WhatsApp Flows. FLOW_CRYPTO_EXECUTOR selects where the
+    CPU-bound work runs: "inline" (on the event loop), "thread" or "process"
+    (a pool of FLOW_CRYPTO_WORKERS, each process holding its own copy of the key).
+    """
+
+    def __init__(self, private_key_pem: str, passphrase: str, executor_mode: str = None, workers: int = None):
+        self.private_key_pem = private_key_pem
+        self.passphrase = passphrase
+        self.private_key = load_private_key(private_key_pem, passphrase)
+        self.executor_mode = (executor_mode or os.getenv("FLOW_CRYPTO_EXECUTOR", "inline")).lower()
+        self.workers = workers or int(os.getenv("FLOW_CRYPTO_WORKERS", min(4, os.cpu_count() or 1)))
+        self.executor: Executor = None
+
+    def start(self):
+        if self.executor is not None or self.executor_mode == "inline":
+            return
+        if self.executor_mode == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="flow-crypto")
+        elif self.executor_mode == "process":
+            # Not fork: the log listener and loop watchdog threads are already running
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.private_key_pem, self.passphrase),
+            )
+        else:
+            raise ValueError(f"Unknown FLOW_CRYPTO_EXECUTOR: {self.executor_mode}")
+        logger.info("Flow crypto offloaded to a %s pool of %s workers", self.executor_mode, self.workers)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def decrypt_request(self, encrypted_body: bytes):
+        return decrypt_flow_request(self.private_key, encrypted_body)
+
+    def encrypt_response(self, response_data: dict, aes_key: bytes, iv: bytes) -> str:
+        return encrypt_flow_response(response_data, aes_key, iv)
+
+    async def decrypt_request_async(self, encrypted_body: bytes):
+        if self.executor is None:
+            return self.decrypt_request(encrypted_body)
+        loop = asyncio.get_running_loop()
+        if self.executor_mode == "process":
+            return await loop.run_in_executor(self.executor, _decrypt_in_worker, encrypted_body)
+        return await loop.run_in_executor(self.executor, decrypt_flow_request, self.private_key, encrypted_body)
+
+    async def encrypt_response_async(self, response_data: dict, aes_key: bytes, iv: bytes) -> str:
+        if self.executor is None:
+            return self.encrypt_response(response_data, aes_key, iv)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, encrypt_flow_response, response_data, aes_key, iv
+        )
@@ -0,0 +1,139 @@
+import os
+import sys
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, NamedTuple, Optional, Tuple
+from core.cache import TTLCache
+from core.metrics import REGISTRY
+
+HISTORY_ROWS = REGISTRY.counter(
+    "wa_history_rows", "Transaction history rows served, by source (fetched from PLMS or reused from the cache)", ("source",))
+_ROWS_FETCHED = HISTORY_ROWS.labels("fetched")
+_ROWS_CACHED = HISTORY_ROWS.labels("cached")
+
+_intern = sys.intern
+
+def _iso_day(date: str) -> str:
+    """YYYYMMDD, the format of the request window, as the YYYY-MM-DD that starts a transaction_date"""
+    return f"{date[:4]}-{date[4:6]}-{date[6:8]}"
+
+class HistoryRow(NamedTuple):
+    """One history row, reduced to the fields that are rendered"""
+    transaction_date: str
+    transaction_place: str
+    point: int
+    status: str
+
+    @classmethod
+    def compact(cls, row: dict) -> "HistoryRow":
+        # Places and statuses repeat across rows and members; share one string each
+        get = row.get
+        return tuple.__new__(cls, (
+            str(get("transaction_date", "")),
+            _intern(str(get("transaction_place", "Toko"))),
+            get("point", 0),
+            _intern(str(get("status", ""))),
+        ))
+
+class _HistoryEntry(NamedTuple):
+    start_date: str
+    # The end of the last fetched window; that day may still get transactions
+    fetched_through: str
+    rows: Tuple[HistoryRow, ...]
+    # The fetch stopped at PLMS_HISTORY_MAX_PAGES, so older rows of the window are missing
+    truncated: bool = False
+
+class TransactionHistoryCache:
+    """
+    Per-member transaction history, kept as compact rows with the date the
+    history was last fetched through. A repeat request for a window that
+    starts no earlier than the cached one only fetches from that date on;
+    older rows come from the cache and count as saved. The cached rows are
+    replaced by the merged result once the fetch has completed. A fetch cut
+    short by the page cap is kept as truncated, and the next request
+    fetches the whole window again.
+    Settings can be overridden with PLMS_HISTORY_CACHE_TTL,
+    PLMS_HISTORY_CACHE_MAX_ENTRIES and PLMS_HISTORY_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self, ttl: float = 24 * 3600.0, max_entries: int = 10_000, max_bytes: int = 16 * 1024 * 1024):
+        self.cache = TTLCache(
+            "transaction_history",
+            float(os.getenv("PLMS_HISTORY_CACHE_TTL", ttl)),
+            int(os.getenv("PLMS_HISTORY_CACHE_MAX_ENTRIES", max_entries)),
+            int(os.getenv("PLMS_HISTORY_CACHE_MAX_BYTES", max_bytes)),
+        )
+        self.full_fetches = 0
+        self.delta_fetches = 0
+        self.truncated_fetches = 0
+        self.rows_fetched = 0
+        self.rows_saved = 0
+
+    def _entry(self, key: str, start_date: str, end_date: str) -> Optional[_HistoryEntry]:
+        entry = self.cache.get(key)
+        if entry is None or entry.truncated or entry.start_date > start_date or entry.fetched_through > end_date:
+            return None
+        return entry
+
+    async def rows(self, key: str, start_date: str, end_date: str,
+                   fetch: Callable[[str], AsyncIterator[dict]]) -> AsyncIterator[dict]:
+        """
+        The history rows of [start_date, end_date], newest first. `fetch(start)`
+        streams the PLMS pages from `start` to end_date; fetched rows are
+        yielded as they arrive, followed by the cached older ones.
+        """
+        entry = self._entry(key, start_date, end_date)
+        fetch_from = entry.fetched_through if entry else start_date
+        fetched, complete, truncated = [], True, False
+        async with aclosing(fetch(fetch_from)) as pages:
+            async for page in pages:
+                if page.get("response_code") != "00":
+                    complete = False
+                    break
+                for row in page.get("history") or []:
+                    fetched.append(HistoryRow.compact(row))
+                    yield row
+                truncated = truncated or page.get("truncated", False)
+
+        kept = []
+        # Cached rows would follow a gap after a truncated fetch
+        if entry and not truncated:
+            # Rows PLMS returned again (the delta window overlapping the cached one) are not repeated.
+            # Dates compare as strings: "2026-10-04 10:00:00" >= "2026-10-04" and < "2026-10-05".
+            seen = set(fetched)
+            first_day, fetched_day = _iso_day(start_date), _iso_day(fetch_from)
+            kept = [row for row in entry.rows if first_day <= row.transaction_date < fetched_day and row not in seen]
+        for row in kept:
+            yield row._asdict()
+
+        if entry:
+            self.delta_fetches += 1
+        else:
+            self.full_fetches += 1
+        if truncated:
+            self.truncated_fetches += 1
+        self.rows_fetched += len(fetched)
+        self.rows_saved += len(kept)
+        _ROWS_FETCHED.inc(len(fetched))
+        _ROWS_CACHED.inc(len(kept))
+
+        # An error answer leaves the cache as it was; the rows served still stand
+        if complete:
+            merged = _HistoryEntry(start_date, end_date, (*fetched, *kept), truncated)
+            # Nothing new since the last request: keep the entry rather than re-measuring it
+            if merged != entry:
+                self.cache.set(key, merged)
+
+    def invalidate(self, key: str):
+        self.cache.invalidate(key)
+
+    def stats(self) -> dict:
+        served = self.rows_fetched + self.rows_saved
+        return {
+            **self.cache.stats(),
+            "full_fetches": self.full_fetches,
+            "delta_fetches": self.delta_fetches,
+            "truncated_fetches": self.truncated_fetches,
+            "rows_fetched": self.rows_fetched,
+            "rows_saved": self.rows_saved,
+            "saved_rate": round(self.rows_saved / served, 4) if served else 0.0,
+        }
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, List
+import httpx
+from core.logger import get_logger
+
+logger = get_logger()
+
+# Graph API error codes meaning "slow down" rather than "bad request"
+THROTTLE_ERROR_CODES = {4, 80007, 130429, 131048, 131056}
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waits = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens, e.g. for the Retry-After of a 429"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        waited = False
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                waited = True
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                if waited:
+                    self.waits += 1
+                return
+            waited = True
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class OutboundScheduler:
+    """
+    Sits in front of Graph API sends: a token bucket per phone_number_id caps the
+    message rate, throttling answers (429 or throughput error codes) pause the
+    bucket for Retry-After or an exponential backoff and the send is retried,
+    and sends to the same recipient go out strictly in submission order.
+    """
+
+    def __init__(self, rate: float = None, burst: float = None, max_retries: int = None, backoff: float = None):
+        self.rate = float(rate if rate is not None else os.getenv("WHATSAPP_RATE_LIMIT", 80))
+        self.burst = float(burst if burst is not None else os.getenv("WHATSAPP_RATE_BURST", self.rate))
+        self.max_retries = int(max_retries if max_retries is not None else os.getenv("WHATSAPP_THROTTLE_MAX_RETRIES", 3))
+        self.backoff = float(backoff if backoff is not None else os.getenv("WHATSAPP_THROTTLE_BACKOFF", 1.0))
+        self.max_backoff = float(os.getenv("WHATSAPP_THROTTLE_MAX_BACKOFF", 30))
+
+        self.buckets: Dict[str, TokenBucket] = {}
+        # recipient -> [lock, number of sends holding or waiting for it]
+        self._recipients: Dict[str, List] = {}
+
+        self.queued = 0
+        self.in_flight = 0
+        self.sent = 0
+        self.throttle_events = 0
+        self.retries = 0
+        self.gave_up = 0
+
+    def _bucket(self, sender_id: str) -> TokenBucket:
+        bucket = self.buckets.get(sender_id)
+        if bucket is None:
+            bucket = self.buckets[sender_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    @staticmethod
+    def is_throttled(response: httpx.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        if response.status_code < 400:
+            return False
+        try:
+            code = response.json().get("error", {}).get("code")
+        except Exception:
+            return False
+        return code in THROTTLE_ERROR_CODES
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def submit(self, sender_id: str, recipient: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Run `send` when the rate limit and the recipient's earlier messages allow it"""
+        entry = self._recipients.get(recipient)
+        if entry is None:
+            entry = self._recipients[recipient] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.queued += 1
+        queued = True
+        bucket = self._bucket(sender_id)
+        try:
+            async with entry[0]:
+                attempt = 0
+                while True:
+                    await bucket.acquire()
+                    if queued:
+                        self.queued -= 1
+                        queued = False
+
+                    self.in_flight += 1
+                    try:
+                        response = await send()
+                    finally:
+                        self.in_flight -= 1
+
+                    if not self.is_throttled(response):
+                        self.sent += 1
+                        return response
+
+                    self.throttle_events += 1
+                    delay = self._retry_delay(response, attempt)
+                    bucket.pause(delay)
+                    if attempt >= self.max_retries:
+                        self.gave_up += 1
+                        logger.error("Graph API still throttling after %s retries, giving up on message to %s", attempt, recipient)
+                        return response
+
+                    attempt += 1
+                    self.retries += 1
+                    logger.warning("Graph API throttled (%s), retrying message to %s in %.2fs", response.status_code, recipient, delay)
+                    await asyncio.sleep(delay)
+        finally:
+            if queued:
+                self.queued -= 1
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._recipients.pop(recipient, None)
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "active_recipients": len(self._recipients),
+            "sent": self.sent,
+            "throttle_events": self.throttle_events,
+            "local_waits": sum(bucket.waits for bucket in self.buckets.values()),
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+        }
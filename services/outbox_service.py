@@ -0,0 +1,508 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, List, Optional
+import httpx
+from core.redis_client import get_redis
+from core.logger import get_logger
+from services.outbound_scheduler import OutboundScheduler
+
+logger = get_logger()
+
+@dataclass
+class OutboxRecord:
+    endpoint: str
+    recipient: str
+    body: str
+    id: Optional[int] = None
+    attempts: int = 0
+    next_attempt_at: float = 0.0
+    last_error: str = ""
+    created_at: float = 0.0
+    failed_at: float = 0.0
+
+class PermanentDeliveryError(Exception):
+    """Delivery failed in a way retrying cannot fix (e.g. a 4xx from the Graph API)"""
+
+class SQLiteOutboxStore:
+    """Pending and dead-letter tables in a local SQLite file, accessed from one dedicated thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox-sqlite")
+        self._db: sqlite3.Connection = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for table in ("outbox", "dead_letters"):
+            self._db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    endpoint TEXT NOT NULL,
+                    recipient TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT NOT NULL DEFAULT '',
+                    created_at REAL NOT NULL,
+                    failed_at REAL NOT NULL DEFAULT 0
+                )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_recipient ON outbox (recipient, id)")
+        self._db.commit()
+
+    async def open(self):
+        await self._run(self._open)
+
+    async def close(self):
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=True)
+
+    @staticmethod
+    def _record(row) -> OutboxRecord:
+        return OutboxRecord(id=row[0], endpoint=row[1], recipient=row[2], body=row[3], attempts=row[4],
+                            next_attempt_at=row[5], last_error=row[6], created_at=row[7], failed_at=row[8])
+
+    async def add_many(self, records: List[OutboxRecord]):
+        def add():
+            with self._db:
+                for record in records:
+                    cursor = self._db.execute(
+                        "INSERT INTO outbox (endpoint, recipient, body, attempts, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (record.endpoint, record.recipient, record.body, record.attempts, record.next_attempt_at, record.created_at),
+                    )
+                    record.id = cursor.lastrowid
+        await self._run(add)
+
+    # Only a recipient's oldest pending record may be delivered, so their messages stay in order
+    _HEAD = "NOT EXISTS (SELECT 1 FROM outbox AS earlier WHERE earlier.recipient = outbox.recipient AND earlier.id < outbox.id)"
+
+    async def claim(self, now: float, limit: int, lease: float) -> List[OutboxRecord]:
+        """
+        Due records, leased to this worker by moving next_attempt_at past the lease.
+        BEGIN IMMEDIATE takes the write lock before the select, so no other
+        worker can claim the same rows in between.
+        """
+        def claim():
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                rows = self._db.execute(
+                    f"SELECT * FROM outbox WHERE next_attempt_at <= ? AND {self._HEAD} ORDER BY id LIMIT ?", (now, limit),
+                ).fetchall()
+                self._db.executemany("UPDATE outbox SET next_attempt_at = ? WHERE id = ?", [(now + lease, row[0]) for row in rows])
+            return [self._record(row) for row in rows]
+        return await self._run(claim)
+
+    async def next_due_at(self) -> Optional[float]:
+        def next_due():
+            return self._db.execute(f"SELECT MIN(next_attempt_at) FROM outbox WHERE {self._HEAD}").fetchone()[0]
+        return await self._run(next_due)
+
+    async def mark_sent(self, record: OutboxRecord):
+        def delete():
+            with self._db:
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (record.id,))
+        await self._run(delete)
+
+    async def reschedule(self, record: OutboxRecord):
+        def update():
+            with self._db:
+                self._db.execute("UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                                 (record.attempts, record.next_attempt_at, record.last_error, record.id))
+        await self._run(update)
+
+    async def dead_letter(self, record: OutboxRecord):
+        def move():
+            with self._db:
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (record.id,))
+                cursor = self._db.execute(
+                    "INSERT INTO dead_letters (endpoint, recipient, body, attempts, last_error, created_at, failed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (record.endpoint, record.recipient, record.body, record.attempts, record.last_error, record.created_at, record.failed_at),
+                )
+                record.id = cursor.lastrowid
+        await self._run(move)
+
+    async def list_dead(self, limit: int) -> List[OutboxRecord]:
+        def select():
+            rows = self._db.execute("SELECT * FROM dead_letters ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            return [self._record(row) for row in rows]
+        return await self._run(select)
+
+    async def replay(self, dead_id: int) -> Optional[OutboxRecord]:
+        def replay():
+            with self._db:
+                row = self._db.execute("SELECT * FROM dead_letters WHERE id = ?", (dead_id,)).fetchone()
+                if row is None:
+                    return None
+                record = self._record(row)
+                self._db.execute("DELETE FROM dead_letters WHERE id = ?", (dead_id,))
+                cursor = self._db.execute(
+                    "INSERT INTO outbox (endpoint, recipient, body, attempts, next_attempt_at, created_at) VALUES (?, ?, ?, 0, 0, ?)",
+                    (record.endpoint, record.recipient, record.body, record.created_at),
+                )
+                record.id, record.attempts, record.next_attempt_at = cursor.lastrowid, 0, 0.0
+                return record
+        return await self._run(replay)
+
+    async def counts(self) -> dict:
+        def count():
+            pending = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            dead = self._db.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+            return {"pending": pending, "dead_letters": dead}
+        return await self._run(count)
+
+class RedisOutboxStore:
+    """
+    Pending records in a hash plus a due-time sorted set; dead letters in a
+    second hash. A worker claims a record by removing it from the due set, and
+    only the worker whose ZREM succeeds delivers it. Claimed records are kept
+    in a lease set until they are settled; a lease that runs out (the worker
+    died) puts the record back in the due set.
+
+    Each recipient's pending ids are kept in order in a sorted set of their
+    own. Only the first of them can be claimed; later ones are pushed back in
+    the due set and brought forward once the record ahead of them is settled.
+    """
+
+    def __init__(self, redis_url: str, prefix: str = "outbox:"):
+        self.redis_url = redis_url
+        self.prefix = prefix
+
+    @property
+    def redis(self):
+        return get_redis(self.redis_url)
+
+    async def open(self):
+        await self.redis.ping()
+
+    async def close(self):
+        pass
+
+    @staticmethod
+    def _dump(record: OutboxRecord) -> str:
+        return json.dumps(asdict(record))
+
+    def _recipient_key(self, recipient: str) -> str:
+        return f"{self.prefix}recipient:{recipient}"
+
+    async def add_many(self, records: List[OutboxRecord]):
+        first = await self.redis.incrby(f"{self.prefix}seq", len(records))
+        pipe = self.redis.pipeline(transaction=True)
+        for offset, record in enumerate(records):
+            record.id = first - len(records) + 1 + offset
+            pipe.hset(f"{self.prefix}pending", record.id, self._dump(record))
+            pipe.zadd(f"{self.prefix}due", {record.id: record.next_attempt_at})
+            pipe.zadd(self._recipient_key(record.recipient), {record.id: record.id})
+        await pipe.execute()
+
+    async def _requeue_expired(self, now: float):
+        expired = await self.redis.zrangebyscore(f"{self.prefix}leases", 0, now)
+        if not expired:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for record_id in expired:
+            pipe.zrem(f"{self.prefix}leases", record_id)
+        requeued = [record_id for record_id, removed in zip(expired, await pipe.execute()) if removed]
+        if requeued:
+            await self.redis.zadd(f"{self.prefix}due", {record_id: now for record_id in requeued})
+
+    async def claim(self, now: float, limit: int, lease: float) -> List[OutboxRecord]:
+        await self._requeue_expired(now)
+        ids = await self.redis.zrangebyscore(f"{self.prefix}due", 0, now, start=0, num=limit)
+        if not ids:
+            return []
+        rows = await self.redis.hmget(f"{self.prefix}pending", ids)
+        records = [OutboxRecord(**json.loads(row)) for row in rows if row]
+        if not records:
+            return []
+
+        pipe = self.redis.pipeline(transaction=False)
+        for record in records:
+            pipe.zrange(self._recipient_key(record.recipient), 0, 0)
+        heads, held = [], {}
+        for record, first in zip(records, await pipe.execute()):
+            if not first or int(first[0]) == record.id:
+                heads.append(record)
+            else:
+                held[record.id] = now + lease
+        if held:
+            await self.redis.zadd(f"{self.prefix}due", held, xx=True, gt=True)
+        if not heads:
+            return []
+
+        pipe = self.redis.pipeline(transaction=False)
+        for record in heads:
+            pipe.zrem(f"{self.prefix}due", record.id)
+        claimed = [record for record, removed in zip(heads, await pipe.execute()) if removed]
+        if claimed:
+            await self.redis.zadd(f"{self.prefix}leases", {record.id: now + lease for record in claimed})
+        return claimed
+
+    async def _release_next(self, recipient: str):
+        """Make the recipient's next record due now that the one ahead of it is settled"""
+        first = await self.redis.zrange(self._recipient_key(recipient), 0, 0)
+        if first:
+            await self.redis.zadd(f"{self.prefix}due", {first[0]: time.time()}, xx=True, lt=True)
+
+    async def next_due_at(self) -> Optional[float]:
+        first = await self.redis.zrange(f"{self.prefix}due", 0, 0, withscores=True)
+        return first[0][1] if first else None
+
+    async def mark_sent(self, record: OutboxRecord):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hdel(f"{self.prefix}pending", record.id)
+        pipe.zrem(f"{self.prefix}due", record.id)
+        pipe.zrem(f"{self.prefix}leases", record.id)
+        pipe.zrem(self._recipient_key(record.recipient), record.id)
+        await pipe.execute()
+        await self._release_next(record.recipient)
+
+    async def reschedule(self, record: OutboxRecord):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(f"{self.prefix}pending", record.id, self._dump(record))
+        pipe.zrem(f"{self.prefix}leases", record.id)
+        pipe.zadd(f"{self.prefix}due", {record.id: record.next_attempt_at})
+        await pipe.execute()
+
+    async def dead_letter(self, record: OutboxRecord):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hdel(f"{self.prefix}pending", record.id)
+        pipe.zrem(f"{self.prefix}due", record.id)
+        pipe.zrem(f"{self.prefix}leases", record.id)
+        pipe.zrem(self._recipient_key(record.recipient), record.id)
+        pipe.hset(f"{self.prefix}dead", record.id, self._dump(record))
+        await pipe.execute()
+        await self._release_next(record.recipient)
+
+    async def list_dead(self, limit: int) -> List[OutboxRecord]:
+        rows = await self.redis.hvals(f"{self.prefix}dead")
+        records = sorted((OutboxRecord(**json.loads(row)) for row in rows), key=lambda record: record.id, reverse=True)
+        return records[:limit]
+
+    async def replay(self, dead_id: int) -> Optional[OutboxRecord]:
+        row = await self.redis.hget(f"{self.prefix}dead", dead_id)
+        if row is None:
+            return None
+        record = OutboxRecord(**json.loads(row))
+        record.attempts, record.next_attempt_at, record.failed_at = 0, 0.0, 0.0
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hdel(f"{self.prefix}dead", dead_id)
+        pipe.hset(f"{self.prefix}pending", record.id, self._dump(record))
+        pipe.zadd(f"{self.prefix}due", {record.id: 0})
+        pipe.zadd(self._recipient_key(record.recipient), {record.id: record.id})
+        await pipe.execute()
+        return record
+
+    async def counts(self) -> dict:
+        return {
+            "pending": await self.redis.hlen(f"{self.prefix}pending"),
+            "dead_letters": await self.redis.hlen(f"{self.prefix}dead"),
+        }
+
+# Sends an outbox record; raises on failure (PermanentDeliveryError to skip retries)
+DeliverFunc = Callable[[OutboxRecord], Awaitable[None]]
+
+class Outbox:
+    """
+    Durable delivery for outbound messages. enqueue() buffers records and returns
+    once the batch holding them is committed to the store (group commit); a
+    background worker delivers due records, retries failures with exponential
+    backoff and moves a record to the dead-letter table after OUTBOX_MAX_ATTEMPTS.
+    Workers sharing a store claim each record before delivering it; a claim
+    lapses after OUTBOX_LEASE seconds if the worker never settles the record.
+    A recipient's records are delivered in order: while one is pending (even
+    waiting for a retry) the later ones are held back.
+    """
+
+    def __init__(self, deliver: DeliverFunc):
+        self.deliver = deliver
+        redis_url = os.getenv("OUTBOX_REDIS_URL")
+        if redis_url:
+            self.store = RedisOutboxStore(redis_url)
+        else:
+            self.store = SQLiteOutboxStore(os.getenv("OUTBOX_SQLITE_PATH", "outbox.db"))
+
+        self.max_attempts = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+        self.backoff = float(os.getenv("OUTBOX_BACKOFF", 2.0))
+        self.max_backoff = float(os.getenv("OUTBOX_MAX_BACKOFF", 300))
+        self.flush_interval = float(os.getenv("OUTBOX_FLUSH_INTERVAL", 0.02))
+        self.batch_size = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+        self.lease = float(os.getenv("OUTBOX_LEASE", 300))
+
+        self._buffer: List[OutboxRecord] = []
+        self._flushed: asyncio.Future = None
+        self._flush_wakeup = asyncio.Event()
+        self._work_wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+        self.enqueued = 0
+        self.flushes = 0
+        self.delivered = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        await self.store.open()
+        self._tasks = [
+            asyncio.create_task(self._flush_loop(), name="outbox-flush"),
+            asyncio.create_task(self._deliver_loop(), name="outbox-deliver"),
+        ]
+        logger.info("Outbox started (%s)", type(self.store).__name__)
+
+    async def stop(self):
+        """Let the flush loop finish its current batch, persist what is still buffered, then stop delivering"""
+        if not self.running:
+            return
+        flush_task, deliver_task = self._tasks
+        self._stopping = True
+        self._flush_wakeup.set()
+        await asyncio.gather(flush_task, return_exceptions=True)
+        # Records enqueued while a flush is being written land in a new buffer
+        while self._buffer:
+            await self._flush()
+        deliver_task.cancel()
+        await asyncio.gather(deliver_task, return_exceptions=True)
+        self._tasks = []
+        self._stopping = False
+        await self.store.close()
+
+    async def enqueue(self, endpoint: str, recipient: str, body: bytes):
+        """Record a message for delivery; returns once it is persisted"""
+        now = time.time()
+        self._buffer.append(OutboxRecord(endpoint=endpoint, recipient=recipient, body=body.decode("utf-8"), created_at=now))
+        self.enqueued += 1
+        if self._flushed is None:
+            self._flushed = asyncio.get_running_loop().create_future()
+        flushed = self._flushed
+        if len(self._buffer) >= self.batch_size:
+            self._flush_wakeup.set()
+        await asyncio.shield(flushed)
+
+    async def _flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        flushed, self._flushed = self._flushed, None
+        try:
+            await self.store.add_many(batch)
+            self.flushes += 1
+            if flushed is not None:
+                flushed.set_result(len(batch))
+            self._work_wakeup.set()
+        except Exception as e:
+            logger.error("Outbox flush of %s records failed: %s", len(batch), e, exc_info=True)
+            if flushed is not None:
+                flushed.set_exception(e)
+                flushed.exception()
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            await self._flush()
+
+    async def _deliver_loop(self):
+        # Checked as well as cancelled: wait_for can swallow a cancel that lands as the wakeup fires
+        while not self._stopping:
+            try:
+                records = await self.store.claim(time.time(), self.batch_size, self.lease)
+                for record in records:
+                    await self._attempt(record)
+                if records:
+                    continue
+
+                next_due = await self.store.next_due_at()
+                timeout = 5.0 if next_due is None else min(max(next_due - time.time(), 0.0), 5.0)
+                try:
+                    await asyncio.wait_for(self._work_wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._work_wakeup.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Outbox worker error: %s", e, exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _attempt(self, record: OutboxRecord):
+        record.attempts += 1
+        try:
+            await self.deliver(record)
+            await self.store.mark_sent(record)
+            self.delivered += 1
+            return
+        except PermanentDeliveryError as e:
+            record.last_error = str(e)
+            record.attempts = max(record.attempts, self.max_attempts)
+        except Exception as e:
+            record.last_error = str(e) or type(e).__name__
+
+        if record.attempts >= self.max_attempts:
+            record.failed_at = time.time()
+            await self.store.dead_letter(record)
+            self.dead_lettered += 1
+            logger.error("Outbox message to %s dead-lettered after %s attempts: %s", record.recipient, record.attempts, record.last_error)
+            return
+
+        delay = min(self.backoff * (2 ** (record.attempts - 1)), self.max_backoff) * random.uniform(0.8, 1.2)
+        record.next_attempt_at = time.time() + delay
+        await self.store.reschedule(record)
+        self.retried += 1
+        logger.warning("Outbox message to %s failed (attempt %s), retrying in %.1fs: %s", record.recipient, record.attempts, delay, record.last_error)
+
+    async def list_dead_letters(self, limit: int = 50) -> List[dict]:
+        return [asdict(record) for record in await self.store.list_dead(limit)]
+
+    async def replay(self, dead_id: int) -> Optional[dict]:
+        record = await self.store.replay(dead_id)
+        if record is None:
+            return None
+        self._work_wakeup.set()
+        return asdict(record)
+
+    async def stats(self) -> dict:
+        stats = {
+            "running": self.running,
+            "backend": type(self.store).__name__,
+            "buffered": len(self._buffer),
+            "enqueued": self.enqueued,
+            "flushes": self.flushes,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+        }
+        if self.running:
+            try:
+                stats.update(await self.store.counts())
+            except Exception as e:
+                stats["store_error"] = str(e)
+        return stats
+
+def is_permanent_failure(response: httpx.Response) -> bool:
+    """4xx answers other than throttling will fail the same way on every retry"""
+    if not 400 <= response.status_code < 500 or response.status_code == 408:
+        return False
+    # Graph reports some rate limits (e.g. 131056, 130429) as a 400
+    return not OutboundScheduler.is_throttled(response)
@@ -1,22 +1,190 @@
-import requests
+import asyncio
+import httpx
 import re
 from globals.constants import PLMSUser, PLMSSecretKey, PLMSEndpoint
-from core.logger import get_logger
+from core.cache import TTLCache
+from core.circuit_breaker import CircuitBreakers
+from core.hedging import Hedger
+from core.http_client import build_async_client
+from core.metrics import UpstreamTimer
+from services.history_cache import TransactionHistoryCache
+from services.plms_token_manager import PLMSTokenManager
+from core.logger import get_logger, register_secret
 from datetime import datetime
 import hashlib
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
 
 logger = get_logger()
 
+# Paths of the upstream requests made by the current task, when tracked
+_upstream_calls: ContextVar[Optional[List[str]]] = ContextVar("plms_upstream_calls", default=None)
+
+@contextmanager
+def track_upstream_calls():
+    """Collect the PLMS paths requested inside the block, including concurrent child tasks"""
+    calls = []
+    token = _upstream_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _upstream_calls.reset(token)
+
+@dataclass(frozen=True)
+class PLMSCallContext:
+    """State of a single PLMS call, built per request so nothing is shared between users"""
+    token: str
+    phone_number: str = ""
+    action: str = "all"
+
 class PLMSService:
-    def __init__(self):
-        self.endpoint = PLMSEndpoint.ENDPOINT.value
-        self.token = None
-        self.q = None
+    def __init__(self, client: httpx.AsyncClient = None, endpoint: str = None):
+        self.endpoint = (endpoint or os.getenv("PLMS_ENDPOINT") or PLMSEndpoint.ENDPOINT.value).rstrip("/")
         self.mode = "mobile"
         self.with_balance = 1
+        self.client = client or build_async_client("PLMS", timeout=15.0)
+        self.token_manager = PLMSTokenManager(self._login_request)
+        register_secret(PLMSSecretKey.SECRET_KEY.value)
+        register_secret(PLMSUser.PASSWORD.value)
+        
+        # Short-lived read caches keyed by normalized phone number
+        cache_ttl = float(os.getenv("PLMS_CACHE_TTL", 30))
+        cache_entries = int(os.getenv("PLMS_CACHE_MAX_ENTRIES", 10_000))
+        cache_bytes = int(os.getenv("PLMS_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+        self.caches = {
+            name: TTLCache(name, cache_ttl, cache_entries, cache_bytes)
+            for name in ("validatemember", "tnc_info", "inquiry")
+        }
+        
+        # Transaction history is streamed page by page, up to a cap
+        self.history_page_size = int(os.getenv("PLMS_HISTORY_PAGE_SIZE", 20))
+        self.history_max_pages = int(os.getenv("PLMS_HISTORY_MAX_PAGES", 5))
+        # ...and cached per member, so a repeat request only fetches what is new
+        self.history_cache = TransactionHistoryCache()
+        
+        # Per-endpoint circuit breakers, which also set each request's timeout from the endpoint's p99
+        self.breakers = CircuitBreakers("plms", "PLMS", max_timeout=float(os.getenv("PLMS_TIMEOUT", 15.0)))
+        
+        # Optional hedging of idempotent reads: a slow attempt gets an identical twin, the first answer wins
+        self.hedger = Hedger("plms", "PLMS") if os.getenv("PLMS_HEDGE", "false").lower() == "true" else None
+        self.hedged_paths = {path.strip() for path in os.getenv("PLMS_HEDGE_PATHS", "/inquiry,/validatemember").split(",") if path.strip()}
+        
+    @property
+    def token(self) -> Optional[str]:
+        return self.token_manager.token
+        
+    async def start(self):
+        await self.token_manager.start()
+        
+    async def aclose(self):
+        await self.token_manager.stop()
+        await self.client.aclose()
+        
+    @staticmethod
+    def normalize_phone(phone_number: str) -> str:
+        """Convert 62xxx WhatsApp ids into the 0xxx format PLMS expects"""
+        if phone_number.startswith("62"):
+            return "0" + phone_number[2:]
+        return phone_number
+        
+    async def _context(self, phone_number: str = "", **kwargs) -> PLMSCallContext:
+        token = await self.token_manager.get_token()
+        return PLMSCallContext(token=token, phone_number=self.normalize_phone(phone_number), **kwargs)
+        
+    async def _post(self, path: str, payload: dict) -> httpx.Response:
+        calls = _upstream_calls.get()
+        if calls is not None:
+            calls.append(path)
+        breaker = self.breakers.get(path)
+        breaker.allow()
+        started = time.perf_counter()
+        try:
+            with UpstreamTimer("plms", path) as timer:
+                response = await self.client.post(f"{self.endpoint}{path}", json=payload, timeout=breaker.timeout())
+                timer.record_status(response.status_code)
+        except httpx.TransportError:
+            breaker.on_failure()
+            raise
+        except BaseException:
+            breaker.on_abandon()
+            raise
+            
+        if response.status_code >= 500:
+            breaker.on_failure()
+        else:
+            breaker.on_success(time.perf_counter() - started)
+        return response
+        
+    @staticmethod
+    def _token_expired(response: httpx.Response) -> bool:
+        try:
+            return response.json().get("response_code") == "E004"
+        except Exception:
+            return False
+        
+    async def _send(self, path: str, build: Callable[[PLMSCallContext], dict], phone_number: str = "", **kwargs) -> httpx.Response:
+        """
+        Post the payload built from a fresh call context. An E004 (expired token)
+        answer invalidates the token and the request is rebuilt and sent once more.
+        """
+        ctx = await self._context(phone_number, **kwargs)
+        response = await self._attempt(path, build(ctx))
+        
+        if self._token_expired(response):
+            logger.warning("PLMS token expired on %s, refreshing and retrying once", path)
+            await self.token_manager.invalidate(ctx.token)
+            ctx = await self._context(phone_number, **kwargs)
+            response = await self._attempt(path, build(ctx))
+            
+        return response
+        
+    async def _attempt(self, path: str, payload: dict) -> httpx.Response:
+        """One logical request, hedged when the path is an idempotent read and hedging is on"""
+        if self.hedger is not None and path in self.hedged_paths:
+            return await self.hedger.run(path, lambda: self._post(path, payload))
+        return await self._post(path, payload)
+        
+    @staticmethod
+    def _cacheable(data: dict) -> bool:
+        # Business answers only; never keep transport or token errors around
+        return isinstance(data, dict) and data.get("response_code") in ("00", "E073")
+        
+    async def _cached(self, cache_name: str, phone_number: str, load: Callable[[str], Awaitable[dict]], fresh: bool = False) -> dict:
+        cache = self.caches[cache_name]
+        key = self.normalize_phone(phone_number)
+        if fresh:
+            data = await load(phone_number)
+            if self._cacheable(data):
+                cache.set(key, data)
+            return data
+        return await cache.get_or_load(key, lambda: load(phone_number), cacheable=self._cacheable)
+        
+    def invalidate_member(self, *phone_numbers: str):
+        """Forget cached lookups after a write that changes the member's state"""
+        for phone_number in phone_numbers:
+            if not phone_number:
+                continue
+            key = self.normalize_phone(phone_number)
+            for cache in self.caches.values():
+                cache.invalidate(key)
+            self.history_cache.invalidate(key)
+                
+    def cache_stats(self) -> dict:
+        return {name: cache.stats() for name, cache in self.caches.items()}
+        
+    def breaker_stats(self) -> dict:
+        return self.breakers.stats()
         
+    def hedge_stats(self) -> dict:
+        if self.hedger is None:
+            return {"enabled": False}
+        return {"enabled": True, "budget": self.hedger.budget, "percentile": self.hedger.percentile, "endpoints": self.hedger.stats()}
         
-    def login(self):
+    async def _login_request(self):
         text = PLMSUser.USERNAME.value + PLMSUser.PASSWORD.value + PLMSSecretKey.SECRET_KEY.value
         checksum = hashlib.sha256(text.encode()).hexdigest()
     
@@ -27,42 +195,46 @@ class PLMSService:
         }
         
         try:
-            response = requests.post(f"{self.endpoint}/login", json=payload)
+            response = await self._post("/login", payload)
             response.raise_for_status()
             data = response.json()
-            self.token = data.get("token")
+            token = data.get("token")
             
-            if not self.token:
+            if not token:
                 raise ValueError("Token not found in login response")
             
             logger.info("PLMS login successful, token acquired.")
-            return self.token
+            expires_in = data.get("expires_in")
+            return token, float(expires_in) if expires_in else None
         
         except Exception as e:
-            logger.error(f"PLMS login failed: {e}")
+            logger.error("PLMS login failed: %s", e)
             raise
         
-    def validate_member(self, phone_number: str):
-        if not self.token:
-            self.login()
+    async def login(self):
+        """Force a new login, shared with any other caller already logging in"""
+        return await self.token_manager.refresh(stale=self.token)
         
-        if phone_number.startswith("62"):
-            phone_number = "0" + phone_number[2:]
-            
-        text = self.mode + phone_number + self.token + PLMSSecretKey.SECRET_KEY.value
-        checksum = str(hashlib.sha256(text.encode()).hexdigest())
+    async def validate_member(self, phone_number: str, fresh: bool = False):
+        return await self._cached("validatemember", phone_number, self._validate_member, fresh)
         
-        payload = {
-            "mode": self.mode,
-            "id": phone_number,
-            "token": self.token,
-            "checksum": checksum
-        }
+    async def _validate_member(self, phone_number: str):
+        def build(ctx: PLMSCallContext) -> dict:
+            text = self.mode + ctx.phone_number + ctx.token + PLMSSecretKey.SECRET_KEY.value
+            checksum = str(hashlib.sha256(text.encode()).hexdigest())
+            
+            return {
+                "mode": self.mode,
+                "id": ctx.phone_number,
+                "token": ctx.token,
+                "checksum": checksum
+            }
         
         try:
-            response = requests.post(f"{self.endpoint}/validatemember", json=payload)
+            response = await self._send("/validatemember", build, phone_number)
+            response.raise_for_status()
             data = response.json()
-            logger.info(f"VALIDATE MEMBER | Response: {data}")
+            logger.info("VALIDATE MEMBER | Response: %s", data)
             response_code = data.get("response_code")
             
             if response_code == "E004":
@@ -71,19 +243,15 @@ class PLMSService:
             return data
         
         except Exception as e:
-            logger.error(f"Validate member failed: {e}")
+            logger.error("Validate member failed: %s", e)
             raise
         
-    def member_activation(self, phone_number: str, register_data: dict):
-        if not self.token:
-            self.login()
-            
+    async def member_activation(self, phone_number: str, register_data: dict):
         data = register_data
 
         # Remove 62 form Phone Number into 0
-        phone_number = data.get("phone_number", "")
-        if phone_number.startswith("62"):
-            phone_number = "0" + phone_number[2:]
+        register_phone = phone_number
+        phone_number = self.normalize_phone(data.get("phone_number", ""))
             
         # Remove All Special Characters From Address
         address = data.get("address", "")
@@ -102,69 +270,71 @@ class PLMSService:
         gender = data.get("gender", "")
         marital = data.get("marital", "")
         
-        # Checksum sesuai urutan: name + birth_date + phone_number + email + card_number + gender + marital + address + token + secretKey
-        text = name + birth_date + phone_number + email + card_number + gender + marital + address + self.token + PLMSSecretKey.SECRET_KEY.value
-        checksum = str(hashlib.sha256(text.encode()).hexdigest())
+        def build(ctx: PLMSCallContext) -> dict:
+            # Checksum sesuai urutan: name + birth_date + phone_number + email + card_number + gender + marital + address + token + secretKey
+            text = name + birth_date + phone_number + email + card_number + gender + marital + address + ctx.token + PLMSSecretKey.SECRET_KEY.value
+            checksum = str(hashlib.sha256(text.encode()).hexdigest())
 
-        payload = {
-            "name": name,
-            "birth_date": birth_date,
-            "phone_number": phone_number,
-            "email": email,
-            "card_number": card_number,
-            "gender": gender,
-            "marital": marital,
-            "address": address,      
-            "token": self.token,
-            "checksum": checksum
-        }
+            payload = {
+                "name": name,
+                "birth_date": birth_date,
+                "phone_number": phone_number,
+                "email": email,
+                "card_number": card_number,
+                "gender": gender,
+                "marital": marital,
+                "address": address,      
+                "token": ctx.token,
+                "checksum": checksum
+            }
 
-        logger.info(f"PAYLOAD MEMBER ACTIVATION: {payload}")
+            logger.info("PAYLOAD MEMBER ACTIVATION: %s", payload)
+            return payload
         
         try:
-            response = requests.post(f"{self.endpoint}/memberactivation", json=payload)
+            response = await self._send("/memberactivation", build)
             response.raise_for_status()
             data = response.json()
-            logger.info(f"MEMBER ACTIVATION RESPONSE {data}")
+            logger.info("MEMBER ACTIVATION RESPONSE %s", data)
+            self.invalidate_member(register_phone, phone_number)
             return data
 
         except Exception as e:
-            logger.error(f"Member activation failed: {e}")
+            logger.error("Member activation failed: %s", e)
             raise
         
-    def inquiry(self, phone_number: str):
-        if not self.token:
-            self.login()
+    async def inquiry(self, phone_number: str, fresh: bool = False):
+        return await self._cached("inquiry", phone_number, self._inquiry, fresh)
+        
+    async def _inquiry(self, phone_number: str):
+        def build(ctx: PLMSCallContext) -> dict:
+            text = self.mode + ctx.phone_number + str(self.with_balance) + ctx.token + PLMSSecretKey.SECRET_KEY.value
+            logger.debug("Inquiry Checksum: %s", text)
+            checksum = str(hashlib.sha256(text.encode()).hexdigest())
             
-        if phone_number.startswith("62"):
-            phone_number = "0" + phone_number[2:]
+            payload = {
+                "mode": self.mode,
+                "id": ctx.phone_number,
+                "with_balance": self.with_balance,
+                "token": ctx.token,
+                "checksum": checksum 
+            }
             
-        text = self.mode + phone_number + str(self.with_balance) + self.token + PLMSSecretKey.SECRET_KEY.value
-        logger.info(f"Inquiry Checksum: {text}")
-        checksum = str(hashlib.sha256(text.encode()).hexdigest())
-        
-        payload = {
-            "mode": self.mode,
-            "id": phone_number,
-            "with_balance": self.with_balance,
-            "token": self.token,
-            "checksum": checksum 
-        }
-        
-        logger.info(f"PAYLOAD INQUIRY: {payload}")
+            logger.info("PAYLOAD INQUIRY: %s", payload)
+            return payload
         
         try :
-            response = requests.post(f"{self.endpoint}/inquiry", json=payload)
+            response = await self._send("/inquiry", build, phone_number)
             response.raise_for_status()
             data = response.json()
-            logger.info(f"Inquiry response : {data}")
+            logger.info("Inquiry response : %s", data)
             return data
 
         except Exception as e:
-            logger.error(f"Failed to inquiring member: {e}")
+            logger.error("Failed to inquiring member: %s", e)
             raise
         
-    def transaction_history(
+    async def transaction_history_page(
         self,
         phone_number: str,
         startDate: str,
@@ -172,154 +342,174 @@ class PLMSService:
         page: int = 1,
         listItem: int = 20):
         
-        if not self.token:
-            self.login
+        def build(ctx: PLMSCallContext) -> dict:
+            text = self.mode + ctx.phone_number + startDate + endDate + str(page) + str(listItem) + ctx.token + PLMSSecretKey.SECRET_KEY.value
+            logger.debug("Text from transaction history: %s", text)
+            checksum = str(hashlib.sha256(text.encode()).hexdigest())
+            logger.debug("Checksum from transaction history: %s", checksum)
             
-        if phone_number.startswith("62"):
-            phone_number = "0" + phone_number[2:]
+            payload = {
+                "mode": self.mode,
+                "id": ctx.phone_number,
+                "start_date": startDate,
+                "end_date": endDate,
+                "page": page,
+                "list_item": listItem,
+                "token": ctx.token,
+                "checksum": checksum   
+            }
             
-        text = self.mode + phone_number + startDate + endDate + str(page) + str(listItem) + self.token + PLMSSecretKey.SECRET_KEY.value
-        logger.info(f"Text from transaction history: {text}")
-        checksum = str(hashlib.sha256(text.encode()).hexdigest())
-        logger.info(f"Checksum from transaction history: {checksum}")
-        
-        
-        payload = {
-            "mode": self.mode,
-            "id": phone_number,
-            "start_date": startDate,
-            "end_date": endDate,
-            "page": page,
-            "list_item": listItem,
-            "token": self.token,
-            "checksum": checksum   
-        }
-        
-        logger.info(f"Payload Transaction History: {payload}")
+            logger.info("Payload Transaction History: %s", payload)
+            return payload
         
         try :
-            response = requests.post(f"{self.endpoint}/transactionhistory", json=payload)
+            response = await self._send("/transactionhistory", build, phone_number)
             response.raise_for_status()
             data = response.json()
-            logger.info(f"Transactio History response : {data}")
+            logger.info("Transactio History response : %s", data)
             return data
 
         except Exception as e:
-            logger.error(f"Failed to see transaction history member: {e}")
+            logger.error("Failed to see transaction history member: %s", e)
             raise
         
+    async def transaction_history(
+        self,
+        phone_number: str,
+        startDate: str,
+        endDate: str,
+        listItem: int = None,
+        max_pages: int = None) -> AsyncIterator[dict]:
+        """
+        Stream the history pages of a date window, newest first. The next page is
+        requested while the caller handles the current one. Stops after a page
+        with fewer than `listItem` rows, at total_page, on an error answer or
+        after `max_pages` pages; a page cut off there is marked "truncated".
+        """
+        listItem = listItem or self.history_page_size
+        max_pages = max_pages or self.history_max_pages
+        
+        def fetch(page: int) -> asyncio.Future:
+            return asyncio.ensure_future(self.transaction_history_page(phone_number, startDate, endDate, page, listItem))
             
-        
-    def tnc_info(self, phone_number: str):
-        self.action = "all"
-        if not self.token:
-            self.login()
+        page = 1
+        pending = None
+        # Nothing to overlap the first page with, so it is awaited directly
+        data = await self.transaction_history_page(phone_number, startDate, endDate, page, listItem)
+        try:
+            while True:
+                rows = data.get("history") or []
+                total_page = data.get("total_page")
+                more = (
+                    data.get("response_code") == "00"
+                    and len(rows) >= listItem
+                    and (total_page is None or page < int(total_page))
+                )
+                if more and page >= max_pages:
+                    more = False
+                    data["truncated"] = True
+                if more:
+                    pending = fetch(page + 1)
+                yield data
+                if not more:
+                    return
+                page += 1
+                data = await pending
+                pending = None
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+        
+    def transaction_history_rows(self, phone_number: str, startDate: str, endDate: str) -> AsyncIterator[dict]:
+        """
+        The history rows of a date window, newest first. Only the days since the
+        member's history was last fetched are requested; older rows come from
+        the history cache.
+        """
+        return self.history_cache.rows(
+            self.normalize_phone(phone_number), startDate, endDate,
+            lambda start: self.transaction_history(phone_number, start, endDate)
+        )
+        
+    async def tnc_info(self, phone_number: str, fresh: bool = False):
+        return await self._cached("tnc_info", phone_number, self._tnc_info, fresh)
+        
+    async def _tnc_info(self, phone_number: str):
+        def build(ctx: PLMSCallContext) -> dict:
+            text = self.mode + ctx.phone_number + ctx.action + ctx.token + PLMSSecretKey.SECRET_KEY.value
+            logger.debug("TNC Info Checksum %s", text)
+            checksum = str(hashlib.sha256(text.encode()).hexdigest())
             
-        logger.info(f"Token TNC : {self.token}")
+            payload = {
+                "mode": self.mode,
+                "id": ctx.phone_number,
+                "action": ctx.action,
+                "token": ctx.token,
+                "checksum": checksum
+            }
             
-        if phone_number.startswith("62"):
-            phone_number = "0" + phone_number[2:]
-
-        text = self.mode + phone_number + self.action + self.token + PLMSSecretKey.SECRET_KEY.value
-        logger.info(f"TNC Info Checksum {text}")
-        checksum = str(hashlib.sha256(text.encode()).hexdigest())
-        
-        payload = {
-            "mode": self.mode,
-            "id": phone_number,
-            "action": self.action,
-            "token": self.token,
-            "checksum": checksum
-        }
+            logger.info("TNC Payload : %s", payload)
+            return payload
         
-        logger.info(f"TNC Payload : {payload}")
         try :
-            response = requests.post(f"{self.endpoint}/tnc/info", json=payload)
+            response = await self._send("/tnc/info", build, phone_number)
             response.raise_for_status()
             data = response.json()
-            logger.info(f"TNC Info Response : {data}")
+            logger.info("TNC Info Response : %s", data)
             return data                  
                                      
         except Exception as e:
-            logger.error(f"Failed to load TNC Info Member: {e}")
+            logger.error("Failed to load TNC Info Member: %s", e)
             raise
     
-    def tnc_inquiry(self, phone_number: str):
-        self.action = "all"
-        if not self.token:
-            self.login()
+    async def tnc_inquiry(self, q: str):
+        def build(ctx: PLMSCallContext) -> dict:
+            text = q + ctx.token + PLMSSecretKey.SECRET_KEY.value
+            logger.debug("TNC Inquiry Checksum %s", text)
+            checksum = str(hashlib.sha256(text.encode()).hexdigest())
             
-        if phone_number.startswith("62"):
-            phone_number = "0" + phone_number[2:]
-        
-        tnc_info = self.tnc_info(phone_number)
-        self.q = tnc_info.get("q")
-        logger.info(f"Session from TNC info (q): {self.q}")
-
-        text = self.q + self.token + PLMSSecretKey.SECRET_KEY.value
-        logger.info(f"TNC Inquiry Checksum {text}")
-        checksum = str(hashlib.sha256(text.encode()).hexdigest())
-        
-        payload = {
-            "q": self.q,
-            "token": self.token,
-            "checksum": checksum
-        }
+            return {
+                "q": q,
+                "token": ctx.token,
+                "checksum": checksum
+            }
         
         try :
-            response = requests.post(f"{self.endpoint}/tnc/inquiry", json=payload)
+            response = await self._send("/tnc/inquiry", build)
             response.raise_for_status()
             data = response.json()
-            logger.info(f"TNC Inquiry Response : {data}")
+            logger.info("TNC Inquiry Response : %s", data)
             return data                  
                                      
         except Exception as e:
-            logger.error(f"Failed to load TNC Inquiry Member: {e}")
+            logger.error("Failed to load TNC Inquiry Member: %s", e)
             raise
         
         
-    def tnc_commit(self, phone_number: str):
-        if not self.token:
-            self.login()
+    async def tnc_commit(self, q: str, member_id: str, phone_number: str = None):
+        def build(ctx: PLMSCallContext) -> dict:
+            text = q + str(member_id) + ctx.token + PLMSSecretKey.SECRET_KEY.value
+            logger.debug("TNC Commit Checksum %s", text)
+            checksum = str(hashlib.sha256(text.encode()).hexdigest())
             
-        if phone_number.startswith("62"):
-            phone_number = "0" + phone_number[2:]
+            payload = {
+                "q": q,
+                "member_id": member_id,
+                "token": ctx.token,
+                "checksum": checksum
+            }
             
-        tnc_info = self.tnc_info(phone_number)
-        self.q = tnc_info.get("q")
-        logger.info(f"Session from TNC info (q): {self.q}")
-        
-        tnc_inquiry = self.tnc_inquiry(phone_number)
-        member_id = tnc_inquiry.get("member_id")
-        logger.info(f"Member ID: {member_id}")
-        
-        text = self.q + str(member_id) + self.token + PLMSSecretKey.SECRET_KEY.value
-        logger.info(f"TNC Commit Checksum {text}")
-        checksum = str(hashlib.sha256(text.encode()).hexdigest())
-        
-        payload = {
-            "q": self.q,
-            "member_id": member_id,
-            "token": self.token,
-            "checksum": checksum
-        }
-        
-        logger.info(f"Commit Payload : {payload}")
+            logger.info("Commit Payload : %s", payload)
+            return payload
         
         try :
-            response = requests.post(f"{self.endpoint}/tnc/commit", json=payload)
+            response = await self._send("/tnc/commit", build)
             response.raise_for_status()
             data = response.json()
-            logger.info(f"TNC Commit Response : {data}")
+            logger.info("TNC Commit Response : %s", data)
+            self.invalidate_member(phone_number)
             return data                  
                                      
         except Exception as e:
-            logger.error(f"Failed to load TNC Inquiry Member: {e}")
+            logger.error("Failed to commit TNC Member: %s", e)
             raise
-        
-        
-        
-
-        
-    
-        
\ No newline at end of file
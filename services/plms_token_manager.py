@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Optional, Tuple
+from core.redis_client import get_redis
+from core.logger import get_logger, register_secret
+
+logger = get_logger()
+
+# Returns (token, lifetime in seconds or None when PLMS does not say)
+LoginFunc = Callable[[], Awaitable[Tuple[str, Optional[float]]]]
+
+class PLMSTokenManager:
+    """
+    Owns the PLMS token. Logins are single-flight (a burst of callers shares one
+    login), a background task refreshes the token before it expires, and with
+    a Redis URL the token is shared by every worker process.
+    """
+
+    REDIS_KEY = "plms:token"
+    REDIS_LOCK_KEY = "plms:token:lock"
+
+    def __init__(self, login: LoginFunc, ttl: float = None, refresh_margin: float = None, redis_url: str = None):
+        self._login = login
+        self.ttl = float(ttl if ttl is not None else os.getenv("PLMS_TOKEN_TTL", 3600))
+        self.refresh_margin = float(refresh_margin if refresh_margin is not None else os.getenv("PLMS_TOKEN_REFRESH_MARGIN", 300))
+        self.redis_url = redis_url if redis_url is not None else os.getenv("PLMS_TOKEN_REDIS_URL")
+
+        self.token: Optional[str] = None
+        self.expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
+
+        self.logins = 0
+        self.refreshes = 0
+        self.invalidations = 0
+        self.shared_hits = 0
+
+    @property
+    def redis(self):
+        return get_redis(self.redis_url) if self.redis_url else None
+
+    def _fresh(self) -> bool:
+        return bool(self.token) and time.time() < self.expires_at
+
+    async def get_token(self) -> str:
+        if self._fresh():
+            return self.token
+        return await self.refresh(stale=self.token)
+
+    async def refresh(self, stale: Optional[str] = None) -> str:
+        """
+        Acquire a new token. Callers queued behind an in-flight login reuse its
+        result instead of logging in again, unless their token is still `stale`.
+        """
+        async with self._lock:
+            if self._fresh() and self.token != stale:
+                return self.token
+
+            if self.redis is not None and await self._load_shared(stale):
+                return self.token
+
+            await self._acquire(stale)
+            return self.token
+
+    async def invalidate(self, token: str):
+        """Drop a token PLMS rejected (E004), locally and in the shared store"""
+        if token != self.token:
+            return
+        self.invalidations += 1
+        self.token = None
+        self.expires_at = 0.0
+        if self.redis is not None:
+            try:
+                shared = await self.redis.get(self.REDIS_KEY)
+                if shared and json.loads(shared).get("token") == token:
+                    await self.redis.delete(self.REDIS_KEY)
+            except Exception as e:
+                logger.warning("Failed to invalidate shared PLMS token: %s", e)
+
+    async def _acquire(self, stale: Optional[str]):
+        if self.redis is None:
+            await self._login_locally()
+            return
+
+        # Only one worker logs in; the others wait for it to publish the token
+        lock_id = uuid.uuid4().hex
+        try:
+            locked = await self.redis.set(self.REDIS_LOCK_KEY, lock_id, nx=True, px=10_000)
+        except Exception as e:
+            logger.warning("Shared PLMS token store unavailable, logging in locally: %s", e)
+            await self._login_locally()
+            return
+
+        if not locked:
+            for _ in range(50):
+                await asyncio.sleep(0.2)
+                if await self._load_shared(stale):
+                    return
+            logger.warning("Timed out waiting for another worker to log in to PLMS")
+
+        try:
+            await self._login_locally()
+            await self.redis.set(
+                self.REDIS_KEY,
+                json.dumps({"token": self.token, "expires_at": self.expires_at}),
+                ex=max(int(self.expires_at - time.time()), 1),
+            )
+        finally:
+            if locked and await self.redis.get(self.REDIS_LOCK_KEY) == lock_id:
+                await self.redis.delete(self.REDIS_LOCK_KEY)
+
+    async def _load_shared(self, stale: Optional[str]) -> bool:
+        try:
+            shared = await self.redis.get(self.REDIS_KEY)
+        except Exception as e:
+            logger.warning("Failed to read shared PLMS token: %s", e)
+            return False
+        if not shared:
+            return False
+        data = json.loads(shared)
+        if data.get("token") == stale or data.get("expires_at", 0) <= time.time():
+            return False
+        self.token = data["token"]
+        self.expires_at = data["expires_at"]
+        register_secret(self.token)
+        self.shared_hits += 1
+        return True
+
+    async def _login_locally(self):
+        token, lifetime = await self._login()
+        self.logins += 1
+        self.token = token
+        self.expires_at = time.time() + (lifetime if lifetime else self.ttl)
+        register_secret(token)
+
+    async def start(self):
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop(), name="plms-token-refresh")
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    async def _refresh_loop(self):
+        while True:
+            if not self.token:
+                # Nothing to keep warm until the first request logs in
+                await asyncio.sleep(5)
+                continue
+
+            due_in = self.expires_at - self.refresh_margin - time.time()
+            if due_in > 0:
+                await asyncio.sleep(min(due_in, 60))
+                continue
+
+            try:
+                # Treat the current token as stale so a real login happens
+                await self.refresh(stale=self.token)
+                self.refreshes += 1
+                logger.info("PLMS token refreshed ahead of expiry")
+            except Exception as e:
+                logger.error("Background PLMS token refresh failed: %s", e)
+                await asyncio.sleep(10)
+
+    def stats(self) -> dict:
+        return {
+            "has_token": bool(self.token),
+            "expires_in": round(max(self.expires_at - time.time(), 0), 1),
+            "shared": self.redis_url is not None,
+            "logins": self.logins,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+            "shared_hits": self.shared_hits,
+        }
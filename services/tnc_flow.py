@@ -0,0 +1,65 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from services.plms_service import PLMSService, track_upstream_calls
+from core.logger import get_logger
+
+logger = get_logger()
+
+@dataclass
+class TncFlowResult:
+    phone_number: str
+    card_number: str = ""
+    q: Optional[str] = None
+    member_id: Optional[str] = None
+    inquiry: dict = field(default_factory=dict)
+    commit: Optional[dict] = None
+    upstream_calls: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def inquiry_code(self) -> Optional[str]:
+        return self.inquiry.get("response_code")
+
+    @property
+    def commit_code(self) -> Optional[str]:
+        return self.commit.get("response_code") if self.commit else None
+
+class TncFlow:
+    """
+    T&C confirmation pipeline. Each piece of PLMS state (q session, member_id,
+    card number) is fetched once and handed to the next step:
+
+        lookup  -> validate_member + tnc_info, concurrently
+        inquiry -> tnc_inquiry(q)
+        commit  -> tnc_commit(q, member_id), only when the inquiry succeeded
+    """
+
+    def __init__(self, plms_service: PLMSService):
+        self.plms_service = plms_service
+
+    async def run(self, phone_number: str) -> TncFlowResult:
+        result = TncFlowResult(phone_number=phone_number)
+        try:
+            with track_upstream_calls() as calls:
+                member, tnc_info = await asyncio.gather(
+                    self.plms_service.validate_member(phone_number),
+                    # The q session must be fresh: PLMS consumes it on commit
+                    self.plms_service.tnc_info(phone_number, fresh=True),
+                )
+            result.upstream_calls["lookup"] = len(calls)
+            result.card_number = member.get("card_number", "")
+            result.q = tnc_info.get("q")
+
+            with track_upstream_calls() as calls:
+                result.inquiry = await self.plms_service.tnc_inquiry(result.q)
+            result.upstream_calls["inquiry"] = len(calls)
+            result.member_id = result.inquiry.get("member_id")
+
+            if result.inquiry_code == "00":
+                with track_upstream_calls() as calls:
+                    result.commit = await self.plms_service.tnc_commit(result.q, result.member_id, phone_number)
+                result.upstream_calls["commit"] = len(calls)
+
+            return result
+        finally:
+            logger.info("TNC flow %s upstream calls: %s (total %s)", phone_number, result.upstream_calls, sum(result.upstream_calls.values()))
@@ -1,6 +1,11 @@
 import os
 import httpx
-from core.logger import get_logger
+from core.http_client import build_async_client, http2_available, pool_stats
+from core.logger import get_logger, register_secret
+from core.metrics import UpstreamTimer
+from core.templates import TemplateRegistry, encode_json, slot
+from services.outbound_scheduler import OutboundScheduler
+from services.outbox_service import Outbox, OutboxRecord, PermanentDeliveryError, is_permanent_failure
 from fastapi import HTTPException
 from typing import List, Dict
 from dotenv import load_dotenv
@@ -11,52 +16,48 @@ logger = get_logger()
 load_dotenv()
 
 class WhatsAppService:
+    # Graph API limits on message bodies, in characters
+    TEXT_BODY_LIMIT = 4096
+    INTERACTIVE_BODY_LIMIT = 1024
 
     def __init__(self):
         self.token = os.getenv("TOKEN_META")
+        register_secret(self.token)
         self.phone_number_id = os.getenv("PHONE_NUMBER_ID")
-        self.base_url = "https://graph.facebook.com/v20.0"
+        self.base_url = os.getenv("WHATSAPP_BASE_URL", "https://graph.facebook.com/v20.0").rstrip("/")
         
         self.flow_mode = WAFlow.WAFLOW_MODE_ACTIVATE
         self.flow_id = WAFlow.WAFLOW_ID_ACTIVATE
         self.flow_token = WAFlow.WAFLOW_TOKEN_ACTIVATE
         self.flow_version = "3"
         
-    async def _post(self, endpoint: str, payload: dict) :
-        url = f"{self.base_url}/{self.phone_number_id}/{endpoint}?access_token={self.token}"
-        headers = {"Content-Type": "application/json"}
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, json=payload, headers=headers, timeout=10) # Add timeout
-                response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-                return response.json()
-            except httpx.HTTPError as e:
-                logger.error(f"WhatsApp API Error ({e.response.status_code if e.response else 'N/A'}): {e} - Endpoint: {endpoint}, Payload: {payload}")
-                raise HTTPException(status_code=500, detail=f"Failed to interact with WhatsApp API: {e}")
-            except httpx.TimeoutException as e:
-                logger.error(f"WhatsApp API Timeout Error: {e} - Endpoint: {endpoint}, Payload: {payload}")
-                raise HTTPException(status_code=504, detail="WhatsApp API request timed out")
-            except Exception as e:
-                logger.error(f"An unexpected error occurred during WhatsApp API call: {e} - Endpoint: {endpoint}, Payload: {payload}")
-                raise HTTPException(status_code=500, detail="Internal server error during WhatsApp API call")
-
-    async def send_message(self, to: str, message: str):
-        payload = {
+        self.http2 = os.getenv("WHATSAPP_HTTP2", "false").lower() == "true"
+        self.client: httpx.AsyncClient = None
+        self.scheduler = OutboundScheduler()
+        
+        # "critical" persists only sends flagged durable, "all" every send, "off" none
+        self.outbox_mode = os.getenv("OUTBOX_MODE", "critical").lower()
+        self.outbox = Outbox(self._deliver_record) if self.outbox_mode != "off" else None
+        
+        self.templates = TemplateRegistry()
+        self._register_templates()
+        
+    def _register_templates(self):
+        """Compile the fixed messages once; sending them only splices in `to` and the text"""
+        self.templates.register("text", {
             "messaging_product": "whatsapp",
-            "to": to,
+            "to": slot("to"),
             "type": "text",
-            "text": {"body": message},
-        }
-        await self._post("messages", payload)
-
-    async def send_greetings(self, to: str, username: str = "Pelanggan"):
-        payload = {
+            "text": {"body": slot("message")},
+        })
+        
+        self.templates.register("greetings", {
             "messaging_product": "whatsapp",
-            "to": to,
+            "to": slot("to"),
             "type": "interactive",
             "interactive": {
                 "type": "list",
-                "body": {"text": f"Halo *_{username}_*! 👋🏻 🤗. Selamat datang di layanan Member *Alfamidi*. Silahkan pilih layanan yang anda butuhkan."},
+                "body": {"text": f"Halo *_{slot('username')}_*! 👋🏻 🤗. Selamat datang di layanan Member *Alfamidi*. Silahkan pilih layanan yang anda butuhkan."},
                 "action": {
                     "sections": [{
                         "title": "Pilih Menu",
@@ -68,64 +69,15 @@ class WhatsAppService:
                     "button": "Pilih Menu"
                 }
             }
-        }
-        await self._post("messages", payload)
-        
-    async def send_cta_url_message(
-        self,
-        to: str,
-        button_url: str,
-        button_text: str, 
-        header_text: str = None,
-        body_text: str = None,
-        footer_text: str = None
-    ) :
+        })
         
-        interactive_payload = {
-            "type": "cta_url",
-            "action": {
-                "name": "cta_url",
-                "parameters": {
-                    "display_text": button_text,
-                    "url": button_url
-                }
-            }
-        }
-
-        if header_text:
-            interactive_payload["header"] = {
-                "type": "text",
-                "text": header_text
-            }
-
-        if body_text:
-            interactive_payload["body"] = {
-                "text": body_text
-            }
-
-        if footer_text:
-            interactive_payload["footer"] = {
-                "text": footer_text
-            }
-
-        payload = {
+        self.templates.register("main_menu", {
             "messaging_product": "whatsapp",
-            "recipient_type": "individual",
-            "to": to,
-            "type": "interactive",
-            "interactive": interactive_payload
-        }
-
-        await self._post("messages", payload)
-        
-    async def send_main_menu(self, to: str, message: str):
-        payload = {
-            "messaging_product": "whatsapp",
-            "to": to,
+            "to": slot("to"),
             "type": "interactive",
             "interactive": {
                 "type": "list",
-                "body": {"text": message},
+                "body": {"text": slot("message")},
                 "action": {
                     "sections": [{
                         "title": "Pilih Menu",
@@ -136,17 +88,15 @@ class WhatsAppService:
                     "button": "Pilih Menu"
                 }
             }
-        }
-        await self._post("messages", payload)
+        })
         
-    async def send_member_services_menu(self, to: str, message: str):
-        payload = {
+        self.templates.register("member_services_menu", {
             "messaging_product": "whatsapp",
-            "to": to,
+            "to": slot("to"),
             "type": "interactive",
             "interactive": {
                 "type": "list",
-                "body": {"text": message},
+                "body": {"text": slot("message")},
                 "action": {
                     "sections": [{
                         "title": "Layanan Member",
@@ -159,13 +109,11 @@ class WhatsAppService:
                     "button": "Pilih Layanan"
                 }
             }
-        }
-        await self._post("messages", payload)
-    
-    async def send_activation_menu(self, to: str):
-        payload = {
+        })
+        
+        self.templates.register("activation_menu", {
             "messaging_product": "whatsapp",
-            "to": to,
+            "to": slot("to"),
             "type": "interactive",
             "interactive": {
                 "type": "list",
@@ -181,13 +129,11 @@ class WhatsAppService:
                     "button": "Lanjutkan"
                 }
             }
-        }
-        await self._post("messages", payload)
+        })
         
-    async def send_form_register(self, to: str):
-        payload = {
+        self.templates.register("form_register", {
             "messaging_product": "whatsapp",
-            "to": to,
+            "to": slot("to"),
             "type": "interactive",
             "interactive": {
                 "type": "flow",
@@ -206,20 +152,167 @@ class WhatsAppService:
                         "flow_action_payload": {
                             "screen": "REGISTER",
                             "data": {
-                                "phone_number": to, 
+                                "phone_number": slot("to"), 
                             },
                         }
                     }
                 }
             }
+        })
+        
+    async def start(self):
+        """Open the application-scoped Graph API client"""
+        if self.client is not None:
+            return
+        http2 = self.http2
+        if http2 and not http2_available():
+            logger.warning("WHATSAPP_HTTP2 is enabled but the h2 package is missing, falling back to HTTP/1.1")
+            http2 = False
+        self.client = build_async_client("WHATSAPP", max_connections=50, max_keepalive=20, http2=http2)
+        if self.outbox is not None:
+            await self.outbox.start()
+        
+    async def aclose(self):
+        if self.outbox is not None:
+            await self.outbox.stop()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            
+    def pool_stats(self) -> dict:
+        if self.client is None:
+            return {"connections": 0, "in_use": 0, "idle": 0, "waiting": 0}
+        return pool_stats(self.client)
+        
+    async def _send(self, endpoint: str, content: bytes, to: str) -> httpx.Response:
+        """
+        One Graph API request through the outbound scheduler, which rate limits
+        per phone_number_id and keeps messages to one recipient in order.
+        """
+        url = f"{self.base_url}/{self.phone_number_id}/{endpoint}?access_token={self.token}"
+        headers = {"Content-Type": "application/json"}
+        
+        async def send() -> httpx.Response:
+            with UpstreamTimer("graph", endpoint) as timer:
+                response = await self.client.post(url, content=content, headers=headers)
+                timer.record_status(response.status_code)
+            return response
+            
+        return await self.scheduler.submit(self.phone_number_id, to or "", send)
+        
+    async def _deliver_record(self, record: OutboxRecord):
+        """Outbox delivery: raise so the outbox retries or dead-letters the record"""
+        if self.client is None:
+            await self.start()
+        response = await self._send(record.endpoint, record.body.encode("utf-8"), record.recipient)
+        if is_permanent_failure(response):
+            raise PermanentDeliveryError(f"{response.status_code}: {response.text}")
+        response.raise_for_status()
+        
+    async def _post(self, endpoint: str, payload: dict = None, content: bytes = None, to: str = None, durable: bool = False) :
+        """
+        Send either a payload dict or an already encoded JSON body (from a template).
+        Durable sends (or every send with OUTBOX_MODE=all) are persisted to the
+        outbox and delivered by its worker, with retries, instead of inline.
+        """
+        if self.client is None:
+            await self.start()
+        if content is None:
+            content = encode_json(payload)
+            to = to or payload.get("to")
+        else:
+            payload = content.decode("utf-8")
+            
+        if self.outbox is not None and self.outbox.running and (durable or self.outbox_mode == "all"):
+            await self.outbox.enqueue(endpoint, to or "", content)
+            return None
+            
+        try:
+            response = await self._send(endpoint, content, to)
+            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+            return response.json()
+        except httpx.HTTPError as e:
+            logger.error("WhatsApp API Error (%s): %s - Endpoint: %s, Payload: %s", e.response.status_code if e.response else 'N/A', e, endpoint, payload)
+            raise HTTPException(status_code=500, detail=f"Failed to interact with WhatsApp API: {e}")
+        except httpx.TimeoutException as e:
+            logger.error("WhatsApp API Timeout Error: %s - Endpoint: %s, Payload: %s", e, endpoint, payload)
+            raise HTTPException(status_code=504, detail="WhatsApp API request timed out")
+        except Exception as e:
+            logger.error("An unexpected error occurred during WhatsApp API call: %s - Endpoint: %s, Payload: %s", e, endpoint, payload)
+            raise HTTPException(status_code=500, detail="Internal server error during WhatsApp API call")
+
+    async def send_message(self, to: str, message: str, durable: bool = False):
+        await self._post("messages", content=self.templates.render("text", to=to, message=message), to=to, durable=durable)
+
+    async def send_greetings(self, to: str, username: str = "Pelanggan"):
+        await self._post("messages", content=self.templates.render("greetings", to=to, username=username), to=to)
+        
+    async def send_cta_url_message(
+        self,
+        to: str,
+        button_url: str,
+        button_text: str, 
+        header_text: str = None,
+        body_text: str = None,
+        footer_text: str = None,
+        durable: bool = False
+    ) :
+        
+        interactive_payload = {
+            "type": "cta_url",
+            "action": {
+                "name": "cta_url",
+                "parameters": {
+                    "display_text": button_text,
+                    "url": button_url
+                }
+            }
         }
-        await self._post("messages", payload)
+
+        if header_text:
+            interactive_payload["header"] = {
+                "type": "text",
+                "text": header_text
+            }
+
+        if body_text:
+            interactive_payload["body"] = {
+                "text": body_text
+            }
+
+        if footer_text:
+            interactive_payload["footer"] = {
+                "text": footer_text
+            }
+
+        payload = {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": to,
+            "type": "interactive",
+            "interactive": interactive_payload
+        }
+
+        await self._post("messages", payload, durable=durable)
+        
+    async def send_main_menu(self, to: str, message: str):
+        await self._post("messages", content=self.templates.render("main_menu", to=to, message=message), to=to)
+        
+    async def send_member_services_menu(self, to: str, message: str, durable: bool = False):
+        await self._post("messages", content=self.templates.render("member_services_menu", to=to, message=message), to=to, durable=durable)
+    
+    async def send_activation_menu(self, to: str):
+        await self._post("messages", content=self.templates.render("activation_menu", to=to), to=to)
+        
+    async def send_form_register(self, to: str):
+        await self._post("messages", content=self.templates.render("form_register", to=to), to=to)
         
     async def send_message_with_button(
         self,
         to: str,
         message: str,
-        buttons: List[Dict]
+        buttons: List[Dict],
+        durable: bool = False
     ):
         """
         buttons: list of dicts in the format:
@@ -256,6 +349,6 @@ class WhatsAppService:
             }
         }
 
-        await self._post("messages", payload)
+        await self._post("messages", payload, durable=durable)
 
     
\ No newline at end of file
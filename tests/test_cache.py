@@ -0,0 +1,43 @@
+import asyncio
+from core.cache import TTLCache
+
+def test_cancelling_the_first_caller_leaves_the_load_to_the_others():
+    async def scenario():
+        cache = TTLCache("test", ttl=60, max_entries=10)
+        release = asyncio.Event()
+        loads = []
+
+        async def load():
+            loads.append(1)
+            await release.wait()
+            return "value"
+
+        owner = asyncio.ensure_future(cache.get_or_load("key", load))
+        waiter = asyncio.ensure_future(cache.get_or_load("key", load))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await waiter == "value"
+        assert owner.cancelled()
+        assert loads == [1]
+        assert cache.get("key") == "value"
+        assert cache.stats()["inflight"] == 0
+
+    asyncio.run(scenario())
+
+def test_a_failed_load_reaches_every_caller_and_is_not_cached():
+    async def scenario():
+        cache = TTLCache("test", ttl=60, max_entries=10)
+
+        async def load():
+            await asyncio.sleep(0)
+            raise ValueError("upstream")
+
+        results = await asyncio.gather(
+            cache.get_or_load("key", load), cache.get_or_load("key", load), return_exceptions=True)
+        assert [type(result) for result in results] == [ValueError, ValueError]
+        assert cache.get("key") is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+import asyncio
+from core.dispatcher import LaneDispatcher
+
+def test_a_cancelled_event_fails_without_stopping_the_lane():
+    async def scenario():
+        processed = []
+
+        async def process(event):
+            if event == "cancelled":
+                raise asyncio.CancelledError()
+            processed.append(event)
+
+        dispatcher = LaneDispatcher(process, key=lambda event: "6281234567890", lanes=1)
+        await dispatcher.start()
+        try:
+            assert await dispatcher.submit_batch(["first", "cancelled", "last"]) == [True, False, True]
+            assert await dispatcher.submit_batch(["after"]) == [True]
+            assert processed == ["first", "last", "after"]
+            assert dispatcher.failed == 1
+            assert not dispatcher.lanes[0].task.done()
+        finally:
+            await dispatcher.stop(timeout=1)
+
+    asyncio.run(scenario())
+
+def test_stop_still_cancels_a_busy_lane():
+    async def scenario():
+        started = asyncio.Event()
+
+        async def process(event):
+            started.set()
+            await asyncio.sleep(60)
+
+        dispatcher = LaneDispatcher(process, key=lambda event: event, lanes=1)
+        await dispatcher.start()
+        batch = dispatcher.submit_batch(["slow"])
+        await started.wait()
+        lane = dispatcher.lanes[0].task
+        await dispatcher.stop(timeout=0.05)
+
+        assert lane.cancelled()
+        assert await batch == [False]
+
+    asyncio.run(scenario())
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import date, timedelta
+from services.plms_service import PLMSService
+
+PHONE = "6281234567890"
+
+class PagedHistory:
+    """transaction_history_page over a fixed history, recording the windows asked for"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.requests = []
+
+    async def __call__(self, phone_number, startDate, endDate, page=1, listItem=20):
+        self.requests.append((startDate, page))
+        first_day = f"{startDate[:4]}-{startDate[4:6]}-{startDate[6:8]}"
+        window = [row for row in self.rows if row["transaction_date"] >= first_day]
+        return {
+            "response_code": "00",
+            "history": window[(page - 1) * listItem:page * listItem],
+            "total_page": -(-len(window) // listItem),
+        }
+
+def history(count, today=date(2026, 10, 18)):
+    return [
+        {
+            "transaction_date": f"{(today - timedelta(days=n * 14 // count)).isoformat()} 10:{n % 60:02d}:00",
+            "transaction_place": "Alfamidi",
+            "point": n,
+            "status": "award",
+        }
+        for n in range(count)
+    ]
+
+def serve(service, start="20261004", end="20261018"):
+    async def collect():
+        return [row async for row in service.transaction_history_rows(PHONE, start, end)]
+    return asyncio.run(collect())
+
+def make_service(monkeypatch, rows, max_pages):
+    monkeypatch.setenv("PLMS_HISTORY_PAGE_SIZE", "10")
+    monkeypatch.setenv("PLMS_HISTORY_MAX_PAGES", str(max_pages))
+    service = PLMSService()
+    pages = PagedHistory(rows)
+    service.transaction_history_page = pages
+    return service, pages
+
+def test_repeat_requests_fetch_only_the_delta(monkeypatch):
+    service, pages = make_service(monkeypatch, history(25), max_pages=5)
+
+    assert [row["point"] for row in serve(service)] == list(range(25))
+    pages.requests.clear()
+    assert [row["point"] for row in serve(service, start="20261005")] == [
+        row["point"] for row in history(25) if row["transaction_date"] >= "2026-10-05"]
+
+    assert pages.requests == [("20261018", 1)]
+    assert service.history_cache.stats()["delta_fetches"] == 1
+
+def test_a_capped_fetch_is_never_served_as_complete(monkeypatch):
+    service, pages = make_service(monkeypatch, history(45), max_pages=2)
+
+    assert len(serve(service)) == 20
+    assert service.history_cache.stats()["truncated_fetches"] == 1
+
+    # The next request refetches the whole window instead of merging onto the first 20 rows
+    pages.requests.clear()
+    assert [row["point"] for row in serve(service)] == list(range(20))
+    assert pages.requests == [("20261004", 1), ("20261004", 2)]
+    stats = service.history_cache.stats()
+    assert (stats["full_fetches"], stats["delta_fetches"], stats["rows_saved"]) == (2, 0, 0)
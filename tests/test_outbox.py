@@ -0,0 +1,163 @@
+import asyncio
+import time
+import httpx
+from services.outbox_service import Outbox, OutboxRecord, PermanentDeliveryError, SQLiteOutboxStore, is_permanent_failure
+
+def record(recipient, body="{}", due=0.0):
+    return OutboxRecord(endpoint="https://graph.example/messages", recipient=recipient, body=body,
+                        next_attempt_at=due, created_at=time.time())
+
+def with_store(tmp_path, scenario):
+    async def run():
+        store = SQLiteOutboxStore(str(tmp_path / "outbox.db"))
+        await store.open()
+        try:
+            await scenario(store)
+        finally:
+            await store.close()
+    asyncio.run(run())
+
+def make_outbox(tmp_path, monkeypatch, deliver, **settings):
+    monkeypatch.delenv("OUTBOX_REDIS_URL", raising=False)
+    monkeypatch.setenv("OUTBOX_SQLITE_PATH", str(tmp_path / "outbox.db"))
+    monkeypatch.setenv("OUTBOX_BACKOFF", "0")
+    for name, value in settings.items():
+        monkeypatch.setenv(f"OUTBOX_{name.upper()}", str(value))
+    return Outbox(deliver)
+
+async def eventually(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+def test_a_claim_holds_a_record_until_its_lease_expires(tmp_path):
+    async def scenario(store):
+        await store.add_many([record("6281111111111")])
+        now = time.time()
+
+        claimed = await store.claim(now, limit=10, lease=30)
+        assert [r.recipient for r in claimed] == ["6281111111111"]
+        assert await store.claim(now + 29, limit=10, lease=30) == []
+        assert [r.id for r in await store.claim(now + 31, limit=10, lease=30)] == [claimed[0].id]
+
+    with_store(tmp_path, scenario)
+
+def test_only_the_oldest_record_of_a_recipient_is_claimed(tmp_path):
+    async def scenario(store):
+        first, second, other = record("6281111111111", "1"), record("6281111111111", "2"), record("6282222222222", "3")
+        await store.add_many([first, second, other])
+        now = time.time()
+
+        assert [r.body for r in await store.claim(now, limit=10, lease=30)] == ["1", "3"]
+        await store.mark_sent(other)
+        # A retry that is not due yet still holds back the records behind it
+        first.attempts, first.next_attempt_at = 1, now + 60
+        await store.reschedule(first)
+        assert await store.claim(now + 31, limit=10, lease=30) == []
+        assert await store.next_due_at() == now + 60
+
+        await store.mark_sent(first)
+        assert [r.body for r in await store.claim(now + 31, limit=10, lease=30)] == ["2"]
+
+    with_store(tmp_path, scenario)
+
+def test_messages_are_delivered_in_order_per_recipient(tmp_path, monkeypatch):
+    async def scenario():
+        delivered = []
+        failed_once = set()
+
+        async def deliver(r):
+            # Every message fails once, so order depends on held-back retries
+            if r.body not in failed_once:
+                failed_once.add(r.body)
+                raise httpx.ConnectError("refused")
+            delivered.append((r.recipient, int(r.body)))
+
+        outbox = make_outbox(tmp_path, monkeypatch, deliver)
+        await outbox.start()
+        try:
+            await asyncio.gather(*(outbox.enqueue("https://graph.example/messages", f"62811{n % 2}", str(n).encode()) for n in range(10)))
+            await eventually(lambda: len(delivered) == 10)
+        finally:
+            await outbox.stop()
+
+        for recipient in ("628110", "628111"):
+            bodies = [n for to, n in delivered if to == recipient]
+            assert bodies == sorted(bodies)
+        assert outbox.retried == 10
+        assert outbox.delivered == 10
+
+    asyncio.run(scenario())
+
+def test_failures_are_dead_lettered_and_can_be_replayed(tmp_path, monkeypatch):
+    async def scenario():
+        attempts = []
+        healthy = False
+
+        async def deliver(r):
+            attempts.append(r.body)
+            if healthy:
+                return
+            if r.body == "rejected":
+                raise PermanentDeliveryError("400 invalid recipient")
+            raise httpx.ConnectError("refused")
+
+        outbox = make_outbox(tmp_path, monkeypatch, deliver, max_attempts=3)
+        await outbox.start()
+        try:
+            await outbox.enqueue("https://graph.example/messages", "6281111111111", b"rejected")
+            await outbox.enqueue("https://graph.example/messages", "6282222222222", b"unreachable")
+            await eventually(lambda: outbox.dead_lettered == 2)
+
+            assert attempts.count("rejected") == 1
+            assert attempts.count("unreachable") == 3
+            dead = {letter["body"]: letter for letter in await outbox.list_dead_letters()}
+            assert dead["rejected"]["last_error"] == "400 invalid recipient"
+            assert dead["unreachable"]["attempts"] == 3
+
+            healthy = True
+            replayed = await outbox.replay(dead["unreachable"]["id"])
+            assert replayed["attempts"] == 0
+            await eventually(lambda: outbox.delivered == 1)
+            assert await outbox.replay(dead["unreachable"]["id"]) is None
+            assert (await outbox.stats())["pending"] == 0
+            assert (await outbox.stats())["dead_letters"] == 1
+        finally:
+            await outbox.stop()
+
+    asyncio.run(scenario())
+
+def test_stop_persists_messages_enqueued_while_stopping(tmp_path, monkeypatch):
+    async def scenario():
+        async def deliver(r):
+            raise httpx.ConnectError("refused")
+
+        outbox = make_outbox(tmp_path, monkeypatch, deliver, flush_interval=60, backoff=60)
+        await outbox.start()
+        enqueued = [asyncio.ensure_future(outbox.enqueue("https://graph.example/messages", "6281111111111", b"1"))]
+        await asyncio.sleep(0)
+        stopping = asyncio.ensure_future(outbox.stop())
+        enqueued.append(asyncio.ensure_future(outbox.enqueue("https://graph.example/messages", "6281111111111", b"2")))
+        await asyncio.wait_for(asyncio.gather(stopping, *enqueued), timeout=5)
+
+        store = SQLiteOutboxStore(str(tmp_path / "outbox.db"))
+        await store.open()
+        try:
+            assert (await store.counts())["pending"] == 2
+        finally:
+            await store.close()
+
+    asyncio.run(scenario())
+
+def test_throttling_is_retried_and_other_client_errors_are_not():
+    def response(status, code=None):
+        return httpx.Response(status, json={"error": {"code": code}} if code else {})
+
+    assert is_permanent_failure(response(400, 100))
+    assert is_permanent_failure(response(404))
+    assert not is_permanent_failure(response(400, 131056))
+    assert not is_permanent_failure(response(400, 130429))
+    assert not is_permanent_failure(response(429))
+    assert not is_permanent_failure(response(408))
+    assert not is_permanent_failure(response(500))
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import date, timedelta
+from core.prefetch import PrefetchEngine
+from handlers.plms_handler import PLMSHandler
+from services.whatsapp_service import WhatsAppService
+
+class RecordingWhatsApp:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, to, message, durable=False):
+        self.sent.append(("text", message))
+
+    async def send_message_with_button(self, to, message, buttons, durable=False):
+        self.sent.append(("button", message))
+
+class StaticHistory:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def transaction_history(self, phone_number, startDate, endDate, **kwargs):
+        yield {"response_code": "00", "history": self.rows}
+
+    async def transaction_history_rows(self, phone_number, startDate, endDate):
+        for row in self.rows:
+            yield row
+
+def history(count):
+    today = date(2026, 10, 18)
+    return [
+        {
+            "transaction_date": f"{(today - timedelta(days=n % 14)).isoformat()} 10:00:00",
+            "transaction_place": f"Alfamidi Cabang {n % 7 + 1}",
+            "point": 10 + n,
+            "status": "award",
+        }
+        for n in range(count)
+    ]
+
+def summarize(rows):
+    whatsapp = RecordingWhatsApp()
+    handler = PLMSHandler(whatsapp, StaticHistory(rows), prefetch=PrefetchEngine(enabled=False))
+    asyncio.run(handler.transaction_history_summary("6281234567890"))
+    return whatsapp.sent
+
+def test_every_row_is_sent_around_the_footer_boundary():
+    # Somewhere in this range the footer no longer fits the pending chunk
+    for count in range(60, 100):
+        sent = summarize(history(count))
+        body = "".join(message for _, message in sent)
+
+        assert [kind for kind, _ in sent][-1] == "button"
+        assert all(kind == "text" for kind, _ in sent[:-1])
+        assert body.count("Tgl ") == count
+        for row in history(count):
+            assert f"mendapatkan {row['point']} poin" in body
+        assert len(sent[-1][1]) <= WhatsAppService.INTERACTIVE_BODY_LIMIT
+        assert all(len(message) <= WhatsAppService.TEXT_BODY_LIMIT for _, message in sent)
+
+def test_empty_history():
+    assert summarize([]) == [("text", "Belum ada transaksi poin dalam 2 minggu terakhir.")]
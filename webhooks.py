@@ -1,6 +1,9 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from controllers.webhook_controller import router as webhook_router
+from controllers.webhook_controller import router as webhook_router, on_startup, on_shutdown
+from controllers.admin_controller import router as admin_router
+from core.metrics import MetricsMiddleware
 from dotenv import load_dotenv
 import os
 
@@ -10,12 +13,22 @@ load_dotenv()  # Load env variables from .env
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", 3006))
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await on_startup()
+    yield
+    await on_shutdown()
+
 app = FastAPI(
     title="WhatsApp Webhook Service",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(webhook_router)
+app.include_router(admin_router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host=HOST, port=PORT, reload=True)
\ No newline at end of file